@@ -1,6 +1,127 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-from .models import Accessory, Activity, Athlete, Gear, Tag
+from .models import Accessory, Activity, ActivityRollup, Athlete, Gear, ImportRun, Job, SyncState, Tag
 
 
-admin.site.register([Activity, Athlete, Gear, Tag, Accessory])
+@admin.register(Activity)
+class ActivityAdmin(admin.ModelAdmin):
+
+    list_display = ('name', 'start', 'type', 'distance', 'moving_time', 'gear_names', 'athlete_names', 'tag_names')
+    list_filter = ('type', 'gear', 'race', 'commute')
+    date_hierarchy = 'start'
+    search_fields = ('name',)
+    filter_horizontal = ('gear', 'athletes', 'tags')
+    list_per_page = 50
+    # Counting all activities for every changelist page is not needed
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('gear', 'athletes', 'tags')
+
+    def gear_names(self, obj):
+        return ', '.join(gear.name for gear in obj.gear.all())
+    gear_names.short_description = 'gear'
+
+    def athlete_names(self, obj):
+        return ', '.join(athlete.name for athlete in obj.athletes.all())
+    athlete_names.short_description = 'athletes'
+
+    def tag_names(self, obj):
+        return ', '.join(tag.name for tag in obj.tags.all())
+    tag_names.short_description = 'tags'
+
+
+@admin.register(Athlete)
+class AthleteAdmin(admin.ModelAdmin):
+
+    list_display = ('name', 'created_at')
+    search_fields = ('name',)
+
+
+@admin.register(Gear)
+class GearAdmin(admin.ModelAdmin):
+
+    list_display = ('name', 'type', 'strava_id', 'total_distance', 'activity_count', 'last_used', 'should_be_retired')
+    list_filter = ('type',)
+    search_fields = ('name', 'strava_id')
+    readonly_fields = ('total_distance', 'total_moving_time', 'activity_count', 'first_used', 'last_used')
+
+    def should_be_retired(self, obj):
+        return obj.should_be_retired
+    should_be_retired.boolean = True
+
+
+@admin.register(Accessory)
+class AccessoryAdmin(admin.ModelAdmin):
+
+    list_display = ('name', 'gear', 'is_active', 'total_distance', 'activity_count', 'last_used', 'should_be_retired')
+    list_filter = ('is_active', 'gear')
+    list_select_related = ('gear',)
+    search_fields = ('name',)
+    raw_id_fields = ('activities',)
+    readonly_fields = ('total_distance', 'total_moving_time', 'activity_count', 'first_used', 'last_used')
+
+    def should_be_retired(self, obj):
+        return obj.should_be_retired
+    should_be_retired.boolean = True
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+
+    list_display = ('name', 'created_at')
+    search_fields = ('name',)
+
+
+@admin.register(SyncState)
+class SyncStateAdmin(admin.ModelAdmin):
+
+    list_display = ('name', 'cursor', 'page', 'completed_at')
+
+
+@admin.register(ActivityRollup)
+class ActivityRollupAdmin(admin.ModelAdmin):
+
+    list_display = ('period', 'period_start', 'type', 'gear', 'distance', 'moving_time', 'count')
+    list_filter = ('period', 'type', 'gear')
+    list_select_related = ('gear',)
+    show_full_result_count = False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+
+    list_display = ('__str__', 'state', 'progress', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('kind', 'state')
+    readonly_fields = ('state', 'key', 'arguments', 'started_at', 'finished_at', 'progress', 'message', 'worker')
+
+    def get_fields(self, request, obj=None):
+        return ('kind', 'run_after') if obj is None else super().get_fields(request, obj)
+
+    def get_readonly_fields(self, request, obj=None):
+        return self.readonly_fields + ('kind', 'run_after') if obj else ()
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            super().save_model(request, obj, form, change)
+            return
+        # Job handlers import all import commands, admin is loaded on startup of every management command
+        from utils.jobs import enqueue_job
+
+        job, created = enqueue_job(obj.kind, run_after=obj.run_after)
+        if not created:
+            messages.warning(request, f'{job} is already queued or running, no new job was created.')
+        # Admin redirects to the created or deduplicated job
+        obj.pk = job.pk
+
+
+@admin.register(ImportRun)
+class ImportRunAdmin(admin.ModelAdmin):
+
+    list_display = ('name', 'started_at', 'succeeded', 'wall_time', 'query_count', 'query_time', 'api_call_count',
+                    'api_time', 'short_rate_limit_headroom')
+    list_filter = ('name', 'succeeded')
+    date_hierarchy = 'started_at'
+    readonly_fields = ('name', 'succeeded', 'started_at', 'finished_at', 'wall_time', 'query_count', 'query_time',
+                       'api_call_count', 'api_time', 'short_rate_limit_headroom', 'long_rate_limit_headroom',
+                       'metrics')
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ActivitiesConfig(AppConfig):
     name = 'activities'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,222 @@
+import io
+import json
+import os
+import platform
+import tempfile
+from contextlib import redirect_stdout
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from activities.models import Activity, Gear, SyncState
+from utils.metrics import ImportMetrics
+from utils.models.activities import STRAVA_ACTIVITY_TYPE_TO_GEAR_TYPE, GearCache, bulk_create_activities
+from utils.models.ledger import reconcile_ledgers
+from utils.models.rollups import rebuild_rollups
+from utils.models.training_load import recompute_training_load
+from utils.stravalib.fake import FakeStravaClient, generate_strava_activities
+
+from .utils import import_strava_activities
+
+
+DEFAULT_SIZES = (1000, 10000)
+PAGE_SIZE = 200
+API_PAGES = 20
+THROUGHPUT_BENCHMARKS = ('import', 'duplicate_detection')
+DEFAULT_MAX_REGRESSION = 0.2
+MIN_COMPARED_TIME = 0.1
+
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+def measure(name, func):
+    with ImportMetrics() as metrics, metrics.phase(name):
+        func()
+    phase = metrics.phases[name]
+    return {
+        'time': phase['wall_time'],
+        'queries': phase['query_count'],
+        'query_time': phase['query_time'],
+    }
+
+
+def _import(client):
+    sync_state, _ = SyncState.objects.get_or_create(name='benchmark')
+    with redirect_stdout(io.StringIO()):
+        import_strava_activities(client, client.get_activities(), sync_state, PAGE_SIZE, min)
+
+
+def _attach_gear(client, strava_activities):
+    Activity.gear.through.objects.all().delete()
+    gear_by_strava_id, _ = GearCache().get_many(
+        {
+            strava_activity.gear_id: STRAVA_ACTIVITY_TYPE_TO_GEAR_TYPE.get(strava_activity.type, Gear.TYPE.OTHER)
+            for strava_activity in strava_activities if strava_activity.gear_id
+        },
+        client
+    )
+    bulk_create_activities([], {
+        strava_activity.id: [gear_by_strava_id[strava_activity.gear_id]]
+        for strava_activity in strava_activities if strava_activity.gear_id
+    })
+
+
+def _request_activity_list():
+    client = Client()
+    url = reverse('activity_list')
+    for _ in range(API_PAGES):
+        url = client.get(url, {'limit': 200} if '?' not in url else None).json()['next']
+        if not url:
+            break
+
+
+def _request_stats():
+    client = Client()
+    for period in ('week', 'month', 'year'):
+        client.get(reverse('stats'), {'period': period})
+
+
+def run_benchmarks(size):
+    """
+    Runs all benchmarks on size generated activities, database must be empty. Time is frozen at the day after
+    the last generated activity, otherwise training load would be computed until the date of the run and its
+    time and queries would grow with every day.
+    """
+    strava_activities = generate_strava_activities(size)
+    with patch('django.utils.timezone.now', return_value=strava_activities[-1].start_date + timedelta(days=1)):
+        return _run_benchmarks(size, strava_activities)
+
+
+def _run_benchmarks(size, strava_activities):
+    client = FakeStravaClient(strava_activities)
+    # Duplicate detection imports the same activities again, all of them already exist
+    benchmarks = [
+        ('import', lambda: _import(client)),
+        ('duplicate_detection', lambda: _import(client)),
+        ('gear_attachment', lambda: _attach_gear(client, strava_activities)),
+        ('rebuild_rollups', rebuild_rollups),
+        ('recompute_training_load', recompute_training_load),
+        ('reconcile_ledgers', lambda: reconcile_ledgers(fix=False)),
+        ('activity_list_api', _request_activity_list),
+        ('stats_api', _request_stats),
+    ]
+    results = {}
+    for name, func in benchmarks:
+        results[name] = measure(name, func)
+        if name in THROUGHPUT_BENCHMARKS:
+            results[name]['activities_per_second'] = size / results[name]['time']
+    return results
+
+
+def get_baseline_path(vendor):
+    # Baselines are committed, timings of different database backends are not comparable
+    return os.path.join(settings.BASE_DIR, 'benchmarks', f'baseline-{vendor}.json')
+
+
+def compare_results(results, baseline):
+    """
+    Returns list of (size, benchmark, time change, baseline queries, queries) for benchmarks present in both
+    results. Time of benchmarks faster than MIN_COMPARED_TIME in the baseline is mostly noise, it is not compared.
+    """
+    changes = []
+    for size, benchmarks in results['results'].items():
+        for name, result in benchmarks.items():
+            baseline_result = baseline['results'].get(size, {}).get(name)
+            if baseline_result:
+                time_change = (
+                    (result['time'] - baseline_result['time']) / baseline_result['time']
+                    if baseline_result['time'] >= MIN_COMPARED_TIME else None
+                )
+                changes.append((size, name, time_change, baseline_result['queries'], result['queries']))
+    return changes
+
+
+class Command(BaseCommand):
+
+    help = 'Benchmarks import and aggregation of generated activities on a throwaway test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                            help='Numbers of generated activities, for example 1000 10000 100000.')
+        parser.add_argument('--output', default=None, help='Path of the JSON file to write the results to.')
+        parser.add_argument('--compare', action='store_true', default=False,
+                            help='Compare the results with the baseline and fail when a benchmark regressed.')
+        parser.add_argument('--baseline', default=None,
+                            help='Path of the baseline JSON, benchmarks/baseline-<backend>.json by default.')
+        parser.add_argument('--save-baseline', action='store_true', default=False,
+                            help='Store the results as the new baseline.')
+        parser.add_argument('--max-regression', type=float, default=DEFAULT_MAX_REGRESSION,
+                            help=f'Allowed slowdown against the baseline, {DEFAULT_MAX_REGRESSION} by default.')
+
+    def handle(self, **options):
+        baseline_path = options['baseline'] or get_baseline_path(connection.vendor)
+        baseline = None
+        if options['compare']:
+            if not os.path.exists(baseline_path):
+                raise CommandError(f'Baseline {baseline_path} does not exist, create it with --save-baseline.')
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+
+        results = {
+            'backend': connection.vendor,
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'results': {},
+        }
+        old_name = connection.settings_dict['NAME']
+        with tempfile.TemporaryDirectory() as tmp_directory, override_settings(
+                CACHES=BENCHMARK_CACHES, ALLOWED_HOSTS=['testserver']):
+            if connection.vendor == 'sqlite':
+                # In-memory database would hide the cost of writes
+                connection.settings_dict['TEST']['NAME'] = os.path.join(tmp_directory, 'benchmark.sqlite3')
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                for size in options['sizes']:
+                    print(f'Benchmarking {size} activities.')
+                    call_command('flush', interactive=False, verbosity=0)
+                    results['results'][str(size)] = run_benchmarks(size)
+                    for name, result in results['results'][str(size)].items():
+                        print(f'  {name}: {result["time"]:.3f}s, {result["queries"]} queries')
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for path in (options['output'], baseline_path if options['save_baseline'] else None):
+            if path:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                with open(path, 'w') as f:
+                    json.dump(results, f, indent=2)
+                    f.write('\n')
+
+        if baseline:
+            if baseline['backend'] != results['backend']:
+                raise CommandError(f'Baseline was measured on {baseline["backend"]}, results are not comparable.')
+            changes = compare_results(results, baseline)
+            if not changes:
+                raise CommandError(f'Baseline {baseline_path} contains none of the measured sizes.')
+            max_regression = options['max_regression']
+            regressions = []
+            for size, name, time_change, baseline_queries, queries in changes:
+                # Number of queries is deterministic, any increase is a regression
+                regressed = queries > baseline_queries or time_change is not None and time_change > max_regression
+                print(
+                    f'{name} ({size} activities): '
+                    f'{f"{time_change:+.0%}" if time_change is not None else "time not compared"}, '
+                    f'{baseline_queries} -> {queries} queries{" REGRESSION" if regressed else ""}'
+                )
+                if regressed:
+                    regressions.append(name)
+            if regressions:
+                raise CommandError(f'{len(regressions)} benchmarks regressed by more than {max_regression:.0%}.')
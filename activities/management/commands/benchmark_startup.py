@@ -0,0 +1,88 @@
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+DEFAULT_COMMAND = 'import_new_activities'
+DEFAULT_RUNS = 5
+
+# Modules which should not be loaded by a command with nothing to do
+HEAVY_MODULES = ('numpy', 'pyarrow', 'stravalib', 'requests')
+
+# Loads Django and the command module like manage.py does without running the command
+SETUP_SCRIPT = '''
+import json, sys, django
+django.setup()
+from django.core.management import load_command_class
+load_command_class('activities', {command!r})
+print(json.dumps([module for module in {modules!r} if module in sys.modules]))
+'''
+
+
+def run_process(args):
+    """
+    Runs process in the project directory and returns its wall time, CPU time (user and system) and output.
+    """
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    process = subprocess.run(args, cwd=settings.BASE_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+    wall_time = time.perf_counter() - start
+    usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if process.returncode:
+        raise CommandError(f'{" ".join(args)} failed:\n{process.stderr}')
+    cpu_time = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    return wall_time, cpu_time, process.stdout
+
+
+class Command(BaseCommand):
+
+    help = 'Measures cold start latency of a management command run in fresh Python processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--command', default=DEFAULT_COMMAND, help='Measured management command.')
+        parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help='Number of measured runs.')
+        parser.add_argument('--setup-only', action='store_true', default=False,
+                            help='Only load Django and the command module, without running the command and calling '
+                                 'Strava. Heavy modules loaded on startup are reported.')
+        parser.add_argument('--output', default=None, help='Path of the JSON file to write the results to.')
+
+    def handle(self, **options):
+        if options['setup_only']:
+            args = [sys.executable, '-c', SETUP_SCRIPT.format(command=options['command'], modules=HEAVY_MODULES)]
+        else:
+            args = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), options['command']]
+
+        wall_times = []
+        cpu_times = []
+        for _ in range(options['runs']):
+            wall_time, cpu_time, output = run_process(args)
+            wall_times.append(wall_time)
+            cpu_times.append(cpu_time)
+
+        results = {
+            'command': options['command'],
+            'setup_only': options['setup_only'],
+            'runs': options['runs'],
+            'wall_time_min': min(wall_times),
+            'wall_time_median': statistics.median(wall_times),
+            'cpu_time_min': min(cpu_times),
+            'cpu_time_median': statistics.median(cpu_times),
+        }
+        if options['setup_only']:
+            results['heavy_modules'] = json.loads(output.strip().splitlines()[-1])
+
+        print(f'{options["command"]}: median {results["wall_time_median"] * 1000:.0f} ms wall, '
+              f'{results["cpu_time_median"] * 1000:.0f} ms CPU in {options["runs"]} runs.')
+        if options['setup_only']:
+            print(f'Heavy modules loaded on startup: {", ".join(results["heavy_modules"]) or "none"}.')
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
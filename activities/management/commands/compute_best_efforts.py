@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from activities.models import Activity, ActivityStream, BestEffortRecord
+from utils.streams.efforts import compute_best_efforts
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recompute', action='store_true', default=False,
+                            help='Compute best efforts and all-time records of all activities again.')
+
+    def handle(self, **options):
+        if options['recompute']:
+            BestEffortRecord.objects.all().delete()
+            Activity.objects.update(best_efforts_computed=False)
+        activities = Activity.objects.filter(
+            best_efforts_computed=False, streams__type=ActivityStream.TYPE.TIME
+        ).order_by('start')
+        activities_count = 0
+        for activity in activities.iterator():
+            compute_best_efforts(activity)
+            activities_count += 1
+        print(f'Computed best efforts of {activities_count} activities.')
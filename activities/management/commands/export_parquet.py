@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from utils.parquet import DEFAULT_CHUNK_SIZE, export_parquet
+
+
+class Command(BaseCommand):
+
+    help = 'Exports activities to Parquet dataset partitioned by year and activity type.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory of the dataset, partitions are updated in place.')
+        parser.add_argument('--full', action='store_true', default=False,
+                            help='Rewrite all partitions regardless of the last export watermark.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Number of rows read from the database and written as one row group.')
+
+    def handle(self, **options):
+        partitions = export_parquet(options['directory'], options['full'], options['chunk_size'])
+        print(f'Successfully exported {len(partitions)} changed partitions.')
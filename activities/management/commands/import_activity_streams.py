@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from stravalib.exc import ObjectNotFound
+
+from activities.models import Activity
+from utils.stravalib.concurrent import DEFAULT_MAX_WORKERS, ConcurrentStravaClient
+from utils.stravalib.limiter import RateLimitExhausted
+from utils.models.training_load import recompute_training_load_for_starts
+from utils.streams.efforts import compute_best_efforts
+from utils.streams.store import STRAVA_STREAM_TYPE_TO_STREAM_TYPE, save_strava_streams
+
+from .utils import chunked
+
+
+def import_activity_streams(limit=None, max_workers=DEFAULT_MAX_WORKERS, progress=None):
+    activities = Activity.objects.filter(strava_id__isnull=False, streams__isnull=True).order_by('-start')
+    if limit:
+        activities = activities[:limit]
+    strava_types = list(STRAVA_STREAM_TYPE_TO_STREAM_TYPE)
+    imported_starts = []
+    try:
+        with ConcurrentStravaClient(max_workers=max_workers) as client:
+            for activities_chunk in chunked(activities.iterator(), max_workers * 4):
+                futures = [
+                    client.submit('get_activity_streams', activity.strava_id, types=strava_types, series_type='time')
+                    for activity in activities_chunk
+                ]
+                for activity, future in zip(activities_chunk, futures):
+                    try:
+                        strava_streams = future.result()
+                    except ObjectNotFound:
+                        # Manual activities do not have streams
+                        strava_streams = None
+                    save_strava_streams(activity, strava_streams or {})
+                    compute_best_efforts(activity)
+                    imported_starts.append(activity.start)
+                if progress:
+                    progress(len(imported_starts), f'Imported streams of {len(imported_starts)} activities.')
+    finally:
+        # Heart rate streams change training load of the activities
+        recompute_training_load_for_starts(imported_starts)
+    print(f'Successfully imported streams of {len(imported_starts)} activities.')
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Maximal number of activities to import streams for, the newest go first.')
+        parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                            help='Maximal number of concurrent Strava requests.')
+
+    def handle(self, **options):
+        try:
+            import_activity_streams(limit=options['limit'], max_workers=options['workers'])
+        except RateLimitExhausted as e:
+            raise CommandError(f'{e}. Run the import again later to continue.')
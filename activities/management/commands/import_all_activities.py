@@ -1,27 +1,47 @@
-from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
 
-from activities.models import Activity
-from django.core.management.base import BaseCommand
-from utils.models.activities import create_activity_from_strava, create_and_add_gear_to_activity_if_needed
-from utils.stravalib import create_strava_client
+from activities.models import SyncState
+from utils.metrics import ImportMetrics
+from utils.stravalib.concurrent import DEFAULT_MAX_WORKERS, ConcurrentStravaClient
+from utils.stravalib.limiter import RateLimitExhausted
 
+from .utils import import_strava_activities
 
-def import_all_activities():
-    client = create_strava_client()
-    activities_count = 0
-    new_gear_count = 0
-    for activity in client.get_activities(before=datetime.now()):
-        if not Activity.objects.filter(start=activity.start_date).exists():
-            if create_activity_from_strava(activity):
-                activities_count += 1
-            if create_and_add_gear_to_activity_if_needed(activity, client):
-                new_gear_count += 1
 
-    print(f'Successfully imported {activities_count} activities.')
-    print(f'Created {new_gear_count} new gear.')
+SYNC_STATE_NAME = 'import-all-activities'
+DEFAULT_PAGE_SIZE = 200
+
+
+def import_all_activities(page_size=DEFAULT_PAGE_SIZE, max_workers=DEFAULT_MAX_WORKERS, progress=None):
+    sync_state, _ = SyncState.objects.get_or_create(name=SYNC_STATE_NAME)
+    if sync_state.cursor:
+        print(f'Resuming import of activities before {sync_state.cursor}, {sync_state.page} pages already imported.')
+    with ImportMetrics(SYNC_STATE_NAME) as metrics, \
+            ConcurrentStravaClient(max_workers=max_workers, metrics=metrics) as client:
+        # Strava returns activities from the newest one when "before" is used, the cursor is the oldest start
+        import_strava_activities(
+            client,
+            client.get_activities(before=sync_state.cursor or timezone.now()),
+            sync_state,
+            page_size,
+            min,
+            progress,
+            metrics,
+        )
+    sync_state.complete()
 
 
 class Command(BaseCommand):
 
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                            help='Number of activities written to the database in one transaction.')
+        parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                            help='Maximal number of concurrent Strava requests.')
+
     def handle(self, **options):
-        import_all_activities()
+        try:
+            import_all_activities(page_size=options['page_size'], max_workers=options['workers'])
+        except RateLimitExhausted as e:
+            raise CommandError(f'{e}. Run the import again later to resume from the last checkpoint.')
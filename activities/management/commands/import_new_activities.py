@@ -1,25 +1,60 @@
-from django.core.management.base import BaseCommand
-from django.utils.timezone import localtime
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
 
-from activities.models import Activity
-from utils.models.activities import create_activity_from_strava, create_and_add_gear_to_activity_if_needed
+from activities.models import Activity, SyncState
 from utils.stravalib import create_strava_client
+from utils.stravalib.limiter import RateLimitExhausted
 
 
-def import_new_activities():
-    client = create_strava_client()
-    activities_count = 0
-    new_gear_count = 0
-    for activity in client.get_activities(after=localtime(Activity.objects.first().start)):
-        if create_activity_from_strava(activity):
-            activities_count += 1
-        if create_and_add_gear_to_activity_if_needed(activity, client):
-            new_gear_count += 1
-    print(f'Successfully imported {activities_count} activities.')
-    print(f'Created {new_gear_count} new gear.')
+SYNC_STATE_NAME = 'import-new-activities'
+PAGE_SIZE = 200
+
+
+def has_new_activities(after):
+    # One summary is fetched with a plain client before the import machinery (thread pool, gear cache, metrics
+    # and the NumPy based aggregates) is loaded, polling without new activities stays cheap
+    return next(iter(create_strava_client().get_activities(after=after, limit=1)), None) is not None
+
+
+def import_new_activities(progress=None):
+    sync_state, _ = SyncState.objects.get_or_create(name=SYNC_STATE_NAME)
+    after = sync_state.cursor or Activity.objects.aggregate(start=Max('start'))['start']
+    if after is None:
+        from .import_all_activities import import_all_activities
+
+        print('No activities imported yet, importing all activities.')
+        import_all_activities(progress=progress)
+        return
+    if not has_new_activities(after):
+        print('No new activities.')
+        return
+
+    from utils.metrics import ImportMetrics
+    from utils.stravalib.concurrent import ConcurrentStravaClient
+
+    from .utils import import_strava_activities
+
+    with ImportMetrics(SYNC_STATE_NAME) as metrics, ConcurrentStravaClient(metrics=metrics) as client:
+        # Strava returns activities from the oldest one when "after" is used, the cursor is the newest start
+        import_strava_activities(
+            client,
+            client.get_activities(after=after),
+            sync_state,
+            PAGE_SIZE,
+            max,
+            progress,
+            metrics,
+        )
+    sync_state.complete(cursor=sync_state.cursor or after)
 
 
 class Command(BaseCommand):
 
+    # System checks load URLs and all views, the command is run by cron every few minutes
+    requires_system_checks = False
+
     def handle(self, **options):
-        import_new_activities()
+        try:
+            import_new_activities()
+        except RateLimitExhausted as e:
+            raise CommandError(f'{e}. Run the import again later to resume from the last checkpoint.')
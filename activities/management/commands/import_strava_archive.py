@@ -0,0 +1,158 @@
+import csv
+import io
+import zipfile
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import utc
+
+from activities.models import Activity, Gear
+from utils.cache import invalidate_activities_cache
+from utils.models.activities import (
+    STRAVA_ACTIVITY_TYPE_TO_ACTIVITY_TYPE, STRAVA_ACTIVITY_TYPE_TO_GEAR_TYPE, bulk_create_activities
+)
+from utils.models.rollups import refresh_rollups_for_activities
+from utils.models.training_load import recompute_training_load_for_starts
+
+from .utils import chunked
+
+
+ACTIVITIES_CSV_NAME = 'activities.csv'
+ARCHIVE_DATE_FORMAT = '%b %d, %Y, %I:%M:%S %p'
+DEFAULT_BATCH_SIZE = 1000
+
+
+# Archive uses display names of activity types, most of them differ from API types just by spaces
+ARCHIVE_ACTIVITY_TYPE_TO_STRAVA_ACTIVITY_TYPE = {
+    'Rock Climb': 'RockClimbing',
+}
+
+
+def _get_float(value):
+    return float(value) if value else None
+
+
+class ArchiveRowParser:
+    """
+    Maps rows of activities.csv to activity data. Newer archives contain some columns twice, the later ones
+    (e.g. distance in meters and elapsed time in seconds) are used. Older archives contain distance in km only.
+    """
+
+    def __init__(self, header):
+        self.columns = {name: index for index, name in enumerate(header)}
+        self.distance_multiplier = 1 if header.count('Distance') > 1 else 1000
+
+    def get(self, row, column):
+        index = self.columns.get(column)
+        return row[index].strip() if index is not None and index < len(row) else ''
+
+    def get_activity_type(self, row):
+        archive_type = self.get(row, 'Activity Type')
+        strava_type = ARCHIVE_ACTIVITY_TYPE_TO_STRAVA_ACTIVITY_TYPE.get(archive_type, archive_type.replace(' ', ''))
+        return strava_type, STRAVA_ACTIVITY_TYPE_TO_ACTIVITY_TYPE.get(strava_type, Activity.TYPE.OTHER)
+
+    def parse(self, row):
+        distance = _get_float(self.get(row, 'Distance'))
+        distance = distance * self.distance_multiplier if distance is not None else None
+        moving_time = _get_float(self.get(row, 'Moving Time'))
+        average_speed = _get_float(self.get(row, 'Average Speed'))
+        if average_speed is None and distance is not None and moving_time:
+            average_speed = distance / moving_time
+        elevation_gain = _get_float(self.get(row, 'Elevation Gain'))
+        elapsed_time = _get_float(self.get(row, 'Elapsed Time'))
+        if elapsed_time is None:
+            raise ValueError('elapsed time is missing')
+        strava_type, activity_type = self.get_activity_type(row)
+        return Activity(
+            name=self.get(row, 'Activity Name'),
+            strava_id=int(self.get(row, 'Activity ID')),
+            distance=str(round(distance, 2)) if distance is not None else None,
+            average_speed=str(round(average_speed, 2)) if average_speed is not None else None,
+            start=datetime.strptime(self.get(row, 'Activity Date'), ARCHIVE_DATE_FORMAT).replace(tzinfo=utc),
+            moving_time=timedelta(seconds=moving_time) if moving_time is not None else None,
+            elapsed_time=timedelta(seconds=elapsed_time),
+            elevation_gain=round(elevation_gain) if elevation_gain is not None else None,
+            type=activity_type,
+            commute=self.get(row, 'Commute').lower() == 'true',
+        ), strava_type, self.get(row, 'Activity Gear')
+
+
+class GearByName:
+    """
+    Archive contains only names of gear. Gear created from the archive has no Strava ID, it gets the ID when
+    the API import fetches gear of the same name (see get_or_create_gear_from_strava).
+    """
+
+    def __init__(self):
+        self.gear = {gear.name: gear for gear in Gear.objects.all()}
+        self.created_count = 0
+
+    def get(self, name, strava_type):
+        if name not in self.gear:
+            self.gear[name] = Gear.objects.create(
+                name=name, type=STRAVA_ACTIVITY_TYPE_TO_GEAR_TYPE.get(strava_type, Gear.TYPE.OTHER)
+            )
+            self.created_count += 1
+        return self.gear[name]
+
+
+def read_archive_rows(archive):
+    """
+    Streams rows of activities.csv directly from the zip archive without extracting it. Invalid rows are reported
+    and skipped.
+    """
+    try:
+        csv_file = archive.open(ACTIVITIES_CSV_NAME)
+    except KeyError:
+        raise CommandError(f'Archive does not contain {ACTIVITIES_CSV_NAME}.')
+    with io.TextIOWrapper(csv_file, encoding='utf-8', newline='') as csv_text:
+        reader = csv.reader(csv_text)
+        parser = ArchiveRowParser(next(reader))
+        for row in reader:
+            if not row:
+                continue
+            try:
+                yield parser.parse(row)
+            except ValueError as e:
+                print(f'Skipping line {reader.line_num} of {ACTIVITIES_CSV_NAME}: {e}')
+
+
+def import_strava_archive(path, batch_size=DEFAULT_BATCH_SIZE):
+    gear_by_name = GearByName()
+    imported_starts = []
+    activities_count = 0
+    with zipfile.ZipFile(path) as archive:
+        for rows in chunked(read_archive_rows(archive), batch_size):
+            existing_strava_ids = set(Activity.objects.filter(
+                strava_id__in=[activity.strava_id for activity, _, _ in rows]
+            ).values_list('strava_id', flat=True))
+            activities = []
+            gear_by_activity_strava_id = {}
+            for activity, strava_type, gear_name in rows:
+                if activity.strava_id in existing_strava_ids:
+                    continue
+                existing_strava_ids.add(activity.strava_id)
+                activities.append(activity)
+                if gear_name:
+                    gear_by_activity_strava_id[activity.strava_id] = [gear_by_name.get(gear_name, strava_type)]
+            activities = bulk_create_activities(activities, gear_by_activity_strava_id)
+            refresh_rollups_for_activities(activities)
+            imported_starts.extend(activity.start for activity in activities)
+            activities_count += len(activities)
+
+    recompute_training_load_for_starts(imported_starts)
+    if activities_count:
+        invalidate_activities_cache()
+    print(f'Successfully imported {activities_count} activities.')
+    print(f'Created {gear_by_name.created_count} new gear.')
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the zip archive downloaded from Strava.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Number of activities written to the database in one transaction.')
+
+    def handle(self, **options):
+        import_strava_archive(options['path'], batch_size=options['batch_size'])
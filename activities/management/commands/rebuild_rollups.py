@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from activities.models import ActivityRollup
+from utils.models.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+
+    def handle(self, **options):
+        rebuild_rollups()
+        print(f'Successfully rebuilt {ActivityRollup.objects.count()} rollups.')
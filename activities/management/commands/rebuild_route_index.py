@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from activities.models import ActivityGeoCell
+from utils.models.routes import rebuild_route_index
+
+
+class Command(BaseCommand):
+
+    def handle(self, **options):
+        rebuild_route_index()
+        print(f'Successfully indexed {ActivityGeoCell.objects.count()} route cells.')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from activities.models import Activity
+from utils.models.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+
+    def handle(self, **options):
+        rebuild_search_index()
+        print(f'Successfully indexed {Activity.objects.count()} activities.')
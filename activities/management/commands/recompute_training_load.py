@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from utils.models.training_load import recompute_training_load
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default=None,
+                            help='Date (YYYY-MM-DD) to recompute the training load from, whole history by default.')
+
+    def handle(self, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if not since:
+                raise CommandError(f'Invalid date "{options["since"]}".')
+        recompute_training_load(since)
+        print('Successfully recomputed training load.')
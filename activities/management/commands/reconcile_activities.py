@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from utils.cache import invalidate_activities_cache
+from utils.models.activities import (
+    GearCache, bulk_create_activities_from_strava, bulk_update_activities_from_strava
+)
+from utils.models.rollups import refresh_rollups
+from utils.models.training_load import recompute_training_load_for_starts
+from utils.stravalib.concurrent import DEFAULT_MAX_WORKERS, ConcurrentStravaClient
+from utils.stravalib.limiter import RateLimitExhausted
+
+from .utils import chunked
+
+
+DEFAULT_DAYS = 90
+PAGE_SIZE = 200
+
+
+def reconcile_activities(days=DEFAULT_DAYS, max_workers=DEFAULT_MAX_WORKERS, progress=None):
+    """
+    Fetches summaries of activities started in the last days and updates the stored activities that changed
+    on Strava since they were imported. Activities missing in the database are created.
+    """
+    gear_cache = GearCache()
+    touched_starts = []
+    updated_count = 0
+    created_count = 0
+    with ConcurrentStravaClient(max_workers=max_workers) as client:
+        strava_activities = client.get_activities(after=timezone.now() - timedelta(days=days))
+        try:
+            for page, strava_activities_page in enumerate(client.prefetch(chunked(strava_activities, PAGE_SIZE)), 1):
+                with transaction.atomic():
+                    updated_activities, activity_keys = bulk_update_activities_from_strava(
+                        strava_activities_page, client, gear_cache
+                    )
+                    created_activities, _ = bulk_create_activities_from_strava(
+                        strava_activities_page, client, gear_cache
+                    )
+                    activity_keys.extend((activity.start, activity.type) for activity in created_activities)
+                    refresh_rollups(activity_keys)
+                touched_starts.extend(start for start, _ in activity_keys)
+                updated_count += len(updated_activities)
+                created_count += len(created_activities)
+                if activity_keys:
+                    invalidate_activities_cache()
+                if progress:
+                    progress(page, f'Updated {updated_count} and created {created_count} activities.')
+        finally:
+            recompute_training_load_for_starts(touched_starts)
+
+    print(f'Successfully updated {updated_count} activities.')
+    print(f'Created {created_count} missing activities.')
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=DEFAULT_DAYS,
+                            help=f'Number of days to reconcile activities for, {DEFAULT_DAYS} by default.')
+        parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                            help='Number of threads calling the Strava API.')
+
+    def handle(self, **options):
+        try:
+            reconcile_activities(options['days'], options['workers'])
+        except RateLimitExhausted as e:
+            raise CommandError(f'{e}. Run the reconciliation again later.')
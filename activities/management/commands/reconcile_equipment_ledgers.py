@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from utils.models.ledger import reconcile_ledgers
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help='Only report drifted ledgers without fixing them.')
+
+    def handle(self, **options):
+        drifted = reconcile_ledgers(fix=not options['dry_run'])
+        for equipment in drifted:
+            print(f'Drifted ledger of {equipment._meta.verbose_name} {equipment}.')
+        action = 'Found' if options['dry_run'] else 'Fixed'
+        print(f'{action} {len(drifted)} drifted ledgers.')
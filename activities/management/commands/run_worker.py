@@ -0,0 +1,47 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from utils.db import close_unusable_connection
+from utils.jobs import claim_job, requeue_running_jobs, run_job
+
+
+DEFAULT_WORKERS = 2
+DEFAULT_POLL_INTERVAL = 5
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                            help='Number of jobs processed concurrently.')
+        parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                            help='Seconds to wait when there is no job to run.')
+        parser.add_argument('--once', action='store_true', default=False,
+                            help='Exit when there is no job to run.')
+        parser.add_argument('--requeue-running', action='store_true', default=False,
+                            help='Return jobs left running by a stopped worker to the queue before start.')
+
+    def handle(self, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        if options['requeue_running']:
+            print(f'Requeued {requeue_running_jobs()} running jobs.')
+
+        running = set()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                running = {future for future in running if not future.done()}
+                close_unusable_connection()
+                job = claim_job(worker) if len(running) < options['workers'] else None
+                if job:
+                    print(f'Running {job}.')
+                    running.add(executor.submit(run_job, job))
+                    continue
+                if options['once'] and not running:
+                    break
+                close_old_connections()
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.stravalib import create_strava_client
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument('callback_url', help='Public URL of the strava_webhook view.')
+
+    def handle(self, **options):
+        if not all((settings.STRAVA_CLIENT_ID, settings.STRAVA_CLIENT_SECRET, settings.STRAVA_WEBHOOK_VERIFY_TOKEN)):
+            raise CommandError(
+                'STRAVA_CLIENT_ID, STRAVA_CLIENT_SECRET and STRAVA_WEBHOOK_VERIFY_TOKEN settings are required.'
+            )
+        # Strava validates the callback URL with a GET request before the subscription is created
+        subscription = create_strava_client().create_subscription(
+            client_id=settings.STRAVA_CLIENT_ID,
+            client_secret=settings.STRAVA_CLIENT_SECRET,
+            callback_url=options['callback_url'],
+            verify_token=settings.STRAVA_WEBHOOK_VERIFY_TOKEN,
+        )
+        print(f'Successfully created webhook subscription {subscription.id}.')
+        print(f'Set STRAVA_WEBHOOK_SUBSCRIPTION_ID = {subscription.id} and STRAVA_ATHLETE_ID to accept its events.')
@@ -0,0 +1,66 @@
+from itertools import islice
+
+from django.db import transaction
+from utils.cache import invalidate_activities_cache
+from utils.metrics import ImportMetrics
+from utils.models.activities import GearCache, bulk_create_activities_from_strava
+from utils.models.rollups import refresh_rollups_for_activities
+from utils.models.training_load import recompute_training_load_for_starts
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def import_strava_activities(client, strava_activities, sync_state, page_size, cursor_func, progress=None,
+                             metrics=None):
+    """
+    Imports Strava activities page by page. Every page is stored together with a sync state checkpoint in one
+    transaction, cursor of the checkpoint is computed by cursor_func from start dates of the page activities.
+    An interrupted import can therefore continue from the cursor without fetching finished pages again.
+    Optional progress callback is called with number of imported pages and a message after every page.
+    Time and queries of the import phases are recorded to metrics.
+    """
+    metrics = metrics or ImportMetrics()
+    gear_cache = GearCache()
+    imported_starts = []
+    activities_count = 0
+    new_gear_count = 0
+    pages = client.prefetch(chunked(strava_activities, page_size))
+    try:
+        while True:
+            with metrics.phase('fetch'):
+                strava_activities_page = next(pages, None)
+            if strava_activities_page is None:
+                break
+            with transaction.atomic():
+                with metrics.phase('store'):
+                    created_activities, created_gear_count = bulk_create_activities_from_strava(
+                        strava_activities_page, client, gear_cache
+                    )
+                with metrics.phase('rollups'):
+                    refresh_rollups_for_activities(created_activities)
+                imported_starts.extend(activity.start for activity in created_activities)
+                activities_count += len(created_activities)
+                new_gear_count += created_gear_count
+                sync_state.checkpoint(cursor_func(activity.start_date for activity in strava_activities_page))
+            metrics.increment('fetched_activities', len(strava_activities_page))
+            metrics.increment('created_activities', len(created_activities))
+            metrics.increment('created_gear', created_gear_count)
+            if created_activities:
+                invalidate_activities_cache()
+            if progress:
+                progress(sync_state.page, f'Imported {activities_count} activities.')
+    finally:
+        # Training load is recomputed once from the oldest imported activity, not after every page, also when
+        # the import is interrupted
+        with metrics.phase('training_load'):
+            recompute_training_load_for_starts(imported_starts)
+
+    print(f'Successfully imported {activities_count} activities.')
+    print(f'Created {new_gear_count} new gear.')
+    gear_cache.print_stats()
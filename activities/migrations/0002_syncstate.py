@@ -0,0 +1,30 @@
+# Generated by Django 2.1.7 on 2026-10-18 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('changed_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='changed at')),
+                ('name', models.SlugField(unique=True, verbose_name='name')),
+                ('cursor', models.DateTimeField(blank=True, null=True, verbose_name='cursor')),
+                ('page', models.PositiveIntegerField(default=0, verbose_name='imported pages')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='completed at')),
+            ],
+            options={
+                'verbose_name': 'sync state',
+                'verbose_name_plural': 'sync states',
+                'ordering': ('name',),
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.24 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0003_remove_duplicate_strava_ids'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activity',
+            name='strava_id',
+            field=models.PositiveIntegerField(blank=True, null=True, unique=True, verbose_name='strava ID'),
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='start',
+            field=models.DateTimeField(db_index=True, verbose_name='start'),
+        ),
+        migrations.AlterField(
+            model_name='gear',
+            name='strava_id',
+            field=models.CharField(blank=True, max_length=10, null=True, unique=True, verbose_name='strava ID'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['type', 'start'], name='activity_type_start_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.24 on 2026-10-18 21:05
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def remove_duplicate_strava_ids(apps, schema_editor):
+    Activity = apps.get_model('activities', 'Activity')
+    Gear = apps.get_model('activities', 'Gear')
+    Accessory = apps.get_model('activities', 'Accessory')
+
+    duplicate_activities = Activity.objects.exclude(strava_id=None).values('strava_id').annotate(
+        pk_min=Min('pk'), count=Count('pk')
+    ).filter(count__gt=1)
+    for duplicate in duplicate_activities:
+        kept_activity = Activity.objects.get(pk=duplicate['pk_min'])
+        for activity in Activity.objects.filter(strava_id=duplicate['strava_id']).exclude(pk=kept_activity.pk):
+            kept_activity.tags.add(*activity.tags.all())
+            kept_activity.athletes.add(*activity.athletes.all())
+            kept_activity.gear.add(*activity.gear.all())
+            kept_activity.accessories.add(*activity.accessories.all())
+            activity.delete()
+
+    duplicate_gear = Gear.objects.exclude(strava_id=None).values('strava_id').annotate(
+        pk_min=Min('pk'), count=Count('pk')
+    ).filter(count__gt=1)
+    for duplicate in duplicate_gear:
+        kept_gear = Gear.objects.get(pk=duplicate['pk_min'])
+        for gear in Gear.objects.filter(strava_id=duplicate['strava_id']).exclude(pk=kept_gear.pk):
+            kept_gear.activities.add(*gear.activities.all())
+            Accessory.objects.filter(gear=gear).update(gear=kept_gear)
+            gear.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0002_syncstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_strava_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.24 on 2026-10-18 21:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0003_activity_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('changed_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='changed at')),
+                ('period', models.PositiveSmallIntegerField(choices=[(1, 'Week'), (2, 'Month'), (3, 'Year')], verbose_name='period')),
+                ('period_start', models.DateField(verbose_name='period start')),
+                ('type', models.PositiveSmallIntegerField(choices=[(1, 'Run'), (2, 'Ride'), (3, 'Hike'), (4, 'Nordic Ski'), (5, 'Roller Ski'), (6, 'Alpine Ski'), (7, 'Swim'), (8, 'Walk'), (9, 'Canoeing'), (10, 'Rock Climbing'), (11, 'Ice Skate'), (12, 'Workout'), (13, 'Other')], verbose_name='activity type')),
+                ('distance', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='distance (m)')),
+                ('moving_time', models.DurationField(blank=True, null=True, verbose_name='moving time')),
+                ('elevation_gain', models.IntegerField(default=0, verbose_name='elevation gain')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='activities count')),
+                ('kudos', models.IntegerField(default=0, verbose_name='kudos count')),
+                ('gear', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='activities.Gear', verbose_name='gear')),
+            ],
+            options={
+                'verbose_name': 'activity rollup',
+                'verbose_name_plural': 'activity rollups',
+                'ordering': ('period', '-period_start', 'type'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='activityrollup',
+            index=models.Index(fields=['period', 'period_start', 'type'], name='rollup_period_start_type_idx'),
+        ),
+    ]
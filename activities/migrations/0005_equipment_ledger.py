@@ -0,0 +1,97 @@
+# Generated by Django 2.2.24 on 2026-10-18 22:10
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def compute_ledgers(apps, schema_editor):
+    Activity = apps.get_model('activities', 'Activity')
+    Accessory = apps.get_model('activities', 'Accessory')
+    for through_model, model, field in ((Activity.gear.through, apps.get_model('activities', 'Gear'), 'gear'),
+                                        (Accessory.activities.through, Accessory, 'accessory')):
+        rows = through_model.objects.values(field).annotate(
+            total_distance=Sum('activity__distance'),
+            total_moving_time=Sum('activity__moving_time'),
+            activity_count=Count('activity'),
+            first_used=Min('activity__start'),
+            last_used=Max('activity__start'),
+        ).order_by()
+        for row in rows:
+            model.objects.filter(pk=row.pop(field)).update(
+                total_distance=row.pop('total_distance') or 0,
+                total_moving_time=row.pop('total_moving_time') or datetime.timedelta(),
+                **row
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0004_activityrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accessory',
+            name='total_distance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='total distance (m)'),
+        ),
+        migrations.AddField(
+            model_name='accessory',
+            name='total_moving_time',
+            field=models.DurationField(default=datetime.timedelta, editable=False, verbose_name='total moving time'),
+        ),
+        migrations.AddField(
+            model_name='accessory',
+            name='activity_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='activities count'),
+        ),
+        migrations.AddField(
+            model_name='accessory',
+            name='first_used',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='first used'),
+        ),
+        migrations.AddField(
+            model_name='accessory',
+            name='last_used',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='last used'),
+        ),
+        migrations.AddField(
+            model_name='accessory',
+            name='retirement_distance',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='retirement distance (m)'),
+        ),
+        migrations.AddField(
+            model_name='gear',
+            name='total_distance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='total distance (m)'),
+        ),
+        migrations.AddField(
+            model_name='gear',
+            name='total_moving_time',
+            field=models.DurationField(default=datetime.timedelta, editable=False, verbose_name='total moving time'),
+        ),
+        migrations.AddField(
+            model_name='gear',
+            name='activity_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='activities count'),
+        ),
+        migrations.AddField(
+            model_name='gear',
+            name='first_used',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='first used'),
+        ),
+        migrations.AddField(
+            model_name='gear',
+            name='last_used',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='last used'),
+        ),
+        migrations.AddField(
+            model_name='gear',
+            name='retirement_distance',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='retirement distance (m)'),
+        ),
+        migrations.RunPython(compute_ledgers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.24 on 2026-10-18 22:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0005_equipment_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityStream',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('changed_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='changed at')),
+                ('type', models.PositiveSmallIntegerField(choices=[(1, 'time'), (2, 'distance'), (3, 'latlng'), (4, 'altitude'), (5, 'velocity_smooth'), (6, 'heartrate'), (7, 'cadence'), (8, 'watts')], verbose_name='type')),
+                ('dtype', models.CharField(max_length=10, verbose_name='data type')),
+                ('length', models.PositiveIntegerField(verbose_name='samples count')),
+                ('activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='streams', to='activities.Activity', verbose_name='activity')),
+            ],
+            options={
+                'verbose_name': 'activity stream',
+                'verbose_name_plural': 'activity streams',
+                'ordering': ('activity', 'type'),
+                'unique_together': {('activity', 'type')},
+            },
+        ),
+    ]
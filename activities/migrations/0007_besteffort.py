@@ -0,0 +1,60 @@
+# Generated by Django 2.2.24 on 2026-10-18 23:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0006_activitystream'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='best_efforts_computed',
+            field=models.BooleanField(default=False, editable=False, verbose_name='best efforts computed'),
+        ),
+        migrations.CreateModel(
+            name='BestEffort',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('changed_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='changed at')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Fastest time over distance'), (2, 'Best average power over duration')], verbose_name='kind')),
+                ('window', models.PositiveIntegerField(verbose_name='window (m or s)')),
+                ('value', models.FloatField(verbose_name='value (s or W)')),
+                ('start_time', models.PositiveIntegerField(verbose_name='start time (s)')),
+                ('activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='best_efforts', to='activities.Activity', verbose_name='activity')),
+            ],
+            options={
+                'verbose_name': 'best effort',
+                'verbose_name_plural': 'best efforts',
+                'ordering': ('kind', 'window'),
+                'unique_together': {('activity', 'kind', 'window')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='besteffort',
+            index=models.Index(fields=['kind', 'window', 'value'], name='best_effort_kind_window_idx'),
+        ),
+        migrations.CreateModel(
+            name='BestEffortRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('changed_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='changed at')),
+                ('activity_type', models.PositiveSmallIntegerField(choices=[(1, 'Run'), (2, 'Ride'), (3, 'Hike'), (4, 'Nordic Ski'), (5, 'Roller Ski'), (6, 'Alpine Ski'), (7, 'Swim'), (8, 'Walk'), (9, 'Canoeing'), (10, 'Rock Climbing'), (11, 'Ice Skate'), (12, 'Workout'), (13, 'Other')], verbose_name='activity type')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Fastest time over distance'), (2, 'Best average power over duration')], verbose_name='kind')),
+                ('window', models.PositiveIntegerField(verbose_name='window (m or s)')),
+                ('effort', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='records', to='activities.BestEffort', verbose_name='best effort')),
+            ],
+            options={
+                'verbose_name': 'best effort record',
+                'verbose_name_plural': 'best effort records',
+                'ordering': ('activity_type', 'kind', 'window'),
+                'unique_together': {('activity_type', 'kind', 'window')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.24 on 2026-10-18 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0007_besteffort'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrainingLoad',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('changed_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='changed at')),
+                ('date', models.DateField(verbose_name='date')),
+                ('activity_type', models.PositiveSmallIntegerField(blank=True, choices=[(1, 'Run'), (2, 'Ride'), (3, 'Hike'), (4, 'Nordic Ski'), (5, 'Roller Ski'), (6, 'Alpine Ski'), (7, 'Swim'), (8, 'Walk'), (9, 'Canoeing'), (10, 'Rock Climbing'), (11, 'Ice Skate'), (12, 'Workout'), (13, 'Other')], null=True, verbose_name='activity type')),
+                ('load', models.FloatField(default=0, verbose_name='load')),
+                ('fitness', models.FloatField(default=0, verbose_name='fitness')),
+                ('fatigue', models.FloatField(default=0, verbose_name='fatigue')),
+                ('form', models.FloatField(default=0, verbose_name='form')),
+            ],
+            options={
+                'verbose_name': 'training load',
+                'verbose_name_plural': 'training loads',
+                'ordering': ('-date', 'activity_type'),
+                'unique_together': {('date', 'activity_type')},
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.24 on 2026-10-19 08:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0008_trainingload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('changed_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='changed at')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Import new activities'), (2, 'Import all activities'), (3, 'Import activity streams')], verbose_name='kind')),
+                ('state', models.PositiveSmallIntegerField(choices=[(1, 'Queued'), (2, 'Running'), (3, 'Succeeded'), (4, 'Failed')], default=1, verbose_name='state')),
+                ('key', models.CharField(max_length=100, verbose_name='deduplication key')),
+                ('arguments', models.TextField(blank=True, default='{}', verbose_name='arguments (JSON)')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='run after')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='started at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+                ('progress', models.PositiveIntegerField(default=0, verbose_name='progress')),
+                ('message', models.TextField(blank=True, default='', verbose_name='message')),
+                ('worker', models.CharField(blank=True, default='', max_length=100, verbose_name='worker')),
+            ],
+            options={
+                'verbose_name': 'job',
+                'verbose_name_plural': 'jobs',
+                'ordering': ('-created_at',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['state', 'run_after'], name='job_state_run_after_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(state=1), fields=('key',), name='job_queued_key_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.24 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0009_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Import new activities'), (2, 'Import all activities'), (3, 'Import activity streams'), (4, 'Sync Strava activity')], verbose_name='kind'),
+        ),
+    ]
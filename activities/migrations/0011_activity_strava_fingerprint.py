@@ -0,0 +1,18 @@
+# Generated by Django 2.2.24 on 2026-10-19 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0010_job_sync_strava_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='strava_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True, verbose_name='strava fingerprint'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.24 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0011_activity_strava_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('changed_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='changed at')),
+                ('name', models.SlugField(max_length=100, verbose_name='name')),
+                ('succeeded', models.BooleanField(default=False, verbose_name='succeeded')),
+                ('started_at', models.DateTimeField(verbose_name='started at')),
+                ('finished_at', models.DateTimeField(verbose_name='finished at')),
+                ('wall_time', models.FloatField(verbose_name='wall time (s)')),
+                ('query_count', models.PositiveIntegerField(verbose_name='database query count')),
+                ('query_time', models.FloatField(verbose_name='database query time (s)')),
+                ('api_call_count', models.PositiveIntegerField(verbose_name='Strava API call count')),
+                ('api_time', models.FloatField(verbose_name='Strava API time (s)')),
+                ('short_rate_limit_headroom', models.IntegerField(blank=True, null=True, verbose_name='15-minute rate limit headroom')),
+                ('long_rate_limit_headroom', models.IntegerField(blank=True, null=True, verbose_name='daily rate limit headroom')),
+                ('metrics', models.TextField(blank=True, default='{}', verbose_name='metrics (JSON)')),
+            ],
+            options={
+                'verbose_name': 'import run',
+                'verbose_name_plural': 'import runs',
+                'ordering': ('-started_at',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='importrun',
+            index=models.Index(fields=['name', 'started_at'], name='importrun_name_started_at_idx'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 2.2.24 on 2026-10-19 14:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0012_importrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='start_latitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='start latitude'),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='start_longitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='start longitude'),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='end_latitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='end latitude'),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='end_longitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='end longitude'),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='min_latitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='min latitude'),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='min_longitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='min longitude'),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='max_latitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='max latitude'),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='max_longitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='max longitude'),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='route_polyline',
+            field=models.TextField(blank=True, null=True, verbose_name='simplified route (encoded polyline)'),
+        ),
+        migrations.CreateModel(
+            name='ActivityGeoCell',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('changed_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='changed at')),
+                ('cell', models.CharField(db_index=True, max_length=12, verbose_name='geohash cell')),
+                ('activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='geo_cells', to='activities.Activity', verbose_name='activity')),
+            ],
+            options={
+                'verbose_name': 'activity geo cell',
+                'verbose_name_plural': 'activity geo cells',
+                'ordering': ('activity', 'cell'),
+                'unique_together': {('activity', 'cell')},
+            },
+        ),
+    ]
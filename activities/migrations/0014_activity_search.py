@@ -0,0 +1,64 @@
+# Generated by Django 2.2.24 on 2026-10-19 16:00
+
+from collections import defaultdict
+
+from django.db import migrations
+
+
+SQLITE_CREATE_SQL = 'CREATE VIRTUAL TABLE activities_search USING fts5(name, tags, athletes)'
+SQLITE_INSERT_SQL = 'INSERT INTO activities_search (rowid, name, tags, athletes) VALUES (%s, %s, %s, %s)'
+
+POSTGRESQL_CREATE_SQL = (
+    'CREATE TABLE activities_search ('
+    'activity_id integer PRIMARY KEY REFERENCES activities_activity (id) ON DELETE CASCADE '
+    'DEFERRABLE INITIALLY DEFERRED, '
+    'document tsvector NOT NULL)',
+    'CREATE INDEX activities_search_document_idx ON activities_search USING GIN (document)',
+)
+POSTGRESQL_INSERT_SQL = (
+    "INSERT INTO activities_search (activity_id, document) VALUES (%s, "
+    "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B') || "
+    "setweight(to_tsvector('simple', %s), 'C'))"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        create_sql, insert_sql = (SQLITE_CREATE_SQL,), SQLITE_INSERT_SQL
+    elif vendor == 'postgresql':
+        create_sql, insert_sql = POSTGRESQL_CREATE_SQL, POSTGRESQL_INSERT_SQL
+    else:
+        return
+
+    Activity = apps.get_model('activities', 'Activity')
+    tags = defaultdict(list)
+    for activity_id, name in Activity.tags.through.objects.values_list('activity', 'tag__name'):
+        tags[activity_id].append(name)
+    athletes = defaultdict(list)
+    for activity_id, name in Activity.athletes.through.objects.values_list('activity', 'athlete__name'):
+        athletes[activity_id].append(name)
+    with schema_editor.connection.cursor() as cursor:
+        for sql in create_sql:
+            cursor.execute(sql)
+        cursor.executemany(insert_sql, [
+            (pk, name, ' '.join(tags[pk]), ' '.join(athletes[pk]))
+            for pk, name in Activity.objects.values_list('pk', 'name').order_by()
+        ])
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in {'sqlite', 'postgresql'}:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE activities_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0013_activity_route'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,6 +1,9 @@
+from datetime import timedelta
+
 from chamber.models import SmartModel
 from chamber.utils.datastructures import ChoicesNumEnum
 from django.db import models
+from django.utils import timezone
 
 
 class Activity(SmartModel):
@@ -22,11 +25,11 @@ class Activity(SmartModel):
     )
 
     name = models.CharField(verbose_name='name', max_length=255, null=False, blank=False)
-    strava_id = models.PositiveIntegerField(verbose_name='strava ID', null=True, blank=True)
+    strava_id = models.PositiveIntegerField(verbose_name='strava ID', null=True, blank=True, unique=True)
     distance = models.DecimalField(verbose_name='distance (m)', decimal_places=2, max_digits=9, null=True, blank=True)
     average_speed = models.DecimalField(verbose_name='average speed (m/s)', decimal_places=2, max_digits=7, null=True,
                                         blank=True)
-    start = models.DateTimeField(verbose_name='start', null=False, blank=False)
+    start = models.DateTimeField(verbose_name='start', null=False, blank=False, db_index=True)
     moving_time = models.DurationField(verbose_name='moving time', null=True, blank=True)
     elapsed_time = models.DurationField(verbose_name='elapsed time', null=False, blank=False)
     elevation_gain = models.IntegerField(verbose_name='elevation gain', null=True, blank=True)
@@ -42,15 +45,34 @@ class Activity(SmartModel):
     athlete_count = models.PositiveSmallIntegerField(verbose_name='strava athletes count', null=True, blank=True)
     athletes = models.ManyToManyField('Athlete', verbose_name='athletes', related_name='activities', blank=True)
     tags = models.ManyToManyField('Tag', verbose_name='tags', related_name='activities', blank=True)
+    best_efforts_computed = models.BooleanField(verbose_name='best efforts computed', default=False, editable=False)
+    start_latitude = models.FloatField(verbose_name='start latitude', null=True, blank=True)
+    start_longitude = models.FloatField(verbose_name='start longitude', null=True, blank=True)
+    end_latitude = models.FloatField(verbose_name='end latitude', null=True, blank=True)
+    end_longitude = models.FloatField(verbose_name='end longitude', null=True, blank=True)
+    # Bounding box of the route
+    min_latitude = models.FloatField(verbose_name='min latitude', null=True, blank=True)
+    min_longitude = models.FloatField(verbose_name='min longitude', null=True, blank=True)
+    max_latitude = models.FloatField(verbose_name='max latitude', null=True, blank=True)
+    max_longitude = models.FloatField(verbose_name='max longitude', null=True, blank=True)
+    # Strava summary polyline simplified by utils.models.routes, cells it crosses are indexed in ActivityGeoCell
+    route_polyline = models.TextField(verbose_name='simplified route (encoded polyline)', null=True, blank=True)
+    # Hash of the fields mapped from Strava, changed activities are found by comparing it with a fresh summary
+    strava_fingerprint = models.CharField(verbose_name='strava fingerprint', max_length=40, null=True, blank=True,
+                                          editable=False)
 
     def __str__(self):
-        return f'{self.name} #{self.tags.all()}'
-        # return f'{map(lambda name: '#' + name, Tag.objects.all().values_list('name', flat=True))}'
+        # tags.all() uses prefetched tags if they are available, unsaved activity cannot have tags
+        tags = ' '.join(f'#{tag.name}' for tag in self.tags.all()) if self.pk else ''
+        return f'{self.name} {tags}'.rstrip()
 
     class Meta:
         ordering = ('-start',)
         verbose_name = 'activity'
         verbose_name_plural = 'activities'
+        indexes = (
+            models.Index(fields=('type', 'start'), name='activity_type_start_idx'),
+        )
 
 
 class Athlete(SmartModel):
@@ -66,7 +88,31 @@ class Athlete(SmartModel):
         verbose_name_plural = 'athletes'
 
 
-class Gear(SmartModel):
+class EquipmentLedgerModel(SmartModel):
+    """
+    Denormalized totals of activities where the equipment was used, maintained by utils.models.ledger.
+    """
+
+    total_distance = models.DecimalField(verbose_name='total distance (m)', decimal_places=2, max_digits=12,
+                                         null=False, blank=False, default=0, editable=False)
+    total_moving_time = models.DurationField(verbose_name='total moving time', null=False, blank=False,
+                                             default=timedelta, editable=False)
+    activity_count = models.PositiveIntegerField(verbose_name='activities count', null=False, blank=False,
+                                                 default=0, editable=False)
+    first_used = models.DateTimeField(verbose_name='first used', null=True, blank=True, editable=False)
+    last_used = models.DateTimeField(verbose_name='last used', null=True, blank=True, editable=False)
+    retirement_distance = models.DecimalField(verbose_name='retirement distance (m)', decimal_places=2,
+                                              max_digits=12, null=True, blank=True)
+
+    @property
+    def should_be_retired(self):
+        return self.retirement_distance is not None and self.total_distance >= self.retirement_distance
+
+    class Meta:
+        abstract = True
+
+
+class Gear(EquipmentLedgerModel):
 
     TYPE = ChoicesNumEnum(
         ('SHOE', 'Shoe', 1),
@@ -77,7 +123,7 @@ class Gear(SmartModel):
 
     name = models.CharField(verbose_name='name', max_length=50, null=False, blank=False)
     type = models.PositiveSmallIntegerField(verbose_name='gear type', choices=TYPE.choices, null=False, blank=False)
-    strava_id = models.CharField(verbose_name='strava ID', max_length=10, null=True, blank=True)
+    strava_id = models.CharField(verbose_name='strava ID', max_length=10, null=True, blank=True, unique=True)
 
     def __str__(self):
         return self.name
@@ -88,7 +134,7 @@ class Gear(SmartModel):
         verbose_name_plural = 'gears'
 
 
-class Accessory(SmartModel):
+class Accessory(EquipmentLedgerModel):
 
     name = models.CharField(verbose_name='name', max_length=50, null=False, blank=False)
     activities = models.ManyToManyField('Activity', verbose_name='activities', blank=True, related_name='accessories')
@@ -116,3 +162,285 @@ class Tag(SmartModel):
         ordering = ('-created_at',)
         verbose_name = 'tag'
         verbose_name_plural = 'tags'
+
+
+class SyncState(SmartModel):
+
+    name = models.SlugField(verbose_name='name', max_length=50, null=False, blank=False, unique=True)
+    # Start of the last fully imported Strava activity, meaning of the cursor depends on the import direction
+    cursor = models.DateTimeField(verbose_name='cursor', null=True, blank=True)
+    page = models.PositiveIntegerField(verbose_name='imported pages', default=0)
+    completed_at = models.DateTimeField(verbose_name='completed at', null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+    def checkpoint(self, cursor):
+        self.cursor = cursor
+        self.page += 1
+        self.save()
+
+    def complete(self, cursor=None):
+        self.cursor = cursor
+        self.page = 0
+        self.completed_at = timezone.now()
+        self.save()
+
+    class Meta:
+        ordering = ('name',)
+        verbose_name = 'sync state'
+        verbose_name_plural = 'sync states'
+
+
+class ActivityRollup(SmartModel):
+    """
+    Precomputed totals of activities per period and activity type. Rows without gear contain totals of all
+    activities, rows with gear contain totals of activities where the gear was used.
+    """
+
+    PERIOD = ChoicesNumEnum(
+        ('WEEK', 'Week', 1),
+        ('MONTH', 'Month', 2),
+        ('YEAR', 'Year', 3),
+    )
+
+    period = models.PositiveSmallIntegerField(verbose_name='period', choices=PERIOD.choices, null=False, blank=False)
+    period_start = models.DateField(verbose_name='period start', null=False, blank=False)
+    type = models.PositiveSmallIntegerField(verbose_name='activity type', choices=Activity.TYPE.choices, null=False,
+                                            blank=False)
+    gear = models.ForeignKey('Gear', verbose_name='gear', null=True, blank=True, on_delete=models.CASCADE,
+                             related_name='rollups')
+    distance = models.DecimalField(verbose_name='distance (m)', decimal_places=2, max_digits=12, null=False,
+                                   blank=False, default=0)
+    moving_time = models.DurationField(verbose_name='moving time', null=True, blank=True)
+    elevation_gain = models.IntegerField(verbose_name='elevation gain', null=False, blank=False, default=0)
+    count = models.PositiveIntegerField(verbose_name='activities count', null=False, blank=False, default=0)
+    kudos = models.IntegerField(verbose_name='kudos count', null=False, blank=False, default=0)
+
+    def __str__(self):
+        return f'{self.get_period_display()} {self.period_start} {self.get_type_display()}'
+
+    class Meta:
+        ordering = ('period', '-period_start', 'type')
+        verbose_name = 'activity rollup'
+        verbose_name_plural = 'activity rollups'
+        indexes = (
+            models.Index(fields=('period', 'period_start', 'type'), name='rollup_period_start_type_idx'),
+        )
+
+
+class ActivityStream(SmartModel):
+    """
+    Index of activity streams stored as NumPy arrays by utils.streams.store.
+    """
+
+    TYPE = ChoicesNumEnum(
+        ('TIME', 'time', 1),
+        ('DISTANCE', 'distance', 2),
+        ('LATLNG', 'latlng', 3),
+        ('ALTITUDE', 'altitude', 4),
+        ('VELOCITY', 'velocity_smooth', 5),
+        ('HEARTRATE', 'heartrate', 6),
+        ('CADENCE', 'cadence', 7),
+        ('WATTS', 'watts', 8),
+    )
+
+    activity = models.ForeignKey('Activity', verbose_name='activity', null=False, blank=False,
+                                 on_delete=models.CASCADE, related_name='streams')
+    type = models.PositiveSmallIntegerField(verbose_name='type', choices=TYPE.choices, null=False, blank=False)
+    dtype = models.CharField(verbose_name='data type', max_length=10, null=False, blank=False)
+    length = models.PositiveIntegerField(verbose_name='samples count', null=False, blank=False)
+
+    def __str__(self):
+        return f'{self.activity_id} {self.get_type_display()}'
+
+    class Meta:
+        ordering = ('activity', 'type')
+        verbose_name = 'activity stream'
+        verbose_name_plural = 'activity streams'
+        unique_together = ('activity', 'type')
+
+
+class ActivityGeoCell(SmartModel):
+    """
+    Geohash cell crossed by the activity route, maintained by utils.models.routes.
+    """
+
+    activity = models.ForeignKey('Activity', verbose_name='activity', null=False, blank=False,
+                                 on_delete=models.CASCADE, related_name='geo_cells')
+    cell = models.CharField(verbose_name='geohash cell', max_length=12, null=False, blank=False, db_index=True)
+
+    def __str__(self):
+        return f'{self.activity_id} {self.cell}'
+
+    class Meta:
+        ordering = ('activity', 'cell')
+        verbose_name = 'activity geo cell'
+        verbose_name_plural = 'activity geo cells'
+        unique_together = ('activity', 'cell')
+
+
+class BestEffort(SmartModel):
+
+    KIND = ChoicesNumEnum(
+        ('DISTANCE', 'Fastest time over distance', 1),
+        ('POWER', 'Best average power over duration', 2),
+    )
+
+    activity = models.ForeignKey('Activity', verbose_name='activity', null=False, blank=False,
+                                 on_delete=models.CASCADE, related_name='best_efforts')
+    kind = models.PositiveSmallIntegerField(verbose_name='kind', choices=KIND.choices, null=False, blank=False)
+    window = models.PositiveIntegerField(verbose_name='window (m or s)', null=False, blank=False)
+    value = models.FloatField(verbose_name='value (s or W)', null=False, blank=False)
+    start_time = models.PositiveIntegerField(verbose_name='start time (s)', null=False, blank=False)
+
+    def __str__(self):
+        return f'{self.get_kind_display()} {self.window}: {self.value}'
+
+    def is_better_than(self, effort):
+        # Shorter time is better for distance efforts, higher power for power efforts
+        if self.kind == self.KIND.DISTANCE:
+            return self.value < effort.value
+        return self.value > effort.value
+
+    class Meta:
+        ordering = ('kind', 'window')
+        verbose_name = 'best effort'
+        verbose_name_plural = 'best efforts'
+        unique_together = ('activity', 'kind', 'window')
+        indexes = (
+            models.Index(fields=('kind', 'window', 'value'), name='best_effort_kind_window_idx'),
+        )
+
+
+class BestEffortRecord(SmartModel):
+    """
+    All-time best effort per activity type, kind and window.
+    """
+
+    activity_type = models.PositiveSmallIntegerField(verbose_name='activity type', choices=Activity.TYPE.choices,
+                                                     null=False, blank=False)
+    kind = models.PositiveSmallIntegerField(verbose_name='kind', choices=BestEffort.KIND.choices, null=False,
+                                            blank=False)
+    window = models.PositiveIntegerField(verbose_name='window (m or s)', null=False, blank=False)
+    effort = models.ForeignKey('BestEffort', verbose_name='best effort', null=False, blank=False,
+                               on_delete=models.CASCADE, related_name='records')
+
+    def __str__(self):
+        return f'{self.get_activity_type_display()} {self.effort}'
+
+    class Meta:
+        ordering = ('activity_type', 'kind', 'window')
+        verbose_name = 'best effort record'
+        verbose_name_plural = 'best effort records'
+        unique_together = ('activity_type', 'kind', 'window')
+
+
+class TrainingLoad(SmartModel):
+    """
+    Daily training load with fitness (CTL), fatigue (ATL) and form (TSB) maintained by
+    utils.models.training_load. Rows without activity type contain values of all activities.
+    """
+
+    date = models.DateField(verbose_name='date', null=False, blank=False)
+    activity_type = models.PositiveSmallIntegerField(verbose_name='activity type', choices=Activity.TYPE.choices,
+                                                     null=True, blank=True)
+    load = models.FloatField(verbose_name='load', null=False, blank=False, default=0)
+    fitness = models.FloatField(verbose_name='fitness', null=False, blank=False, default=0)
+    fatigue = models.FloatField(verbose_name='fatigue', null=False, blank=False, default=0)
+    form = models.FloatField(verbose_name='form', null=False, blank=False, default=0)
+
+    def __str__(self):
+        return f'{self.date} {self.get_activity_type_display() or "All"}'
+
+    class Meta:
+        ordering = ('-date', 'activity_type')
+        verbose_name = 'training load'
+        verbose_name_plural = 'training loads'
+        unique_together = ('date', 'activity_type')
+
+
+# Defined outside of Job, names of the class body are not visible in its Meta
+JOB_STATE = ChoicesNumEnum(
+    ('QUEUED', 'Queued', 1),
+    ('RUNNING', 'Running', 2),
+    ('SUCCEEDED', 'Succeeded', 3),
+    ('FAILED', 'Failed', 4),
+)
+
+
+class Job(SmartModel):
+    """
+    Background job processed by the run_worker command.
+    """
+
+    KIND = ChoicesNumEnum(
+        ('IMPORT_NEW_ACTIVITIES', 'Import new activities', 1),
+        ('IMPORT_ALL_ACTIVITIES', 'Import all activities', 2),
+        ('IMPORT_ACTIVITY_STREAMS', 'Import activity streams', 3),
+        ('SYNC_STRAVA_ACTIVITY', 'Sync Strava activity', 4),
+    )
+
+    STATE = JOB_STATE
+
+    ACTIVE_STATES = (STATE.QUEUED, STATE.RUNNING)
+
+    kind = models.PositiveSmallIntegerField(verbose_name='kind', choices=KIND.choices, null=False, blank=False)
+    state = models.PositiveSmallIntegerField(verbose_name='state', choices=STATE.choices, null=False, blank=False,
+                                             default=STATE.QUEUED)
+    # Queued jobs with the same key are deduplicated and jobs with the same key never run concurrently
+    key = models.CharField(verbose_name='deduplication key', max_length=100, null=False, blank=False)
+    arguments = models.TextField(verbose_name='arguments (JSON)', null=False, blank=True, default='{}')
+    run_after = models.DateTimeField(verbose_name='run after', null=False, blank=False, default=timezone.now)
+    started_at = models.DateTimeField(verbose_name='started at', null=True, blank=True)
+    finished_at = models.DateTimeField(verbose_name='finished at', null=True, blank=True)
+    progress = models.PositiveIntegerField(verbose_name='progress', null=False, blank=False, default=0)
+    message = models.TextField(verbose_name='message', null=False, blank=True, default='')
+    worker = models.CharField(verbose_name='worker', max_length=100, null=False, blank=True, default='')
+
+    def __str__(self):
+        return f'{self.get_kind_display()} #{self.pk}'
+
+    class Meta:
+        ordering = ('-created_at',)
+        verbose_name = 'job'
+        verbose_name_plural = 'jobs'
+        indexes = (
+            models.Index(fields=('state', 'run_after'), name='job_state_run_after_idx'),
+        )
+        constraints = (
+            models.UniqueConstraint(fields=('key',), condition=models.Q(state=JOB_STATE.QUEUED),
+                                    name='job_queued_key_unique'),
+        )
+
+
+class ImportRun(SmartModel):
+    """
+    Metrics of one import run recorded by utils.metrics.ImportMetrics.
+    """
+
+    name = models.SlugField(verbose_name='name', max_length=100, null=False, blank=False)
+    succeeded = models.BooleanField(verbose_name='succeeded', default=False)
+    started_at = models.DateTimeField(verbose_name='started at', null=False, blank=False)
+    finished_at = models.DateTimeField(verbose_name='finished at', null=False, blank=False)
+    wall_time = models.FloatField(verbose_name='wall time (s)', null=False, blank=False)
+    query_count = models.PositiveIntegerField(verbose_name='database query count', null=False, blank=False)
+    query_time = models.FloatField(verbose_name='database query time (s)', null=False, blank=False)
+    api_call_count = models.PositiveIntegerField(verbose_name='Strava API call count', null=False, blank=False)
+    api_time = models.FloatField(verbose_name='Strava API time (s)', null=False, blank=False)
+    short_rate_limit_headroom = models.IntegerField(verbose_name='15-minute rate limit headroom', null=True,
+                                                    blank=True)
+    long_rate_limit_headroom = models.IntegerField(verbose_name='daily rate limit headroom', null=True, blank=True)
+    # Phases, counters and API latency histogram
+    metrics = models.TextField(verbose_name='metrics (JSON)', null=False, blank=True, default='{}')
+
+    def __str__(self):
+        return f'{self.name} {self.started_at}'
+
+    class Meta:
+        ordering = ('-started_at',)
+        verbose_name = 'import run'
+        verbose_name_plural = 'import runs'
+        indexes = (
+            models.Index(fields=('name', 'started_at'), name='importrun_name_started_at_idx'),
+        )
@@ -0,0 +1,147 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from utils.cache import invalidate_activities_cache
+from utils.db import configure_sqlite_connection
+from utils.models.ledger import update_accessory_ledgers, update_gear_ledgers, update_ledgers_for_activities
+from utils.models.rollups import refresh_rollups
+from utils.models.search import delete_from_search_index, update_search_index
+
+from .models import Accessory, Activity, Athlete, Tag
+
+
+LEDGER_FIELDS = ('start', 'distance', 'moving_time')
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        configure_sqlite_connection(connection)
+
+
+def _get_m2m_changed_pks(instance, action, pk_set, related_manager_name):
+    """
+    Returns primary keys of related objects affected by M2M change. Keys of cleared objects are not sent with
+    the signal, they are stored on the instance in pre_clear.
+    """
+    if action == 'pre_clear':
+        instance._cleared_pks = set(getattr(instance, related_manager_name).values_list('pk', flat=True))
+        return set()
+    elif action == 'post_clear':
+        return getattr(instance, '_cleared_pks', set())
+    elif action in {'post_add', 'post_remove'}:
+        return pk_set
+    else:
+        return set()
+
+
+@receiver(pre_save, sender=Activity)
+def store_activity_previous_values(sender, instance, **kwargs):
+    instance._previous_values = (
+        Activity.objects.filter(pk=instance.pk).values('type', 'name', 'route_polyline', *LEDGER_FIELDS).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Activity)
+def update_aggregates_after_activity_save(sender, instance, **kwargs):
+    # Helpers depending on NumPy are imported on first use, signals are loaded by every management command
+    from utils.models.routes import update_route_index
+    from utils.models.training_load import recompute_training_load_for_starts
+    from utils.streams.efforts import move_best_effort_records
+
+    activity_keys = [(instance.start, instance.type)]
+    previous_values = getattr(instance, '_previous_values', None)
+    if previous_values:
+        activity_keys.append((previous_values['start'], previous_values['type']))
+        if any(previous_values[field] != getattr(instance, field) for field in LEDGER_FIELDS):
+            update_ledgers_for_activities([instance.pk])
+        if previous_values['type'] != instance.type and instance.best_efforts_computed:
+            move_best_effort_records(instance, previous_values['type'])
+    if (previous_values['route_polyline'] if previous_values else None) != instance.route_polyline:
+        update_route_index([instance])
+    if not previous_values or previous_values['name'] != instance.name:
+        update_search_index([instance.pk])
+    refresh_rollups(activity_keys)
+    recompute_training_load_for_starts(start for start, _ in activity_keys)
+    invalidate_activities_cache()
+
+
+@receiver(pre_delete, sender=Activity)
+def store_activity_equipment(sender, instance, **kwargs):
+    instance._gear_pks = list(instance.gear.values_list('pk', flat=True))
+    instance._accessory_pks = list(instance.accessories.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Activity)
+def update_aggregates_after_activity_delete(sender, instance, **kwargs):
+    from utils.models.training_load import recompute_training_load_for_starts
+    from utils.streams.efforts import refill_best_effort_records
+    from utils.streams.store import delete_stream_files
+
+    update_gear_ledgers(getattr(instance, '_gear_pks', ()))
+    update_accessory_ledgers(getattr(instance, '_accessory_pks', ()))
+    refresh_rollups([(instance.start, instance.type)])
+    recompute_training_load_for_starts([instance.start])
+    invalidate_activities_cache()
+    if instance.best_efforts_computed:
+        refill_best_effort_records(instance.type)
+    if instance.strava_id:
+        delete_stream_files(instance.strava_id)
+    delete_from_search_index([instance.pk])
+
+
+@receiver(m2m_changed, sender=Activity.gear.through)
+def update_aggregates_after_gear_change(sender, instance, action, reverse, pk_set, **kwargs):
+    changed_pks = _get_m2m_changed_pks(instance, action, pk_set, 'activities' if reverse else 'gear')
+    if not changed_pks:
+        return
+    if reverse:
+        # Gear was changed from the gear side, changed objects are activities
+        update_gear_ledgers([instance.pk])
+        refresh_rollups(Activity.objects.filter(pk__in=changed_pks).values_list('start', 'type'))
+    else:
+        update_gear_ledgers(changed_pks)
+        refresh_rollups([(instance.start, instance.type)])
+    invalidate_activities_cache()
+
+
+@receiver(m2m_changed, sender=Accessory.activities.through)
+def update_ledgers_after_accessory_change(sender, instance, action, reverse, pk_set, **kwargs):
+    changed_pks = _get_m2m_changed_pks(instance, action, pk_set, 'accessories' if reverse else 'activities')
+    if changed_pks:
+        # Accessory activities are changed from the activity side when reverse is set
+        update_accessory_ledgers(changed_pks if reverse else [instance.pk])
+
+
+@receiver(m2m_changed, sender=Activity.tags.through)
+@receiver(m2m_changed, sender=Activity.athletes.through)
+def update_search_index_after_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    related_manager_name = 'activities' if reverse else ('tags' if sender is Activity.tags.through else 'athletes')
+    changed_pks = _get_m2m_changed_pks(instance, action, pk_set, related_manager_name)
+    if changed_pks:
+        update_search_index(changed_pks if reverse else [instance.pk])
+        invalidate_activities_cache()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Athlete)
+def update_search_index_after_name_change(sender, instance, created, **kwargs):
+    if not created:
+        update_search_index(instance.activities.values_list('pk', flat=True))
+        invalidate_activities_cache()
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Athlete)
+def store_search_activity_pks(sender, instance, **kwargs):
+    instance._activity_pks = list(instance.activities.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Athlete)
+def update_search_index_after_delete(sender, instance, **kwargs):
+    activity_pks = getattr(instance, '_activity_pks', ())
+    if activity_pks:
+        update_search_index(activity_pks)
+        invalidate_activities_cache()
@@ -1,4 +1,1127 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from types import SimpleNamespace
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
 
+import numpy as np
+import pyarrow.parquet as pq
+from activities.management.commands.import_all_activities import SYNC_STATE_NAME, import_all_activities
+from activities.management.commands.import_strava_archive import import_strava_archive
+from activities.management.commands.utils import chunked, import_strava_activities
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from stravalib.exc import ObjectNotFound
+from utils.geo.geohash import encode_geohash, get_cell_size, get_cells_in_bbox, get_polyline_cells
+from utils.geo.polyline import decode_polyline, encode_polyline, simplify_polyline
+from utils.jobs import enqueue_job, enqueue_strava_activity_sync, requeue_running_jobs
+from utils.metrics import ImportMetrics, get_prometheus_text
+from utils.models.activities import (
+    GearCache, build_activity_from_strava, bulk_create_activities, bulk_create_activities_from_strava,
+    bulk_update_activities_from_strava, create_and_add_gear_to_activity_if_needed, get_or_create_gear_from_strava,
+    sync_strava_activity
+)
+from utils.models.ledger import reconcile_ledgers
+from utils.models.rollups import rebuild_rollups
+from utils.models.routes import get_activities_near, get_matching_activities
+from utils.models.training_load import get_activity_load, get_heart_rate_load, recompute_training_load
+from utils.models.search import SEARCH_TABLE, search_activities
+from utils.parquet import export_parquet, get_partition_path
+from utils.stravalib import create_strava_client
+from utils.stravalib.concurrent import ConcurrentStravaClient
+from utils.stravalib.fake import FakeStravaClient, generate_strava_activities
+from utils.stravalib.limiter import RateLimitExhausted, StravaRateLimiter
+from utils.streams.efforts import compute_distance_efforts, compute_power_efforts
+from utils.streams.store import get_present_samples, to_stream_array
 
-# Create your tests here.
+from .models import (
+    Accessory, Activity, ActivityRollup, ActivityStream, Athlete, Gear, ImportRun, Job, SyncState, Tag,
+    TrainingLoad
+)
+
+
+# Tests must not touch the file cache and stream files of the local installation
+test_settings = override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'}},
+    STREAMS_ROOT=None,
+)
+
+
+def setUpModule():
+    test_settings.options['STREAMS_ROOT'] = tempfile.mkdtemp(prefix='strats-streams-')
+    test_settings.enable()
+
+
+def tearDownModule():
+    test_settings.disable()
+    shutil.rmtree(test_settings.options['STREAMS_ROOT'], ignore_errors=True)
+
+
+class FakeStravaRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            status = server.statuses.pop(0) if server.statuses else 200
+        url = urlparse(self.path)
+        if url.path.endswith('/athlete/activities'):
+            page = int(parse_qs(url.query)['page'][0])
+            body = json.dumps(server.activity_pages[page - 1] if page <= len(server.activity_pages) else [])
+        else:
+            gear_id = url.path.rstrip('/').rsplit('/', 1)[-1]
+            body = json.dumps({'id': gear_id, 'name': f'Gear {gear_id}', 'resource_state': 3})
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('X-RateLimit-Limit', server.rate_limit)
+        self.send_header('X-RateLimit-Usage', server.rate_limit_usage)
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeStravaServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeStravaRequestHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.statuses = []
+        self.activity_pages = []
+        self.rate_limit = '600,30000'
+        self.rate_limit_usage = '0,0'
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+
+class ConcurrentStravaClientTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.server = FakeStravaServer()
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.sleeps = []
+        self.now = 1000.0
+        self.rate_limiter = StravaRateLimiter(clock=lambda: self.now, sleep=self.fake_sleep)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fake_sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def create_client(self, rate_limiter=None):
+        client = create_strava_client(rate_limiter=rate_limiter)
+        client.protocol._resolve_url = lambda url, use_webhook_server: f'{self.server.url}/api/v3/{url.strip("/")}'
+        return client
+
+    def test_requests_should_run_concurrently(self):
+        with ConcurrentStravaClient(rate_limiter=self.rate_limiter, client_factory=self.create_client) as client:
+            gear = client.map('get_gear', ['b1', 'b2', 'g3'])
+        self.assertEqual([g.name for g in gear], ['Gear b1', 'Gear b2', 'Gear g3'])
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.sleeps, [])
+
+    def test_limiter_should_wait_for_next_window_before_limit_is_reached(self):
+        self.server.rate_limit_usage = '599,1000'
+        with ConcurrentStravaClient(rate_limiter=self.rate_limiter, client_factory=self.create_client) as client:
+            client.get_gear('b1')
+            client.get_gear('b2')
+        self.assertEqual(self.sleeps, [800.0])
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_rate_limited_request_should_be_retried(self):
+        self.server.statuses = [429]
+        with ConcurrentStravaClient(rate_limiter=self.rate_limiter, client_factory=self.create_client) as client:
+            gear = client.get_gear('b1')
+        self.assertEqual(gear.name, 'Gear b1')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(len(self.sleeps), 1)
+
+    def test_every_page_of_activities_should_go_through_limiter(self):
+        self.server.activity_pages = [
+            [{'id': 1, 'name': 'Run 1', 'resource_state': 2}, {'id': 2, 'name': 'Run 2', 'resource_state': 2}],
+            [{'id': 3, 'name': 'Run 3', 'resource_state': 2}],
+        ]
+        self.server.statuses = [200, 429]
+        with ConcurrentStravaClient(rate_limiter=self.rate_limiter, client_factory=self.create_client) as client:
+            strava_activities = list(client.prefetch(client.get_activities(per_page=2)))
+        self.assertEqual([activity.id for activity in strava_activities], [1, 2, 3])
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.sleeps), 1)
+
+
+class ActivityAdminTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+        self.gear = Gear.objects.create(name='Shoes', type=Gear.TYPE.SHOE)
+        self.athlete = Athlete.objects.create(name='Athlete')
+        self.tag = Tag.objects.create(name='tag')
+
+    def create_activities(self, count, offset=0):
+        now = timezone.now()
+        Activity.objects.bulk_create([
+            Activity(
+                name=f'Activity {i}',
+                strava_id=i,
+                start=now - timedelta(days=i),
+                elapsed_time=timedelta(hours=1),
+                type=Activity.TYPE.RUN,
+            )
+            for i in range(offset, offset + count)
+        ])
+        activities = Activity.objects.filter(strava_id__gte=offset, strava_id__lt=offset + count)
+        Activity.gear.through.objects.bulk_create(
+            Activity.gear.through(activity=activity, gear=self.gear) for activity in activities
+        )
+        Activity.athletes.through.objects.bulk_create(
+            Activity.athletes.through(activity=activity, athlete=self.athlete) for activity in activities
+        )
+        Activity.tags.through.objects.bulk_create(
+            Activity.tags.through(activity=activity, tag=self.tag) for activity in activities
+        )
+
+    def get_changelist_queries_count(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('admin:activities_activity_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelist_queries_count_should_not_depend_on_number_of_activities(self):
+        self.create_activities(5)
+        queries_count = self.get_changelist_queries_count()
+        self.create_activities(995, offset=5)
+        self.assertEqual(self.get_changelist_queries_count(), queries_count)
+
+    def test_activity_str_should_use_prefetched_tags(self):
+        self.create_activities(1)
+        activity = Activity.objects.prefetch_related('tags').get()
+        with self.assertNumQueries(0):
+            self.assertEqual(str(activity), 'Activity 0 #tag')
+
+
+class DeletedStravaActivityClient(FakeStravaClient):
+
+    def get_activity(self, activity_id):
+        raise ObjectNotFound('Record Not Found')
+
+
+@override_settings(STRAVA_WEBHOOK_SUBSCRIPTION_ID=10, STRAVA_ATHLETE_ID=20)
+class StravaWebhookTestCase(TestCase):
+
+    def post_event(self, **event):
+        event = {
+            'object_type': 'activity', 'object_id': 1, 'aspect_type': 'delete', 'subscription_id': 10, 'owner_id': 20,
+            **event
+        }
+        return self.client.post(reverse('strava_webhook'), json.dumps(event), content_type='application/json')
+
+    def test_event_of_subscription_should_be_queued(self):
+        self.assertEqual(self.post_event().status_code, 200)
+        self.assertEqual(json.loads(Job.objects.get().arguments), {'strava_id': 1, 'deleted': True})
+
+    def test_events_of_other_subscriptions_and_athletes_should_be_rejected(self):
+        self.assertEqual(self.post_event(subscription_id=11).status_code, 403)
+        self.assertEqual(self.post_event(owner_id=21).status_code, 403)
+        self.assertEqual(self.post_event(subscription_id=None, owner_id=None).status_code, 403)
+        self.assertFalse(Job.objects.exists())
+
+    def test_updated_activity_should_replace_changed_gear(self):
+        strava_activity, = generate_strava_activities(1)
+        strava_activity.type, strava_activity.gear_id = 'Run', 'g1'
+        client = FakeStravaClient([strava_activity])
+        sync_strava_activity(1, client)
+        local_gear = Gear.objects.create(name='Local shoe', type=Gear.TYPE.SHOE)
+        Activity.objects.get(strava_id=1).gear.add(local_gear)
+
+        strava_activity.gear_id = 'g2'
+        sync_strava_activity(1, client)
+        self.assertEqual(
+            set(Activity.objects.get(strava_id=1).gear.values_list('name', flat=True)), {'Gear g2', 'Local shoe'}
+        )
+        self.assertFalse(Gear.objects.get(strava_id='g1').activities.exists())
+
+        strava_activity.gear_id = None
+        sync_strava_activity(1, client)
+        self.assertEqual(list(Activity.objects.get(strava_id=1).gear.values_list('name', flat=True)), ['Local shoe'])
+
+    def test_deleted_activity_should_be_kept_when_it_exists_on_strava(self):
+        client = FakeStravaClient(generate_strava_activities(1))
+        sync_strava_activity(1, client)
+        sync_strava_activity(1, client, deleted=True)
+        self.assertTrue(Activity.objects.filter(strava_id=1).exists())
+
+    def test_deleted_activity_should_be_removed_when_strava_does_not_find_it(self):
+        sync_strava_activity(1, FakeStravaClient(generate_strava_activities(1)))
+        sync_strava_activity(1, DeletedStravaActivityClient(), deleted=True)
+        self.assertFalse(Activity.objects.filter(strava_id=1).exists())
+
+
+class JobQueueTestCase(TestCase):
+
+    def test_running_jobs_should_be_requeued(self):
+        job, _ = enqueue_job(Job.KIND.IMPORT_NEW_ACTIVITIES)
+        Job.objects.filter(pk=job.pk).update(state=Job.STATE.RUNNING, worker='worker')
+        self.assertEqual(requeue_running_jobs(), 1)
+        self.assertEqual(Job.objects.get().state, Job.STATE.QUEUED)
+
+    def test_running_job_should_be_replaced_by_queued_job_with_the_same_key(self):
+        running_job = enqueue_strava_activity_sync(1)
+        Job.objects.filter(pk=running_job.pk).update(state=Job.STATE.RUNNING, worker='worker')
+        queued_job = enqueue_strava_activity_sync(1, deleted=True)
+        self.assertNotEqual(queued_job.pk, running_job.pk)
+        self.assertEqual(requeue_running_jobs(), 0)
+        self.assertEqual(list(Job.objects.values_list('pk', 'state')), [(queued_job.pk, Job.STATE.QUEUED)])
+
+
+class BulkActivityWriteTestCase(TestCase):
+
+    def setUp(self):
+        self.strava_activities = generate_strava_activities(3)
+
+    def build_activities(self, strava_activities):
+        return [build_activity_from_strava(strava_activity) for strava_activity in strava_activities]
+
+    def update_activities(self):
+        return bulk_update_activities_from_strava(self.strava_activities, FakeStravaClient(), GearCache())
+
+    def test_bulk_create_should_return_only_inserted_activities_with_primary_keys(self):
+        bulk_create_activities(self.build_activities(self.strava_activities[:1]))
+        created_activities = bulk_create_activities(self.build_activities(self.strava_activities))
+        self.assertEqual([activity.strava_id for activity in created_activities], [2, 3])
+        self.assertEqual(
+            {activity.pk: activity.strava_id for activity in created_activities},
+            dict(Activity.objects.filter(strava_id__in=[2, 3]).values_list('pk', 'strava_id'))
+        )
+        self.assertEqual(Activity.objects.count(), 3)
+
+    def test_bulk_create_should_store_all_fields(self):
+        activity, = bulk_create_activities(self.build_activities(self.strava_activities[:1]))
+        stored_activity = Activity.objects.get(pk=activity.pk)
+        for field in ('name', 'start', 'moving_time', 'elapsed_time', 'elevation_gain', 'type', 'kudos', 'commute',
+                      'strava_fingerprint'):
+            self.assertEqual(getattr(stored_activity, field), getattr(activity, field), field)
+        self.assertEqual(float(stored_activity.distance), float(activity.distance))
+
+    def test_bulk_create_from_strava_should_add_gear_of_activity_types_without_gear_type(self):
+        Gear.objects.create(strava_id='g1', name='Shoe', type=Gear.TYPE.SHOE)
+        walk, nordic_ski = self.strava_activities[:2]
+        walk.type, walk.gear_id = 'Walk', 'g1'
+        nordic_ski.type, nordic_ski.gear_id = 'NordicSki', 'g2'
+
+        activities, new_gear_count = bulk_create_activities_from_strava(
+            [walk, nordic_ski], FakeStravaClient(), GearCache()
+        )
+
+        self.assertEqual(len(activities), 2)
+        self.assertEqual(new_gear_count, 1)
+        self.assertEqual(list(Activity.objects.get(strava_id=walk.id).gear.values_list('name', 'type')),
+                         [('Shoe', Gear.TYPE.SHOE)])
+        self.assertEqual(list(Activity.objects.get(strava_id=nordic_ski.id).gear.values_list('strava_id', 'type')),
+                         [('g2', Gear.TYPE.OTHER)])
+
+    def test_bulk_update_should_write_only_activities_with_changed_fingerprint(self):
+        bulk_create_activities(self.build_activities(self.strava_activities))
+        changed_at = dict(Activity.objects.values_list('strava_id', 'changed_at'))
+        changed_strava_activity = self.strava_activities[1]
+        changed_strava_activity.name = 'Renamed'
+        changed_strava_activity.kudos_count += 1
+        changed_strava_activity.elapsed_time += timedelta(minutes=1)
+
+        updated_activities, activity_keys = self.update_activities()
+
+        self.assertEqual([activity.strava_id for activity in updated_activities], [2])
+        updated_activity = Activity.objects.get(strava_id=2)
+        self.assertEqual(updated_activity.name, 'Renamed')
+        self.assertEqual(updated_activity.kudos, changed_strava_activity.kudos_count)
+        self.assertEqual(updated_activity.elapsed_time, changed_strava_activity.elapsed_time)
+        self.assertEqual(updated_activity.strava_fingerprint, updated_activities[0].strava_fingerprint)
+        self.assertEqual(activity_keys, [(updated_activity.start, updated_activity.type)] * 2)
+        self.assertGreater(updated_activity.changed_at, changed_at[2])
+        self.assertEqual(
+            dict(Activity.objects.exclude(strava_id=2).values_list('strava_id', 'changed_at')),
+            {strava_id: value for strava_id, value in changed_at.items() if strava_id != 2}
+        )
+        self.assertEqual(self.update_activities(), ([], []))
+
+    def test_bulk_update_should_replace_changed_gear(self):
+        strava_activity = self.strava_activities[0]
+        strava_activity.type, strava_activity.gear_id = 'Run', 'g1'
+        bulk_create_activities_from_strava(self.strava_activities, FakeStravaClient(), GearCache())
+        activity = Activity.objects.get(strava_id=strava_activity.id)
+        previous_gear = activity.gear.get()
+        local_gear = Gear.objects.create(name='Local gear', type=Gear.TYPE.OTHER)
+        activity.gear.add(local_gear)
+
+        strava_activity.gear_id = 'g99'
+        updated_activities, _ = self.update_activities()
+        self.assertEqual([updated_activity.strava_id for updated_activity in updated_activities], [strava_activity.id])
+        self.assertEqual(set(activity.gear.values_list('name', flat=True)), {'Gear g99', 'Local gear'})
+        self.assertFalse(previous_gear.activities.filter(pk=activity.pk).exists())
+
+        strava_activity.gear_id = None
+        self.update_activities()
+        self.assertEqual(list(activity.gear.all()), [local_gear])
+
+
+class ParquetExportTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.strava_activities = generate_strava_activities(10)
+        bulk_create_activities([build_activity_from_strava(activity) for activity in self.strava_activities])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_reconciled_activity_partition_should_be_rewritten(self):
+        export_parquet(self.directory.name)
+        self.assertEqual(export_parquet(self.directory.name), [])
+
+        self.strava_activities[3].name = 'Renamed'
+        bulk_update_activities_from_strava(self.strava_activities, FakeStravaClient(), GearCache())
+        activity = Activity.objects.get(strava_id=4)
+        partition = get_partition_path(activity.start.year, activity.type)
+
+        self.assertEqual(export_parquet(self.directory.name), [partition])
+        table = pq.read_table(os.path.join(self.directory.name, partition, 'part-0.parquet'))
+        self.assertIn('Renamed', table.column('name').to_pylist())
+
+
+class StravaArchiveImportTestCase(TestCase):
+
+    header = 'Activity ID,Activity Date,Activity Name,Activity Type,Elapsed Time,Distance,Commute,Activity Gear'
+
+    def import_archive(self, *rows):
+        with tempfile.NamedTemporaryFile(suffix='.zip') as archive_file:
+            with zipfile.ZipFile(archive_file.name, 'w') as archive:
+                archive.writestr('activities.csv', '\n'.join([self.header, *rows]))
+            import_strava_archive(archive_file.name)
+
+    def test_rows_without_elapsed_time_should_be_skipped(self):
+        self.import_archive(
+            '1,"Jan 1, 2020, 7:00:00 AM",Morning Run,Run,3600,10.5,false,Shoes',
+            '2,"Jan 2, 2020, 7:00:00 AM",Broken Run,Run,,10.5,false,Shoes',
+        )
+        self.assertEqual(list(Activity.objects.values_list('strava_id', flat=True)), [1])
+
+    def test_archive_gear_should_get_strava_id_from_api(self):
+        self.import_archive('1,"Jan 1, 2020, 7:00:00 AM",Morning Run,Run,3600,10.5,false,Shoes')
+        archive_gear = Gear.objects.get(name='Shoes')
+        self.assertIsNone(archive_gear.strava_id)
+        gear = get_or_create_gear_from_strava(SimpleNamespace(id='g1', name='Shoes'), Gear.TYPE.SHOE)
+        self.assertEqual(gear.pk, archive_gear.pk)
+        self.assertEqual(Gear.objects.get().strava_id, 'g1')
+
+
+class StreamStoreTestCase(SimpleTestCase):
+
+    def test_missing_samples_should_not_be_stored_as_zeros(self):
+        for stream_type, data in (
+            (ActivityStream.TYPE.ALTITUDE, [250.5, None, 0.0]),
+            (ActivityStream.TYPE.HEARTRATE, [120, None, 0]),
+            (ActivityStream.TYPE.WATTS, [200, None, 0]),
+            (ActivityStream.TYPE.LATLNG, [[50.1, 14.4], None, [0.0, 0.0]]),
+        ):
+            stream = to_stream_array(stream_type, data)
+            self.assertEqual(get_present_samples(stream).tolist(), [True, False, True], stream_type)
+            self.assertEqual(stream[2].tolist(), [0, 0] if stream.ndim > 1 else 0, stream_type)
+
+    def test_heart_rate_load_should_not_count_missing_samples(self):
+        streams = {
+            ActivityStream.TYPE.TIME: to_stream_array(ActivityStream.TYPE.TIME, [0, 60, 120, 180]),
+            ActivityStream.TYPE.HEARTRATE: to_stream_array(ActivityStream.TYPE.HEARTRATE, [150, 150, None, None]),
+        }
+        self.assertAlmostEqual(
+            get_activity_load(None, streams),
+            get_heart_rate_load(streams[ActivityStream.TYPE.TIME][:2], streams[ActivityStream.TYPE.HEARTRATE][:2])
+        )
+
+
+class GearCacheTestCase(TestCase):
+
+    def test_gear_should_be_fetched_once_per_distinct_id_across_pages(self):
+        activities = generate_strava_activities(30, gear_count=3)
+        client = FakeStravaClient(activities)
+        gear_cache = GearCache()
+        pages = list(chunked(activities, 10))
+        for page in pages:
+            bulk_create_activities_from_strava(page, client, gear_cache)
+
+        gear_ids = {activity.gear_id for activity in activities if activity.gear_id}
+        page_gear_counts = [len({activity.gear_id for activity in page if activity.gear_id}) for page in pages]
+        self.assertEqual(client.calls['get_gear'], len(gear_ids))
+        self.assertEqual(gear_cache.misses, len(gear_ids))
+        self.assertEqual(gear_cache.hits, sum(page_gear_counts) - len(gear_ids))
+        self.assertEqual(set(Gear.objects.values_list('strava_id', flat=True)), gear_ids)
+
+    def test_cache_should_be_prewarmed_from_stored_gear(self):
+        Gear.objects.create(strava_id='g1', name='Shoe', type=Gear.TYPE.SHOE)
+        client = FakeStravaClient()
+        gear_cache = GearCache()
+        gear, created = gear_cache.get('g1', Gear.TYPE.SHOE, client)
+        self.assertEqual((gear.name, created), ('Shoe', False))
+        self.assertEqual((gear_cache.hits, gear_cache.misses), (1, 0))
+        self.assertEqual(client.calls, {})
+
+    def test_gear_of_activity_types_without_gear_type_should_be_added(self):
+        strava_activities = generate_strava_activities(3)
+        for strava_activity, gear_id in zip(strava_activities, ('g1', 'g2', 'g3')):
+            strava_activity.type, strava_activity.gear_id = 'NordicSki', gear_id
+        bulk_create_activities([build_activity_from_strava(activity) for activity in strava_activities])
+        Gear.objects.create(strava_id='g1', name='Skis', type=Gear.TYPE.OTHER)
+        client = FakeStravaClient()
+        gear_cache = GearCache()
+
+        self.assertFalse(create_and_add_gear_to_activity_if_needed(strava_activities[0], client, gear_cache))
+        self.assertTrue(create_and_add_gear_to_activity_if_needed(strava_activities[1], client, gear_cache))
+        self.assertTrue(create_and_add_gear_to_activity_if_needed(strava_activities[2], client))
+
+        self.assertEqual((gear_cache.hits, gear_cache.misses), (1, 1))
+        self.assertEqual(client.calls, {'get_gear': 2})
+        activity_gear = Activity.gear.through.objects.order_by('activity__strava_id')
+        self.assertEqual(
+            list(activity_gear.values_list('gear__strava_id', 'gear__type')),
+            [('g1', Gear.TYPE.OTHER), ('g2', Gear.TYPE.OTHER), ('g3', Gear.TYPE.OTHER)]
+        )
+
+
+class FakeStravaClientTestCase(TestCase):
+
+    def test_generated_activities_should_be_stable_for_seed(self):
+        activities = generate_strava_activities(50, seed=1)
+        self.assertEqual(
+            [(activity.type, activity.gear_id, activity.moving_time) for activity in activities],
+            [(activity.type, activity.gear_id, activity.moving_time)
+             for activity in generate_strava_activities(50, seed=1)]
+        )
+        self.assertNotEqual(
+            [activity.moving_time for activity in activities],
+            [activity.moving_time for activity in generate_strava_activities(50, seed=2)]
+        )
+        self.assertEqual(len({activity.id for activity in activities}), 50)
+        self.assertTrue(all(
+            (activity.gear_id is not None) == (activity.type in ('Run', 'Ride', 'Hike')) for activity in activities
+        ))
+
+    def test_client_should_filter_activities_like_strava(self):
+        activities = generate_strava_activities(5)
+        client = FakeStravaClient(activities)
+        self.assertEqual([activity.id for activity in client.get_activities(after=activities[1].start_date)], [3, 4, 5])
+        self.assertEqual([activity.id for activity in client.get_activities(before=activities[2].start_date)], [2, 1])
+        self.assertEqual(client.get_activity(4), activities[3])
+        self.assertEqual(client.map('get_gear', ['g1', 'g2'])[1].name, 'Gear g2')
+        self.assertEqual(client.calls, {'get_activities': 2, 'get_activity': 1, 'get_gear': 2})
+
+    def test_import_should_store_generated_activities_with_gear(self):
+        activities = generate_strava_activities(30, gear_count=3)
+        client = FakeStravaClient(activities)
+        sync_state = SyncState.objects.create(name='test')
+        import_strava_activities(client, client.get_activities(), sync_state, 10, min)
+        self.assertEqual(Activity.objects.count(), 30)
+        self.assertEqual(
+            Activity.gear.through.objects.count(), len([activity for activity in activities if activity.gear_id])
+        )
+        self.assertEqual(client.calls['get_gear'], Gear.objects.count())
+
+
+class ActivitySearchTestCase(TestCase):
+
+    def create_activity(self, name, activity_type=Activity.TYPE.RUN, start=None):
+        return Activity.objects.create(
+            name=name,
+            start=start or timezone.now(),
+            elapsed_time=timedelta(hours=1),
+            type=activity_type,
+        )
+
+    def search(self, query):
+        return [activity.name for activity in search_activities(query)]
+
+    def get_indexed_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE}')
+            return cursor.fetchone()[0]
+
+    def test_created_and_renamed_activity_should_be_indexed(self):
+        activity = self.create_activity('Morning Run')
+        self.assertEqual(self.search('morning'), ['Morning Run'])
+        activity.name = 'Evening Run'
+        activity.save()
+        self.assertEqual(self.search('morning'), [])
+        self.assertEqual(self.search('evening'), ['Evening Run'])
+
+    def test_tag_changes_should_be_indexed(self):
+        activity = self.create_activity('Morning Run')
+        tag = Tag.objects.create(name='intervals')
+        activity.tags.add(tag)
+        self.assertEqual(self.search('intervals'), ['Morning Run'])
+        activity.tags.remove(tag)
+        self.assertEqual(self.search('intervals'), [])
+        activity.tags.add(tag)
+        activity.tags.clear()
+        self.assertEqual(self.search('intervals'), [])
+        tag.activities.add(activity)
+        self.assertEqual(self.search('intervals'), ['Morning Run'])
+        tag.activities.clear()
+        self.assertEqual(self.search('intervals'), [])
+
+    def test_athlete_changes_should_be_indexed(self):
+        activity = self.create_activity('Morning Run')
+        athlete = Athlete.objects.create(name='Emil')
+        activity.athletes.add(athlete)
+        self.assertEqual(self.search('emil'), ['Morning Run'])
+        athlete.name = 'Paula'
+        athlete.save()
+        self.assertEqual(self.search('emil'), [])
+        self.assertEqual(self.search('paula'), ['Morning Run'])
+        athlete.delete()
+        self.assertEqual(self.search('paula'), [])
+
+    def test_deleted_activity_should_be_removed_from_index(self):
+        self.create_activity('Morning Run').delete()
+        self.assertEqual(self.search('morning'), [])
+        self.assertEqual(self.get_indexed_count(), 0)
+
+    def test_all_words_should_be_matched_as_prefixes(self):
+        self.create_activity('Morning Run in Prague')
+        self.create_activity('Morning Ride')
+        self.create_activity('Evening Run in Prague')
+        self.assertEqual(self.search('mor pra'), ['Morning Run in Prague'])
+        self.assertEqual(sorted(self.search('run prag')), ['Evening Run in Prague', 'Morning Run in Prague'])
+        self.assertEqual(self.search('morn ride evening'), [])
+
+    def test_name_match_should_rank_above_tag_match(self):
+        self.create_activity('Hill repeats', start=timezone.now())
+        tagged_activity = self.create_activity('Morning Run', start=timezone.now() + timedelta(hours=1))
+        tagged_activity.tags.add(Tag.objects.create(name='hill'))
+        self.assertEqual(self.search('hill'), ['Hill repeats', 'Morning Run'])
+
+    def test_facets_should_count_filtered_results(self):
+        gear = Gear.objects.create(name='Shoes', type=Gear.TYPE.SHOE)
+        now = timezone.now()
+        last_year = now.replace(year=now.year - 1)
+        self.create_activity('Park run', start=now).gear.add(gear)
+        self.create_activity('Park run', start=last_year).gear.add(gear)
+        self.create_activity('Park ride', activity_type=Activity.TYPE.RIDE, start=now)
+        self.create_activity('Lake run', start=now)
+
+        response = self.client.get(reverse('search'), {'q': 'park'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['facets']['type'], [{'type': 'Run', 'count': 2}, {'type': 'Ride', 'count': 1}])
+        self.assertEqual(data['facets']['year'], [
+            {'year': now.year, 'count': 2}, {'year': last_year.year, 'count': 1}
+        ])
+        self.assertEqual(data['facets']['gear'], [{'id': gear.pk, 'name': 'Shoes', 'count': 2}])
+
+        data = self.client.get(reverse('search'), {'q': 'park', 'type': 'run', 'year': now.year}).json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['facets']['year'], [{'year': now.year, 'count': 1}])
+
+        data = self.client.get(reverse('search'), {'q': 'park', 'gear': gear.pk}).json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['facets']['type'], [{'type': 'Run', 'count': 2}])
+        self.assertEqual([result['name'] for result in data['results']], ['Park run', 'Park run'])
+
+
+class TrainingLoadTestCase(TestCase):
+
+    def get_training_load(self):
+        return {
+            (date, activity_type): values
+            for date, activity_type, *values in TrainingLoad.objects.values_list(
+                'date', 'activity_type', 'load', 'fitness', 'fatigue'
+            )
+        }
+
+    def test_incremental_recompute_after_idle_gap_should_equal_full_recompute(self):
+        now = timezone.now()
+        # Training load is stored only until the day of the first import, ten days before the second one
+        with patch('utils.models.training_load.timezone.now', return_value=now - timedelta(days=30)):
+            for days in (60, 45, 31):
+                Activity.objects.create(name='Run', start=now - timedelta(days=days), elapsed_time=timedelta(hours=1),
+                                        type=Activity.TYPE.RUN)
+        Activity.objects.create(name='Ride', start=now - timedelta(days=20), elapsed_time=timedelta(hours=2),
+                                type=Activity.TYPE.RIDE)
+        incremental = self.get_training_load()
+
+        recompute_training_load()
+        full = self.get_training_load()
+        self.assertTrue(set(incremental).issubset(full))
+        for key, full_values in full.items():
+            # Rows of a type before its first activity are created only by the full recompute and contain zeros
+            for incremental_value, full_value in zip(incremental.get(key, (0.0, 0.0, 0.0)), full_values):
+                self.assertAlmostEqual(incremental_value, full_value)
+
+
+class RateLimitedStravaClient(FakeStravaClient):
+    """
+    Fake client whose rate limit is exhausted after given number of fetched activity summaries.
+    """
+
+    def __init__(self, strava_activities=(), exhausted_after=None):
+        super().__init__(strava_activities)
+        self.exhausted_after = exhausted_after
+        self.fetched_ids = []
+
+    def get_activities(self, before=None, after=None):
+        for strava_activity in super().get_activities(before, after):
+            if len(self.fetched_ids) == self.exhausted_after:
+                raise RateLimitExhausted(60)
+            self.fetched_ids.append(strava_activity.id)
+            yield strava_activity
+
+
+class ResumableImportTestCase(TestCase):
+
+    def import_all_activities(self, client):
+        with patch('activities.management.commands.import_all_activities.ConcurrentStravaClient') as client_class:
+            client_class.return_value.__enter__.return_value = client
+            import_all_activities(page_size=10)
+
+    def test_interrupted_import_should_resume_from_checkpoint(self):
+        strava_activities = generate_strava_activities(25, start=timezone.now() - timedelta(days=10))
+        with self.assertRaises(RateLimitExhausted):
+            self.import_all_activities(RateLimitedStravaClient(strava_activities, exhausted_after=15))
+
+        # Only the first page with the ten newest activities was finished
+        sync_state = SyncState.objects.get(name=SYNC_STATE_NAME)
+        self.assertEqual(sync_state.page, 1)
+        self.assertEqual(sync_state.cursor, strava_activities[15].start_date)
+        self.assertEqual(set(Activity.objects.values_list('strava_id', flat=True)), set(range(16, 26)))
+
+        client = RateLimitedStravaClient(strava_activities)
+        self.import_all_activities(client)
+        self.assertEqual(client.fetched_ids, list(range(15, 0, -1)))
+        self.assertEqual(Activity.objects.count(), 25)
+        sync_state.refresh_from_db()
+        self.assertEqual((sync_state.cursor, sync_state.page), (None, 0))
+        self.assertIsNotNone(sync_state.completed_at)
+
+
+class ActivityRollupTestCase(TestCase):
+
+    def setUp(self):
+        self.runs = [
+            self.create_activity(datetime(2025, 3, 3, 8), 10000),
+            self.create_activity(datetime(2025, 3, 5, 18), 5000),
+            self.create_activity(datetime(2026, 7, 10, 9), 21100),
+        ]
+        self.gear = Gear.objects.create(name='Shoe', type=Gear.TYPE.SHOE)
+
+    def create_activity(self, start, distance, activity_type=Activity.TYPE.RUN):
+        return Activity.objects.create(
+            name='Run', start=timezone.make_aware(start), distance=distance, moving_time=timedelta(hours=1),
+            elapsed_time=timedelta(hours=1), elevation_gain=100, kudos=3, type=activity_type
+        )
+
+    def get_rollups(self):
+        return sorted(ActivityRollup.objects.values_list(
+            'period', 'period_start', 'type', 'gear', 'distance', 'moving_time', 'elevation_gain', 'count', 'kudos'
+        ), key=str)
+
+    def assert_rollups_rebuilt(self):
+        rollups = self.get_rollups()
+        rebuild_rollups()
+        self.assertEqual(rollups, self.get_rollups())
+
+    def test_created_activities_should_be_rolled_up(self):
+        self.assert_rollups_rebuilt()
+        self.assertEqual(
+            ActivityRollup.objects.get(period=ActivityRollup.PERIOD.WEEK, period_start='2025-03-03').count, 2
+        )
+
+    def test_edited_activity_should_be_rolled_up(self):
+        self.runs[0].distance = 12000
+        self.runs[0].kudos = 10
+        self.runs[0].save()
+        self.assert_rollups_rebuilt()
+        # The activity is moved to another week, month and year
+        self.runs[1].start = timezone.make_aware(datetime(2026, 7, 13, 7))
+        self.runs[1].save()
+        self.assert_rollups_rebuilt()
+
+    def test_retyped_activity_should_be_rolled_up(self):
+        self.runs[0].gear.add(self.gear)
+        self.runs[0].type = Activity.TYPE.HIKE
+        self.runs[0].save()
+        self.assert_rollups_rebuilt()
+
+    def test_deleted_activity_should_be_removed_from_rollups(self):
+        self.runs[0].gear.add(self.gear)
+        self.runs[0].delete()
+        self.assert_rollups_rebuilt()
+        self.runs[2].delete()
+        self.assert_rollups_rebuilt()
+        self.assertFalse(ActivityRollup.objects.filter(period_start__year=2026).exists())
+
+    def test_gear_changes_should_be_rolled_up(self):
+        self.runs[0].gear.add(self.gear)
+        self.assert_rollups_rebuilt()
+        self.gear.activities.add(self.runs[1], self.runs[2])
+        self.assert_rollups_rebuilt()
+        self.runs[1].gear.remove(self.gear)
+        self.assert_rollups_rebuilt()
+        self.gear.activities.clear()
+        self.assert_rollups_rebuilt()
+        self.assertFalse(ActivityRollup.objects.filter(gear=self.gear).exists())
+
+
+class EquipmentLedgerTestCase(TestCase):
+
+    def setUp(self):
+        self.runs = [
+            self.create_activity(datetime(2025, 3, 3, 8), 10000),
+            self.create_activity(datetime(2025, 3, 5, 18), 5000),
+        ]
+        self.gear = Gear.objects.create(name='Shoe', type=Gear.TYPE.SHOE, retirement_distance=20000)
+        self.accessory = Accessory.objects.create(name='Insole', gear=self.gear, retirement_distance=12000)
+        self.gear.activities.add(*self.runs)
+        self.accessory.activities.add(*self.runs)
+
+    def create_activity(self, start, distance):
+        return Activity.objects.create(
+            name='Run', start=timezone.make_aware(start), distance=distance, moving_time=timedelta(hours=1),
+            elapsed_time=timedelta(hours=1), type=Activity.TYPE.RUN
+        )
+
+    def assert_ledgers_reconciled(self):
+        self.assertEqual(reconcile_ledgers(fix=False), [])
+
+    def test_ledgers_should_contain_totals_of_linked_activities(self):
+        self.assert_ledgers_reconciled()
+        self.gear.refresh_from_db()
+        self.assertEqual(
+            (self.gear.total_distance, self.gear.total_moving_time, self.gear.activity_count),
+            (15000, timedelta(hours=2), 2)
+        )
+        self.assertEqual((self.gear.first_used, self.gear.last_used), (self.runs[0].start, self.runs[1].start))
+
+    def test_edited_retyped_and_deleted_activities_should_update_ledgers(self):
+        self.runs[0].distance = 12000
+        self.runs[0].start = timezone.make_aware(datetime(2025, 2, 1, 8))
+        self.runs[0].save()
+        self.assert_ledgers_reconciled()
+        self.runs[1].type = Activity.TYPE.HIKE
+        self.runs[1].save()
+        self.assert_ledgers_reconciled()
+        self.runs[0].delete()
+        self.assert_ledgers_reconciled()
+        self.assertEqual(Gear.objects.get(pk=self.gear.pk).activity_count, 1)
+
+    def test_equipment_changes_should_update_ledgers(self):
+        other_run = self.create_activity(datetime(2025, 3, 7, 8), 8000)
+        other_run.gear.add(self.gear)
+        other_run.accessories.add(self.accessory)
+        self.assert_ledgers_reconciled()
+        self.runs[0].gear.remove(self.gear)
+        self.runs[0].accessories.remove(self.accessory)
+        self.assert_ledgers_reconciled()
+        self.gear.activities.clear()
+        self.accessory.activities.clear()
+        self.assert_ledgers_reconciled()
+        self.assertEqual(Accessory.objects.get(pk=self.accessory.pk).total_distance, 0)
+
+    def test_drifted_ledger_should_be_fixed(self):
+        Gear.objects.filter(pk=self.gear.pk).update(total_distance=1)
+        self.assertEqual(reconcile_ledgers(), [self.gear])
+        self.assert_ledgers_reconciled()
+
+    def test_equipment_over_retirement_distance_should_be_retired(self):
+        self.gear.refresh_from_db()
+        self.accessory.refresh_from_db()
+        self.assertFalse(self.gear.should_be_retired)
+        self.assertTrue(self.accessory.should_be_retired)
+        self.runs[0].distance = 15000
+        self.runs[0].save()
+        self.gear.refresh_from_db()
+        self.assertTrue(self.gear.should_be_retired)
+        self.gear.retirement_distance = None
+        self.assertFalse(self.gear.should_be_retired)
+
+
+class BestEffortsTestCase(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        # Whole meters keep the brute force sums exact, gaps longer than one second are pauses
+        self.time = np.cumsum(rng.randint(1, 4, 300))
+        self.distance = np.cumsum(rng.randint(0, 9, 300))
+        self.watts = rng.randint(0, 400, 300)
+
+    def get_brute_force_distance_efforts(self, windows):
+        efforts = {}
+        for window in windows:
+            for i in range(len(self.time)):
+                for j in range(i, len(self.time)):
+                    if self.distance[j] - self.distance[i] >= window:
+                        duration = self.time[j] - self.time[i]
+                        if window not in efforts or duration < efforts[window][0]:
+                            efforts[window] = (duration, self.time[i])
+                        break
+        return efforts
+
+    def get_brute_force_power_efforts(self, windows):
+        power_by_second = dict(zip(self.time.tolist(), self.watts.tolist()))
+        first_second, last_second = self.time[0], self.time[-1]
+        efforts = {}
+        for window in windows:
+            for start in range(first_second, last_second - window + 2):
+                average_power = sum(power_by_second.get(second, 0) for second in range(start, start + window)) / window
+                if window not in efforts or average_power > efforts[window][0]:
+                    efforts[window] = (average_power, start)
+        return efforts
+
+    def test_distance_efforts_should_match_brute_force_search(self):
+        windows = (1, 50, 100, 400, 1000, 100000)
+        efforts = compute_distance_efforts(self.time, self.distance, windows)
+        self.assertEqual(efforts, self.get_brute_force_distance_efforts(windows))
+        self.assertNotIn(100000, efforts)
+
+    def test_power_efforts_should_match_brute_force_search(self):
+        windows = (1, 5, 30, 120, 600, 100000)
+        efforts = compute_power_efforts(self.time, self.watts, windows)
+        brute_force_efforts = self.get_brute_force_power_efforts(windows)
+        self.assertEqual(efforts.keys(), brute_force_efforts.keys())
+        self.assertNotIn(100000, efforts)
+        for window, (power, start_time) in efforts.items():
+            self.assertAlmostEqual(power, brute_force_efforts[window][0])
+            self.assertEqual(start_time, brute_force_efforts[window][1])
+
+
+class GeoTestCase(SimpleTestCase):
+
+    def test_polyline_should_be_encoded_like_google(self):
+        points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        self.assertEqual(encode_polyline(points), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(decode_polyline('_p~iF~ps|U_ulLnnqC_mqNvxq`@'), points)
+
+    def test_decoded_polyline_should_round_trip(self):
+        rng = np.random.RandomState(0)
+        points = [
+            (round(latitude, 5), round(longitude, 5))
+            for latitude, longitude in zip(rng.uniform(-89, 89, 100), rng.uniform(-179, 179, 100))
+        ]
+        self.assertEqual(decode_polyline(encode_polyline(points)), points)
+        self.assertEqual(decode_polyline(''), [])
+
+    def test_straight_polyline_should_be_simplified_to_its_ends(self):
+        points = [(50.08, 14.40 + i * 0.001) for i in range(51)]
+        self.assertEqual(simplify_polyline(points, 1), [points[0], points[-1]])
+
+    def test_geohash_should_match_reference_values(self):
+        self.assertEqual(encode_geohash(42.6, -5.6, 5), 'ezs42')
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(get_cell_size(6), (180 / 2 ** 15, 360 / 2 ** 15))
+
+    def test_cells_should_cover_bounding_box_and_polyline(self):
+        height, width = get_cell_size()
+        cells = get_cells_in_bbox(50.07, 14.39, 50.09, 14.43)
+        for latitude in np.linspace(50.07, 50.09, 25):
+            for longitude in np.linspace(14.39, 14.43, 25):
+                self.assertIn(encode_geohash(latitude, longitude), cells)
+        self.assertLessEqual(len(cells), (0.02 / height + 2) * (0.04 / width + 2))
+
+        points = [(50.07, 14.39), (50.09, 14.43), (50.08, 14.45)]
+        polyline_cells = get_polyline_cells(points)
+        for start, end in zip(points, points[1:]):
+            for share in np.linspace(0, 1, 200):
+                self.assertIn(
+                    encode_geohash(start[0] + (end[0] - start[0]) * share, start[1] + (end[1] - start[1]) * share),
+                    polyline_cells
+                )
+
+
+class ActivityRouteTestCase(TestCase):
+
+    def create_activity(self, name, points):
+        return Activity.objects.create(
+            name=name, start=timezone.now(), elapsed_time=timedelta(hours=1), type=Activity.TYPE.RUN,
+            route_polyline=encode_polyline(points)
+        )
+
+    def setUp(self):
+        # About 3.6 km long routes along a parallel, the shifted one is 30 m north
+        self.route = self.create_activity('Route', [(50.08, 14.40), (50.08, 14.45)])
+        self.shifted_route = self.create_activity('Shifted route', [(50.08027, 14.40), (50.08027, 14.45)])
+        self.half_route = self.create_activity('Half route', [(50.08, 14.40), (50.08, 14.425)])
+        self.distant_route = self.create_activity('Distant route', [(50.2, 14.40), (50.2, 14.45)])
+
+    def get_names(self, activities):
+        return {activity.name for activity in activities}
+
+    def test_activities_passing_near_point_should_be_found(self):
+        self.assertEqual(self.get_names(get_activities_near(50.08, 14.42)), {'Route', 'Shifted route', 'Half route'})
+        self.assertEqual(self.get_names(get_activities_near(50.08, 14.44)), {'Route', 'Shifted route'})
+        self.assertEqual(self.get_names(get_activities_near(50.0815, 14.44, radius=150)), {'Shifted route'})
+        self.assertEqual(get_activities_near(50.14, 14.42), [])
+
+    def test_activities_with_the_same_route_should_match(self):
+        matches = get_matching_activities(self.route)
+        self.assertEqual([activity.name for activity, _ in matches], ['Shifted route'])
+        self.assertGreaterEqual(matches[0][1], 0.9)
+        self.assertEqual(get_matching_activities(self.distant_route), [])
+
+    def test_changed_route_should_be_reindexed(self):
+        self.half_route.route_polyline = encode_polyline([(50.08, 14.40), (50.08, 14.45)])
+        self.half_route.save()
+        self.assertEqual(
+            {activity.name for activity, _ in get_matching_activities(self.route)}, {'Half route', 'Shifted route'}
+        )
+
+
+class ActivityApiTestCase(TestCase):
+
+    def setUp(self):
+        # Cached responses of previous tests must not be returned for the data of this one
+        cache.clear()
+        start = timezone.now() - timedelta(days=1)
+        self.activities = [
+            Activity.objects.create(
+                name=f'Run {i}', start=start if i < 7 else start - timedelta(hours=i), elapsed_time=timedelta(hours=1),
+                type=Activity.TYPE.RUN
+            )
+            for i in range(10)
+        ]
+
+    def get_activity_list(self, **headers):
+        return self.client.get(reverse('activity_list'), **headers)
+
+    def test_unchanged_response_should_not_be_modified(self):
+        response = self.get_activity_list()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'])
+        self.assertTrue(response['Last-Modified'])
+        response = self.get_activity_list(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_saved_activity_should_invalidate_response(self):
+        etag = self.get_activity_list()['ETag']
+        activity = self.activities[9]
+        activity.name = 'Renamed'
+        activity.save()
+
+        response = self.get_activity_list(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Renamed', [result['name'] for result in response.json()['results']])
+
+    def test_pages_should_contain_every_activity_once(self):
+        url = f'{reverse("activity_list")}?limit=3'
+        pages = []
+        while url:
+            response = self.client.get(url).json()
+            pages.append([result['id'] for result in response['results']])
+            url = response['next']
+            if len(pages) == 1:
+                # Activities created during pagination do not shift the following pages
+                Activity.objects.create(name='New run', start=timezone.now(), elapsed_time=timedelta(hours=1),
+                                        type=Activity.TYPE.RUN)
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 1])
+        activities = sorted(self.activities, key=lambda activity: (activity.start, activity.pk), reverse=True)
+        self.assertEqual([pk for page in pages for pk in page], [activity.pk for activity in activities])
+
+    def test_invalid_parameters_should_be_rejected(self):
+        self.assertEqual(self.client.get(reverse('activity_list'), {'cursor': 'invalid'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('activity_list'), {'type': 'invalid'}).status_code, 400)
+
+
+class ImportMetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.server = FakeStravaServer()
+        self.server.rate_limit_usage = '100,2000'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_client(self, rate_limiter=None):
+        client = create_strava_client(rate_limiter=rate_limiter)
+        client.protocol._resolve_url = lambda url, use_webhook_server: f'{self.server.url}/api/v3/{url.strip("/")}'
+        return client
+
+    def test_import_run_should_record_queries_api_calls_and_rate_limit_headroom(self):
+        with ImportMetrics('test-import') as metrics, \
+                ConcurrentStravaClient(metrics=metrics, client_factory=self.create_client) as client:
+            client.map('get_gear', ['g1', 'g2', 'g3'])
+            with metrics.phase('store'):
+                Gear.objects.create(name='Shoe', type=Gear.TYPE.SHOE)
+                list(Gear.objects.all())
+            metrics.increment('created_gear')
+
+        run = ImportRun.objects.get()
+        run_metrics = json.loads(run.metrics)
+        self.assertEqual((run.name, run.succeeded), ('test-import', True))
+        self.assertEqual(run_metrics['phases']['store']['query_count'], 2)
+        self.assertEqual(run.query_count, sum(phase['query_count'] for phase in run_metrics['phases'].values()))
+        self.assertEqual(run.api_call_count, 3)
+        self.assertEqual(sum(run_metrics['api_latency_histogram'].values()), 3)
+        self.assertGreater(run.api_time, 0)
+        self.assertEqual((run.short_rate_limit_headroom, run.long_rate_limit_headroom), (500, 28000))
+        self.assertEqual(run_metrics['counters'], {'created_gear': 1})
+
+    def test_failed_import_run_should_be_recorded(self):
+        with self.assertRaises(RateLimitExhausted), ImportMetrics('test-import'):
+            raise RateLimitExhausted(60)
+        run = ImportRun.objects.get()
+        self.assertFalse(run.succeeded)
+        self.assertEqual((run.api_call_count, run.short_rate_limit_headroom), (0, None))
+
+    def test_prometheus_text_file_should_be_written(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(IMPORT_METRICS_PROMETHEUS_DIR=directory):
+            with ImportMetrics('test-import') as metrics:
+                with metrics.phase('store'):
+                    Gear.objects.count()
+                for latency in (0.05, 0.3, 0.3, 20):
+                    metrics.record_api_call(latency)
+                metrics.increment('created_activities', 5)
+            self.assertEqual(os.listdir(directory), ['strats_import_test-import.prom'])
+            with open(os.path.join(directory, 'strats_import_test-import.prom')) as f:
+                text = f.read()
+
+        self.assertEqual(text, get_prometheus_text(ImportRun.objects.get()))
+        samples = {}
+        for line in text.splitlines():
+            if line.startswith('#'):
+                self.assertEqual(line, '# TYPE strats_import_api_latency_seconds histogram')
+                continue
+            self.assertRegex(line, r'^[a-z_]+\{import="test-import"(,[a-z]+="[^"]+")*\} -?[0-9.]+$')
+            series, value = line.rsplit(' ', 1)
+            samples[series] = float(value)
+        self.assertEqual(samples['strats_import_created_activities_total{import="test-import"}'], 5)
+        self.assertEqual(samples['strats_import_phase_db_queries_total{import="test-import",phase="store"}'], 1)
+        buckets = [
+            value for series, value in samples.items() if series.startswith('strats_import_api_latency_seconds_bucket')
+        ]
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(buckets[:3], [1, 1, 3])
+        self.assertEqual(samples['strats_import_api_latency_seconds_bucket{import="test-import",le="+Inf"}'], 4)
+        self.assertEqual(samples['strats_import_api_latency_seconds_count{import="test-import"}'], 4)
@@ -5,4 +5,13 @@ from . import views
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('api/activities/', views.activity_list, name='activity_list'),
+    path('api/activities/near/', views.activities_near, name='activities_near'),
+    path('api/activities/<int:pk>/matching/', views.matching_activities, name='matching_activities'),
+    path('api/search/', views.search, name='search'),
+    path('api/stats/', views.stats, name='stats'),
+    path('api/jobs/', views.enqueue_job_view, name='enqueue_job'),
+    path('api/jobs/<int:pk>/', views.job_detail, name='job_detail'),
+    path('strava/webhook/', views.strava_webhook, name='strava_webhook'),
+    path('api/health/', views.health, name='health'),
 ]
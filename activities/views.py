@@ -1,5 +1,296 @@
-from django.http import HttpResponse
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.dateparse import parse_date
+from django.utils.http import urlencode
+from django.utils.timezone import utc
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+from utils.cache import cached_activities_json
+from utils.db import is_database_healthy
+from utils.jobs import enqueue_job, enqueue_strava_activity_sync
+from utils.models.routes import DEFAULT_NEAR_RADIUS, get_activities_near, get_matching_activities
+from utils.models.search import get_search_facets, search_activities
+
+from .models import Activity, ActivityRollup, Job
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_NEAR_RADIUS = 5000
 
 
 def index(request):
     return HttpResponse("Hello, world. You're at the activities index.")
+
+
+@require_GET
+def health(request):
+    healthy = is_database_healthy()
+    return JsonResponse({'database': healthy}, status=200 if healthy else 503)
+
+
+def _get_choice(enum, value, name):
+    choice = getattr(enum, value.upper(), None)
+    if not isinstance(choice, int):
+        raise ValueError(f'Invalid {name} "{value}".')
+    return choice
+
+
+def _get_int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid {name} "{value}".')
+
+
+def _get_float(value, name):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid {name} "{value}".')
+
+
+def _encode_cursor(activity):
+    return f'{int(activity.start.timestamp() * 10 ** 6)}_{activity.pk}'
+
+
+def _decode_cursor(cursor):
+    try:
+        timestamp, pk = (int(value) for value in cursor.split('_'))
+    except ValueError:
+        raise ValueError(f'Invalid cursor "{cursor}".')
+    return datetime.fromtimestamp(timestamp / 10 ** 6, tz=utc), pk
+
+
+def _serialize_activity(activity):
+    return {
+        'id': activity.pk,
+        'strava_id': activity.strava_id,
+        'name': activity.name,
+        'type': activity.get_type_display(),
+        'start': activity.start.isoformat(),
+        'distance': float(activity.distance) if activity.distance is not None else None,
+        'moving_time': activity.moving_time.total_seconds() if activity.moving_time is not None else None,
+        'elapsed_time': activity.elapsed_time.total_seconds(),
+        'elevation_gain': activity.elevation_gain,
+        'kudos': activity.kudos,
+        'race': activity.race,
+        'commute': activity.commute,
+    }
+
+
+@cached_activities_json
+def activity_list(request):
+    """
+    Activities from the newest one with keyset pagination on start, next page is requested with cursor
+    from the previous response.
+    """
+    limit = min(_get_int(request.GET.get('limit', DEFAULT_PAGE_SIZE), 'limit'), MAX_PAGE_SIZE)
+    activities = Activity.objects.order_by('-start', '-pk')
+    if 'type' in request.GET:
+        activities = activities.filter(type=_get_choice(Activity.TYPE, request.GET['type'], 'type'))
+    if 'cursor' in request.GET:
+        start, pk = _decode_cursor(request.GET['cursor'])
+        activities = activities.filter(Q(start__lt=start) | Q(start=start, pk__lt=pk))
+
+    activities = list(activities[:limit + 1])
+    next_url = None
+    if len(activities) > limit:
+        activities = activities[:limit]
+        next_url = '{}?{}'.format(
+            reverse('activity_list'),
+            urlencode({**request.GET.dict(), 'cursor': _encode_cursor(activities[-1])})
+        )
+    return {
+        'results': [_serialize_activity(activity) for activity in activities],
+        'next': next_url,
+    }
+
+
+@cached_activities_json
+def activities_near(request):
+    """
+    Activities passing within radius (m) of the point given by lat and lng, from the newest one.
+    """
+    radius = _get_float(request.GET.get('radius', DEFAULT_NEAR_RADIUS), 'radius')
+    if not 0 < radius <= MAX_NEAR_RADIUS:
+        raise ValueError(f'Radius must be between 0 and {MAX_NEAR_RADIUS} m.')
+    activities = get_activities_near(
+        _get_float(request.GET.get('lat'), 'lat'), _get_float(request.GET.get('lng'), 'lng'), radius
+    )
+    return {
+        'results': [
+            _serialize_activity(activity)
+            for activity in sorted(activities, key=lambda activity: activity.start, reverse=True)
+        ],
+    }
+
+
+@cached_activities_json
+def matching_activities(request, pk):
+    """
+    Activities with the same route as the given one, from the most similar one.
+    """
+    return {
+        'results': [
+            {**_serialize_activity(activity), 'similarity': round(similarity, 3)}
+            for activity, similarity in get_matching_activities(get_object_or_404(Activity, pk=pk))
+        ],
+    }
+
+
+@cached_activities_json
+def search(request):
+    """
+    Activities matching all words of query q in name, tags or athletes, from the best match. Results can be
+    narrowed by type, year and gear, facets count the narrowed results by type, year and gear.
+    """
+    if not request.GET.get('q'):
+        raise ValueError('Missing search query "q".')
+    limit = min(_get_int(request.GET.get('limit', DEFAULT_PAGE_SIZE), 'limit'), MAX_PAGE_SIZE)
+    offset = _get_int(request.GET.get('offset', 0), 'offset')
+    activities = Activity.objects.all()
+    if 'type' in request.GET:
+        activities = activities.filter(type=_get_choice(Activity.TYPE, request.GET['type'], 'type'))
+    if 'year' in request.GET:
+        activities = activities.filter(start__year=_get_int(request.GET['year'], 'year'))
+    if 'gear' in request.GET:
+        activities = activities.filter(gear=_get_int(request.GET['gear'], 'gear'))
+
+    matches = search_activities(request.GET['q'], activities)
+    facets = get_search_facets(matches)
+    type_labels = dict(Activity.TYPE.choices)
+    return {
+        'count': sum(facets['type'].values()),
+        'results': [
+            {**_serialize_activity(activity), 'rank': activity.search_rank}
+            for activity in matches[offset:offset + limit]
+        ],
+        'facets': {
+            'type': [
+                {'type': type_labels[activity_type], 'count': count}
+                for activity_type, count in sorted(facets['type'].items(), key=lambda item: -item[1])
+            ],
+            'year': [{'year': year, 'count': count} for year, count in sorted(facets['year'].items(), reverse=True)],
+            'gear': [
+                {'id': gear_pk, 'name': gear_name, 'count': count}
+                for (gear_pk, gear_name), count in sorted(facets['gear'].items(), key=lambda item: -item[1])
+            ],
+        },
+    }
+
+
+@cached_activities_json
+def stats(request):
+    """
+    Totals per period and activity type read from precomputed rollups.
+    """
+    rollups = ActivityRollup.objects.filter(
+        period=_get_choice(ActivityRollup.PERIOD, request.GET.get('period', 'month'), 'period'),
+        gear=_get_int(request.GET['gear'], 'gear') if 'gear' in request.GET else None,
+    ).order_by('-period_start', 'type')
+    if 'type' in request.GET:
+        rollups = rollups.filter(type=_get_choice(Activity.TYPE, request.GET['type'], 'type'))
+    if 'since' in request.GET:
+        since = parse_date(request.GET['since'])
+        if not since:
+            raise ValueError(f'Invalid since "{request.GET["since"]}".')
+        rollups = rollups.filter(period_start__gte=since)
+
+    return {
+        'results': [
+            {
+                'period_start': rollup.period_start.isoformat(),
+                'type': rollup.get_type_display(),
+                'distance': float(rollup.distance),
+                'moving_time': rollup.moving_time.total_seconds() if rollup.moving_time is not None else 0,
+                'elevation_gain': rollup.elevation_gain,
+                'count': rollup.count,
+                'kudos': rollup.kudos,
+            }
+            for rollup in rollups
+        ],
+    }
+
+
+def _serialize_job(job):
+    return {
+        'id': job.pk,
+        'kind': job.get_kind_display(),
+        'state': job.get_state_display(),
+        'progress': job.progress,
+        'message': job.message,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def _forbidden_response():
+    return JsonResponse({'error': 'Only staff users can manage jobs.'}, status=403)
+
+
+@require_POST
+def enqueue_job_view(request):
+    """
+    Enqueues job processed by the run_worker command, equal queued or running job is returned instead of
+    creating a new one.
+    """
+    if not request.user.is_staff:
+        return _forbidden_response()
+    try:
+        kind = _get_choice(Job.KIND, request.POST.get('kind', 'import_new_activities'), 'kind')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    job, created = enqueue_job(kind)
+    return JsonResponse(_serialize_job(job), status=201 if created else 200)
+
+
+@require_GET
+def job_detail(request, pk):
+    if not request.user.is_staff:
+        return _forbidden_response()
+    return JsonResponse(_serialize_job(get_object_or_404(Job, pk=pk)))
+
+
+def _is_subscribed_event(event):
+    # Events are not signed, at least events of other subscriptions and athletes are rejected
+    subscription_id, athlete_id = settings.STRAVA_WEBHOOK_SUBSCRIPTION_ID, settings.STRAVA_ATHLETE_ID
+    return (
+        subscription_id is not None and athlete_id is not None
+        and str(event.get('subscription_id')) == str(subscription_id)
+        and str(event.get('owner_id')) == str(athlete_id)
+    )
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def strava_webhook(request):
+    """
+    Receives Strava webhook events. GET validates the subscription, POST events of activities are queued
+    as coalesced sync jobs because Strava expects the response within two seconds. The sync fetches
+    the activity from the API, so a forged event cannot change or delete anything by itself.
+    """
+    if request.method == 'GET':
+        verify_token = settings.STRAVA_WEBHOOK_VERIFY_TOKEN
+        if request.GET.get('hub.mode') != 'subscribe' or not verify_token \
+                or request.GET.get('hub.verify_token') != verify_token:
+            return JsonResponse({'error': 'Invalid verify token.'}, status=403)
+        return JsonResponse({'hub.challenge': request.GET.get('hub.challenge')})
+
+    try:
+        event = json.loads(request.body)
+        strava_id = int(event['object_id'])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Invalid event.'}, status=400)
+    if not _is_subscribed_event(event):
+        return JsonResponse({'error': 'Unknown subscription or athlete.'}, status=403)
+    if event.get('object_type') == 'activity':
+        enqueue_strava_activity_sync(strava_id, deleted=event.get('aspect_type') == 'delete')
+    return JsonResponse({})
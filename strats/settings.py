@@ -75,10 +75,44 @@ WSGI_APPLICATION = 'strats.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
-DATABASES = {
+# PostgreSQL is used when STRATS_DB_ENGINE environment variable is "postgresql", SQLite otherwise. SQLite
+# connections are switched to WAL mode by utils.db.configure_sqlite_connection
+if os.environ.get('STRATS_DB_ENGINE') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('STRATS_DB_NAME', 'strats'),
+            'USER': os.environ.get('STRATS_DB_USER', ''),
+            'PASSWORD': os.environ.get('STRATS_DB_PASSWORD', ''),
+            'HOST': os.environ.get('STRATS_DB_HOST', ''),
+            'PORT': os.environ.get('STRATS_DB_PORT', ''),
+            # Persistent connections, broken ones are closed by utils.db.close_unusable_connection
+            'CONN_MAX_AGE': int(os.environ.get('STRATS_DB_CONN_MAX_AGE', 600)),
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('STRATS_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'OPTIONS': {
+                # Seconds to wait for the write lock held by another process
+                'timeout': 20,
+            },
+        }
+    }
+
+
+# Cache
+# File based cache is shared between the web server and import commands running in other processes
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
     }
 }
 
@@ -122,6 +156,26 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 
+# Activity streams stored as NumPy arrays
+STREAMS_ROOT = os.path.join(BASE_DIR, 'streams')
+
+
+# Heart rate zone bounds used to compute training load (TRIMP) from heart rate streams
+TRAINING_LOAD_RESTING_HEART_RATE = 60
+TRAINING_LOAD_MAX_HEART_RATE = 190
+
+
+# Directory of the node exporter textfile collector, import metrics are written there in Prometheus text format
+IMPORT_METRICS_PROMETHEUS_DIR = None
+
+
 # CREDENTIALS
 STRAVA_ACCESS_TOKEN = None
 STRAVA_REFRESH_TOKEN = None
+STRAVA_CLIENT_ID = None
+STRAVA_CLIENT_SECRET = None
+# Token Strava sends back when the webhook subscription is validated
+STRAVA_WEBHOOK_VERIFY_TOKEN = None
+# Webhook events are accepted only for this subscription (printed by subscribe_strava_webhook) and athlete
+STRAVA_WEBHOOK_SUBSCRIPTION_ID = None
+STRAVA_ATHLETE_ID = None
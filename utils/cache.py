@@ -0,0 +1,65 @@
+from functools import wraps
+from hashlib import md5
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import condition, require_GET
+
+
+ACTIVITIES_CACHE_STATE_KEY = 'activities:state'
+RESPONSE_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def _create_activities_cache_state():
+    return {
+        'version': uuid4().hex,
+        'last_modified': timezone.now().replace(microsecond=0),
+    }
+
+
+def get_activities_cache_state():
+    state = cache.get(ACTIVITIES_CACHE_STATE_KEY)
+    if state is None:
+        cache.add(ACTIVITIES_CACHE_STATE_KEY, _create_activities_cache_state(), None)
+        state = cache.get(ACTIVITIES_CACHE_STATE_KEY)
+    return state
+
+
+def invalidate_activities_cache():
+    """
+    Changes version of all cached activities responses. Must be called whenever activities are created,
+    changed or deleted.
+    """
+    cache.set(ACTIVITIES_CACHE_STATE_KEY, _create_activities_cache_state(), None)
+
+
+def _get_activities_etag(request, *args, **kwargs):
+    return md5(f'{get_activities_cache_state()["version"]}:{request.get_full_path()}'.encode()).hexdigest()
+
+
+def _get_activities_last_modified(request, *args, **kwargs):
+    return get_activities_cache_state()['last_modified']
+
+
+def cached_activities_json(data_func):
+    """
+    Turns function returning JSON serializable data into a GET view. Data are cached until activities change,
+    the response contains ETag and Last-Modified headers and conditional requests are answered with 304.
+    Function can raise ValueError to return 400 response.
+    """
+    @require_GET
+    @condition(etag_func=_get_activities_etag, last_modified_func=_get_activities_last_modified)
+    @wraps(data_func)
+    def view(request, *args, **kwargs):
+        cache_key = f'activities:response:{_get_activities_etag(request)}'
+        data = cache.get(cache_key)
+        if data is None:
+            try:
+                data = data_func(request, *args, **kwargs)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            cache.set(cache_key, data, RESPONSE_CACHE_TIMEOUT)
+        return JsonResponse(data)
+    return view
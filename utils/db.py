@@ -0,0 +1,36 @@
+from django.db import DatabaseError, connection
+
+
+SQLITE_PRAGMAS = (
+    # Readers do not block the writer and the writer does not block readers
+    'PRAGMA journal_mode = WAL',
+    # Durable enough with WAL, commits do not wait for fsync of the database file
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 20000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -65536',
+)
+
+
+def configure_sqlite_connection(sqlite_connection):
+    with sqlite_connection.cursor() as cursor:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+
+
+def is_database_healthy():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            return cursor.fetchone() == (1,)
+    except DatabaseError:
+        return False
+
+
+def close_unusable_connection():
+    """
+    Closes persistent connection which is broken (for example after database restart), the next query opens
+    a new one. Django checks connections only around requests, long running processes must call it themselves.
+    """
+    if connection.connection is not None and not connection.is_usable():
+        connection.close()
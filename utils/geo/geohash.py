@@ -0,0 +1,79 @@
+import math
+
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Precision of the route index cells, 6 characters is a cell about 1.2 x 0.6 km
+CELL_PRECISION = 6
+
+
+def encode_geohash(latitude, longitude, precision=CELL_PRECISION):
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value_range, value = (longitude_range, longitude) if even else (latitude_range, latitude)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = bits << 1 | 1
+            value_range[0] = middle
+        else:
+            bits <<= 1
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def get_cell_size(precision=CELL_PRECISION):
+    """
+    Returns height and width of geohash cell in degrees.
+    """
+    longitude_bits = math.ceil(precision * 5 / 2)
+    latitude_bits = precision * 5 // 2
+    return 180 / 2 ** latitude_bits, 360 / 2 ** longitude_bits
+
+
+def get_cells_in_bbox(min_latitude, min_longitude, max_latitude, max_longitude, precision=CELL_PRECISION):
+    height, width = get_cell_size(precision)
+    latitude_steps = math.ceil((max_latitude - min_latitude) / height) + 1
+    longitude_steps = math.ceil((max_longitude - min_longitude) / width) + 1
+    return {
+        encode_geohash(
+            min(min_latitude + i * height, max_latitude), min(min_longitude + j * width, max_longitude), precision
+        )
+        for i in range(latitude_steps)
+        for j in range(longitude_steps)
+    }
+
+
+def get_polyline_cells(points, precision=CELL_PRECISION):
+    """
+    Returns cells crossed by polyline given as (latitude, longitude) points. Segments are sampled at half
+    of the cell size, so a segment between two samples crosses at most one cell border in each direction.
+    Cells of the other corners of the samples are added too, the segment can cut a corner of one of them.
+    """
+    height, width = get_cell_size(precision)
+    cells = {encode_geohash(*point, precision) for point in points[:1]}
+    for (start_latitude, start_longitude), (end_latitude, end_longitude) in zip(points, points[1:]):
+        steps = math.ceil(
+            max(abs(end_latitude - start_latitude) / height, abs(end_longitude - start_longitude) / width) * 2
+        )
+        previous_latitude, previous_longitude = start_latitude, start_longitude
+        for i in range(1, steps + 1):
+            latitude = start_latitude + (end_latitude - start_latitude) * i / steps
+            longitude = start_longitude + (end_longitude - start_longitude) * i / steps
+            cells.update((
+                encode_geohash(latitude, longitude, precision),
+                encode_geohash(previous_latitude, longitude, precision),
+                encode_geohash(latitude, previous_longitude, precision),
+            ))
+            previous_latitude, previous_longitude = latitude, longitude
+    return cells
@@ -0,0 +1,122 @@
+import math
+
+import numpy as np
+
+
+EARTH_RADIUS = 6371000
+POLYLINE_PRECISION = 1e5
+
+
+def decode_polyline(encoded):
+    """
+    Decodes Google encoded polyline (used by Strava maps) to list of (latitude, longitude) pairs.
+    """
+    points = []
+    values = []
+    value = 0
+    shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = 0
+            shift = 0
+    latitude = longitude = 0
+    for latitude_delta, longitude_delta in zip(values[::2], values[1::2]):
+        latitude += latitude_delta
+        longitude += longitude_delta
+        points.append((latitude / POLYLINE_PRECISION, longitude / POLYLINE_PRECISION))
+    return points
+
+
+def _encode_value(value):
+    value = ~(value << 1) if value < 0 else value << 1
+    chars = []
+    while value >= 0x20:
+        chars.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chars.append(chr(value + 63))
+    return ''.join(chars)
+
+
+def encode_polyline(points):
+    chars = []
+    previous_latitude = previous_longitude = 0
+    for latitude, longitude in points:
+        latitude = int(round(latitude * POLYLINE_PRECISION))
+        longitude = int(round(longitude * POLYLINE_PRECISION))
+        chars.append(_encode_value(latitude - previous_latitude))
+        chars.append(_encode_value(longitude - previous_longitude))
+        previous_latitude, previous_longitude = latitude, longitude
+    return ''.join(chars)
+
+
+def project(points, origin_latitude):
+    """
+    Projects (latitude, longitude) points to metres with equirectangular projection, precise enough for
+    distances within one route.
+    """
+    points = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    return np.column_stack((
+        points[:, 1] * math.cos(math.radians(origin_latitude)) * EARTH_RADIUS,
+        points[:, 0] * EARTH_RADIUS,
+    ))
+
+
+def simplify_polyline(points, tolerance):
+    """
+    Douglas-Peucker simplification keeping points deviating more than tolerance (m) from the simplified line.
+    """
+    if len(points) < 3:
+        return list(points)
+    xy = project(points, points[0][0])
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = get_distances_to_segment(xy[first + 1:last], xy[first], xy[last])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            stack.extend(((first, middle), (middle, last)))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def get_distances_to_segment(xy, start, end):
+    segment = end - start
+    length = np.dot(segment, segment)
+    t = np.clip((xy - start) @ segment / length, 0, 1) if length else np.zeros(len(xy))
+    return np.hypot(*(xy - start - t[:, np.newaxis] * segment).T)
+
+
+def get_distances_to_polyline(xy, polyline_xy):
+    """
+    Returns distances (m) of projected points to the nearest segment of projected polyline, all point-segment
+    pairs are computed at once.
+    """
+    if len(polyline_xy) == 1:
+        return np.hypot(*(xy - polyline_xy[0]).T)
+    starts = polyline_xy[:-1]
+    segments = polyline_xy[1:] - starts
+    lengths = np.maximum((segments ** 2).sum(axis=1), 1e-9)
+    offsets = xy[:, np.newaxis, :] - starts[np.newaxis, :, :]
+    t = np.clip((offsets * segments).sum(axis=2) / lengths, 0, 1)
+    return np.hypot(*(offsets - t[:, :, np.newaxis] * segments).transpose(2, 0, 1)).min(axis=1)
+
+
+def densify(xy, step):
+    """
+    Adds points to projected polyline so that no two neighbouring points are farther than step (m).
+    """
+    if len(xy) < 2:
+        return xy
+    lengths = np.hypot(*np.diff(xy, axis=0).T)
+    distance = np.concatenate(([0], np.cumsum(lengths)))
+    samples = np.union1d(np.arange(0, distance[-1], step), distance)
+    return np.column_stack((np.interp(samples, distance, xy[:, 0]), np.interp(samples, distance, xy[:, 1])))
@@ -0,0 +1,150 @@
+import json
+import traceback
+from datetime import timedelta
+
+from activities.management.commands.import_activity_streams import import_activity_streams
+from activities.management.commands.import_all_activities import import_all_activities
+from activities.management.commands.import_new_activities import import_new_activities
+from activities.models import Job
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from utils.models.activities import sync_strava_activity
+from utils.stravalib.concurrent import ConcurrentStravaClient
+from utils.stravalib.limiter import RateLimitExhausted
+
+
+# Events of one activity coming within the delay are applied together
+STRAVA_EVENT_COALESCE_DELAY = timedelta(seconds=5)
+
+
+def sync_strava_activity_job(strava_id, deleted=False, progress=None):
+    with ConcurrentStravaClient(max_workers=1) as client:
+        sync_strava_activity(strava_id, client, deleted=deleted)
+
+
+JOB_HANDLERS = {
+    Job.KIND.IMPORT_NEW_ACTIVITIES: import_new_activities,
+    Job.KIND.IMPORT_ALL_ACTIVITIES: import_all_activities,
+    Job.KIND.IMPORT_ACTIVITY_STREAMS: import_activity_streams,
+    Job.KIND.SYNC_STRAVA_ACTIVITY: sync_strava_activity_job,
+}
+
+
+def get_default_job_key(kind):
+    return f'kind:{kind}'
+
+
+def enqueue_job(kind, arguments=None, key=None, run_after=None, deduplicate_running=True):
+    """
+    Creates a queued job unless an equal one (with the same key) is already queued or, with deduplicate_running,
+    running. Returns the job and flag whether it was created.
+    """
+    key = key or get_default_job_key(kind)
+    active_states = Job.ACTIVE_STATES if deduplicate_running else (Job.STATE.QUEUED,)
+    with transaction.atomic():
+        job = Job.objects.select_for_update().filter(key=key, state__in=active_states).order_by('pk').first()
+        if job:
+            return job, False
+        try:
+            with transaction.atomic():
+                return Job.objects.create(
+                    kind=kind,
+                    key=key,
+                    arguments=json.dumps(arguments or {}),
+                    run_after=run_after or timezone.now(),
+                ), True
+        except IntegrityError:
+            # Job with the same key was queued concurrently
+            return Job.objects.get(key=key, state=Job.STATE.QUEUED), False
+
+
+def enqueue_strava_activity_sync(strava_id, deleted=False):
+    """
+    Coalesces events of one Strava activity. Queued sync of the activity is postponed and takes the latest
+    event state, so a burst of events costs one sync. Sync can be queued while another one is running,
+    because the running one may have fetched the activity before the last change.
+    """
+    run_after = timezone.now() + STRAVA_EVENT_COALESCE_DELAY
+    arguments = {'strava_id': strava_id, 'deleted': deleted}
+    with transaction.atomic():
+        job, created = enqueue_job(
+            Job.KIND.SYNC_STRAVA_ACTIVITY, arguments=arguments, key=f'strava-activity:{strava_id}',
+            run_after=run_after, deduplicate_running=False
+        )
+        if not created:
+            Job.objects.filter(pk=job.pk, state=Job.STATE.QUEUED).update(
+                arguments=json.dumps(arguments), run_after=run_after
+            )
+    return job
+
+
+def claim_job(worker):
+    """
+    Atomically switches the oldest due job to running state. Jobs with the key of a running job are skipped.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            state=Job.STATE.QUEUED, run_after__lte=now
+        ).exclude(
+            key__in=Job.objects.filter(state=Job.STATE.RUNNING).values('key')
+        ).order_by('run_after', 'pk').first()
+        if job is None:
+            return None
+        # Conditional update makes the claim safe also on backends without row locks
+        claimed = Job.objects.filter(pk=job.pk, state=Job.STATE.QUEUED).update(
+            state=Job.STATE.RUNNING, started_at=now, worker=worker
+        )
+    return job if claimed else None
+
+
+def _finish_job(job, state, message):
+    Job.objects.filter(pk=job.pk).update(state=state, finished_at=timezone.now(), message=message)
+
+
+def _requeue_job(job, retry_after):
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk).update(
+                state=Job.STATE.QUEUED,
+                run_after=timezone.now() + timedelta(seconds=retry_after),
+                message=f'Rate limit exhausted, retrying in {retry_after:.0f}s.'
+            )
+    except IntegrityError:
+        _finish_job(job, Job.STATE.FAILED, 'Rate limit exhausted, equal job is already queued.')
+
+
+def run_job(job):
+    def progress(value, message=''):
+        Job.objects.filter(pk=job.pk).update(progress=value, message=message)
+
+    try:
+        JOB_HANDLERS[job.kind](progress=progress, **json.loads(job.arguments))
+    except RateLimitExhausted as e:
+        # Imports are resumable, the job continues from its last checkpoint when the limit is renewed
+        _requeue_job(job, e.retry_after)
+    except Exception:
+        _finish_job(job, Job.STATE.FAILED, traceback.format_exc())
+    else:
+        _finish_job(job, Job.STATE.SUCCEEDED, '')
+    finally:
+        # Every worker thread has its own connection
+        connection.close()
+
+
+def requeue_running_jobs():
+    """
+    Returns jobs interrupted by a stopped worker back to the queue. Only one job of a key can be queued, running
+    job is deleted when an equal job was queued meanwhile (a newer Strava event of the same activity).
+    """
+    with transaction.atomic():
+        queued_keys = Job.objects.filter(state=Job.STATE.QUEUED).values('key')
+        Job.objects.filter(state=Job.STATE.RUNNING, key__in=queued_keys).delete()
+        # From more running jobs of one key (possible only after a race of workers) the newest one is requeued
+        requeued_jobs = {
+            key: pk for pk, key in Job.objects.filter(state=Job.STATE.RUNNING).values_list('pk', 'key').order_by('pk')
+        }
+        Job.objects.filter(state=Job.STATE.RUNNING).exclude(pk__in=requeued_jobs.values()).delete()
+        return Job.objects.filter(pk__in=requeued_jobs.values()).update(
+            state=Job.STATE.QUEUED, started_at=None, worker=''
+        )
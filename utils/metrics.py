@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from activities.models import ImportRun
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+
+# Upper bounds (s) of the Strava API latency histogram buckets
+API_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+# Run totals compared with the previous run of the same import
+COMPARED_FIELDS = ('wall_time', 'query_count', 'query_time', 'api_call_count', 'api_time')
+
+OTHER_PHASE = 'other'
+
+
+def _get_empty_phase():
+    return {'wall_time': 0.0, 'query_count': 0, 'query_time': 0.0}
+
+
+class ImportMetrics:
+    """
+    Metrics of one import run: wall time, database query count and time per phase, Strava API call count and
+    latency histogram and rate limit headroom. Queries of the current thread are counted by a database execute
+    wrapper, API calls by a response hook of the stravalib requests sessions (see ConcurrentStravaClient).
+    Used as a context manager the run is stored as ImportRun, compared with the previous run of the same name
+    and written to a Prometheus text file in IMPORT_METRICS_PROMETHEUS_DIR if the setting is set. Metrics without
+    name are only collected.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.phases = defaultdict(_get_empty_phase)
+        self.counters = defaultdict(int)
+        self.api_latency_histogram = [0] * len(API_LATENCY_BUCKETS)
+        self.api_call_count = 0
+        self.api_time = 0.0
+        self.rate_limiter = None
+        self.started_at = None
+        self._current_phase = OTHER_PHASE
+        self._start_time = None
+        self._lock = threading.Lock()
+        self._exit_stack = ExitStack()
+
+    def __enter__(self):
+        self.started_at = timezone.now()
+        self._start_time = time.perf_counter()
+        self._exit_stack.enter_context(connection.execute_wrapper(self._execute_wrapper))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._exit_stack.close()
+        if self.name:
+            self.finish(succeeded=exc_type is None)
+
+    def _execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            phase = self.phases[self._current_phase]
+            phase['query_count'] += 1
+            phase['query_time'] += time.perf_counter() - start
+
+    @contextmanager
+    def phase(self, name):
+        previous_phase = self._current_phase
+        self._current_phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name]['wall_time'] += time.perf_counter() - start
+            self._current_phase = previous_phase
+
+    def increment(self, counter, value=1):
+        self.counters[counter] += value
+
+    def record_api_call(self, latency):
+        with self._lock:
+            self.api_call_count += 1
+            self.api_time += latency
+            for i, bucket in enumerate(API_LATENCY_BUCKETS):
+                if latency <= bucket:
+                    self.api_latency_histogram[i] += 1
+                    break
+
+    def record_response(self, response, *args, **kwargs):
+        # Response hook of requests session, response.elapsed is the time until the response headers arrived
+        self.record_api_call(response.elapsed.total_seconds())
+
+    def get_rate_limit_headroom(self):
+        return self.rate_limiter.headroom_remaining if self.rate_limiter else (None, None)
+
+    def get_run(self, succeeded):
+        short_headroom, long_headroom = self.get_rate_limit_headroom()
+        return ImportRun(
+            name=self.name,
+            succeeded=succeeded,
+            started_at=self.started_at,
+            finished_at=timezone.now(),
+            wall_time=time.perf_counter() - self._start_time,
+            query_count=sum(phase['query_count'] for phase in self.phases.values()),
+            query_time=sum(phase['query_time'] for phase in self.phases.values()),
+            api_call_count=self.api_call_count,
+            api_time=self.api_time,
+            short_rate_limit_headroom=short_headroom,
+            long_rate_limit_headroom=long_headroom,
+            metrics=json.dumps({
+                'phases': self.phases,
+                'counters': self.counters,
+                'api_latency_histogram': dict(zip(map(str, API_LATENCY_BUCKETS), self.api_latency_histogram)),
+            }),
+        )
+
+    def finish(self, succeeded=True):
+        run = self.get_run(succeeded)
+        previous_run = ImportRun.objects.filter(name=self.name, succeeded=True).first()
+        run.save()
+        print_import_run(run, previous_run)
+        if settings.IMPORT_METRICS_PROMETHEUS_DIR:
+            write_prometheus_file(settings.IMPORT_METRICS_PROMETHEUS_DIR, run)
+        return run
+
+
+def _format_change(value, previous_value):
+    if not previous_value:
+        return ''
+    return f' ({(value - previous_value) / previous_value:+.0%})'
+
+
+def print_import_run(run, previous_run=None):
+    """
+    Prints the run metrics, totals are compared with the previous successful run of the same import.
+    """
+    metrics = json.loads(run.metrics)
+    print(f'Import {run.name} {"succeeded" if run.succeeded else "failed"} in {run.wall_time:.1f}s.')
+    for field in COMPARED_FIELDS:
+        value = getattr(run, field)
+        change = _format_change(value, getattr(previous_run, field)) if previous_run else ''
+        print(f'  {ImportRun._meta.get_field(field).verbose_name}: {value:.4g}{change}')
+    for name, phase in metrics['phases'].items():
+        print(
+            f'  {name}: {phase["wall_time"]:.2f}s, {phase["query_count"]} queries in {phase["query_time"]:.2f}s'
+        )
+    if run.short_rate_limit_headroom is not None:
+        print(f'  rate limit headroom: {run.short_rate_limit_headroom} (15 min), {run.long_rate_limit_headroom} (day)')
+
+
+def get_prometheus_text(run):
+    metrics = json.loads(run.metrics)
+    labels = f'import="{run.name}"'
+    lines = [
+        f'strats_import_last_run_timestamp_seconds{{{labels}}} {run.finished_at.timestamp():.0f}',
+        f'strats_import_succeeded{{{labels}}} {int(run.succeeded)}',
+        f'strats_import_wall_time_seconds{{{labels}}} {run.wall_time:.3f}',
+        f'strats_import_db_queries_total{{{labels}}} {run.query_count}',
+        f'strats_import_db_query_time_seconds{{{labels}}} {run.query_time:.3f}',
+    ]
+    for name, phase in metrics['phases'].items():
+        phase_labels = f'{labels},phase="{name}"'
+        lines += [
+            f'strats_import_phase_wall_time_seconds{{{phase_labels}}} {phase["wall_time"]:.3f}',
+            f'strats_import_phase_db_queries_total{{{phase_labels}}} {phase["query_count"]}',
+            f'strats_import_phase_db_query_time_seconds{{{phase_labels}}} {phase["query_time"]:.3f}',
+        ]
+    for name, value in metrics['counters'].items():
+        lines.append(f'strats_import_{name}_total{{{labels}}} {value}')
+
+    lines.append('# TYPE strats_import_api_latency_seconds histogram')
+    cumulative_count = 0
+    for bucket, count in metrics['api_latency_histogram'].items():
+        cumulative_count += count
+        bucket = '+Inf' if bucket == 'inf' else bucket
+        lines.append(f'strats_import_api_latency_seconds_bucket{{{labels},le="{bucket}"}} {cumulative_count}')
+    lines += [
+        f'strats_import_api_latency_seconds_sum{{{labels}}} {run.api_time:.3f}',
+        f'strats_import_api_latency_seconds_count{{{labels}}} {run.api_call_count}',
+    ]
+    if run.short_rate_limit_headroom is not None:
+        lines += [
+            f'strats_import_rate_limit_headroom{{{labels},window="short"}} {run.short_rate_limit_headroom}',
+            f'strats_import_rate_limit_headroom{{{labels},window="long"}} {run.long_rate_limit_headroom}',
+        ]
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus_file(directory, run):
+    # The file is replaced atomically so that the textfile collector never reads a partially written file
+    path = os.path.join(directory, f'strats_import_{run.name}.prom')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(get_prometheus_text(run))
+    os.replace(tmp_path, path)
@@ -1,7 +1,17 @@
-from activities.models import Activity, Gear
+import hashlib
+import json
+
+from activities.models import Activity, ActivityGeoCell, Gear
 from chamber.shortcuts import get_object_or_none
 from django.core.exceptions import ValidationError
+from django.db import connection, transaction
 from django.db.utils import IntegrityError
+from django.utils import timezone
+from stravalib.exc import ObjectNotFound
+from utils.models.ledger import update_gear_ledgers, update_ledgers_for_activities
+from utils.models.routes import build_route_cells, get_route_data_from_strava, update_route_index
+from utils.models.search import update_search_index
+from utils.streams.efforts import move_best_effort_records
 
 
 STRAVA_ACTIVITY_TYPE_TO_ACTIVITY_TYPE = {
@@ -27,42 +37,390 @@ STRAVA_ACTIVITY_TYPE_TO_GEAR_TYPE = {
 }
 
 
-def create_and_add_gear_to_activity_if_needed(activity, strava_client):
-    if activity.gear_id:
-        gear_created = False
-        gear = get_object_or_none(Gear, strava_id=activity.gear_id)
-        if not gear:
-            strava_gear = strava_client.get_gear(activity.gear_id)
-            gear = Gear.objects.create(
-                strava_id=strava_gear.id,
-                name=strava_gear.name,
-                type=STRAVA_ACTIVITY_TYPE_TO_GEAR_TYPE[activity.type]
+def get_or_create_gear_from_strava(strava_gear, gear_type):
+    """
+    Gear imported from the Strava archive without Strava ID is reused when it has the name of the fetched gear.
+    """
+    with transaction.atomic():
+        gear = Gear.objects.filter(strava_id=None, name=strava_gear.name).order_by('pk').first()
+        if gear and not Gear.objects.filter(strava_id=strava_gear.id).exists():
+            gear.strava_id = strava_gear.id
+            gear.save()
+            return gear
+        return Gear.objects.get_or_create(
+            strava_id=strava_gear.id,
+            defaults={
+                'name': strava_gear.name,
+                'type': gear_type,
+            }
+        )[0]
+
+
+class GearCache:
+    """
+    Gear lookup for one import run. The cache is pre-warmed from the Gear table and gear missing locally is
+    fetched from Strava and created just once, so every distinct gear ID costs at most one API call.
+    """
+
+    def __init__(self):
+        self.gear_by_strava_id = {gear.strava_id: gear for gear in Gear.objects.filter(strava_id__isnull=False)}
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, strava_gear_types, strava_client):
+        """
+        Returns gear for given dict of Strava gear ID -> gear type and number of newly created gear.
+        """
+        missing_strava_gear_ids = []
+        for strava_gear_id in strava_gear_types:
+            if strava_gear_id in self.gear_by_strava_id:
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing_strava_gear_ids.append(strava_gear_id)
+        for strava_gear_id, strava_gear in zip(missing_strava_gear_ids,
+                                               strava_client.map('get_gear', missing_strava_gear_ids)):
+            self.gear_by_strava_id[strava_gear_id] = get_or_create_gear_from_strava(
+                strava_gear, strava_gear_types[strava_gear_id]
             )
-            gear_created = True
+        return (
+            {strava_gear_id: self.gear_by_strava_id[strava_gear_id] for strava_gear_id in strava_gear_types},
+            len(missing_strava_gear_ids)
+        )
+
+    def get(self, strava_gear_id, gear_type, strava_client):
+        gear_by_strava_id, new_gear_count = self.get_many({strava_gear_id: gear_type}, strava_client)
+        return gear_by_strava_id[strava_gear_id], new_gear_count > 0
+
+    def print_stats(self):
+        print(f'Gear cache: {self.hits} hits, {self.misses} misses.')
+
+
+def create_and_add_gear_to_activity_if_needed(activity, strava_client, gear_cache=None):
+    if activity.gear_id:
+        gear_type = STRAVA_ACTIVITY_TYPE_TO_GEAR_TYPE.get(activity.type, Gear.TYPE.OTHER)
+        if gear_cache is not None:
+            gear, gear_created = gear_cache.get(activity.gear_id, gear_type, strava_client)
+        else:
+            gear_created = False
+            gear = get_object_or_none(Gear, strava_id=activity.gear_id)
+            if not gear:
+                gear = get_or_create_gear_from_strava(strava_client.get_gear(activity.gear_id), gear_type)
+                gear_created = True
         Activity.objects.get(strava_id=activity.id).gear.add(gear)
         return gear_created
     return False
 
 
+BULK_UPDATE_BATCH_SIZE = 200
+BULK_INSERT_BATCH_SIZE = 500
+
+
+def get_strava_fingerprint(activity_data):
+    return hashlib.sha1(json.dumps(activity_data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_activity_data_from_strava(activity):
+    data = {
+        'name': activity.name,
+        'strava_id': activity.id,
+        'distance': str(round(activity.distance._num, 2)),
+        'average_speed': str(round(activity.average_speed._num, 2)),
+        'start': activity.start_date,
+        'moving_time': activity.moving_time,
+        'elapsed_time': activity.elapsed_time,
+        'elevation_gain': activity.total_elevation_gain._num,
+        'type': STRAVA_ACTIVITY_TYPE_TO_ACTIVITY_TYPE.get(activity.type, Activity.TYPE.OTHER),
+        'kudos': activity.kudos_count,
+        'achievements': activity.achievement_count,
+        'comments': activity.comment_count,
+        'commute': activity.commute,
+        'athlete_count': activity.athlete_count,
+        **get_route_data_from_strava(activity),
+    }
+    # Gear is linked through a many-to-many table, it is a part of the fingerprint only
+    data['strava_fingerprint'] = get_strava_fingerprint({**data, 'gear_id': activity.gear_id})
+    return data
+
+
+def build_activity_from_strava(activity):
+    return Activity(**get_activity_data_from_strava(activity))
+
+
 def create_activity_from_strava(activity):
+    data = get_activity_data_from_strava(activity)
     try:
-        Activity.objects.create(
-            name=activity.name,
-            strava_id=activity.id,
-            distance=str(round(activity.distance._num, 2)),
-            average_speed=str(round(activity.average_speed._num, 2)),
-            start=activity.start_date,
-            moving_time=activity.moving_time,
-            elapsed_time=activity.elapsed_time,
-            elevation_gain=activity.total_elevation_gain._num,
-            type=STRAVA_ACTIVITY_TYPE_TO_ACTIVITY_TYPE.get(activity.type, Activity.TYPE.OTHER),
-            kudos=activity.kudos_count,
-            achievements=activity.achievement_count,
-            comments=activity.comment_count,
-            commute=activity.commute,
-            athlete_count=activity.athlete_count,
-        )
+        _, created = Activity.objects.get_or_create(strava_id=data.pop('strava_id'), defaults=data)
     except (IntegrityError, ValidationError) as e:
         print(f'Unable to import activity {activity.start_date} {activity.name}: {e}')
         return False
-    return True
+    return created
+
+
+def _insert_activities_returning_pks(activities):
+    """
+    PostgreSQL upsert inserting activities in batches with ON CONFLICT DO NOTHING, primary keys of the inserted
+    rows are returned by the same statement. Returns dict strava_id -> pk of the inserted activities.
+    """
+    fields = [field for field in Activity._meta.concrete_fields if not field.primary_key]
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    placeholders = f'({", ".join(["%s"] * len(fields))})'
+    activity_pks = {}
+    with connection.cursor() as cursor:
+        for i in range(0, len(activities), BULK_INSERT_BATCH_SIZE):
+            batch = activities[i:i + BULK_INSERT_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {Activity._meta.db_table} ({columns}) VALUES {", ".join([placeholders] * len(batch))} '
+                f'ON CONFLICT (strava_id) DO NOTHING RETURNING strava_id, id',
+                [
+                    field.get_db_prep_save(field.pre_save(activity, True), connection)
+                    for activity in batch for field in fields
+                ]
+            )
+            activity_pks.update(cursor.fetchall())
+    return activity_pks
+
+
+def bulk_create_activities(activities, gear_by_activity_strava_id=None):
+    """
+    Stores unsaved activities with one INSERT per batch, links their gear and route index cells through
+    bulk created rows and indexes them for search. Activities must have strava_id set, it is used to find
+    primary keys of the inserted rows because not all database backends return them from bulk_create.
+    On PostgreSQL the keys of inserted rows are returned by the INSERT itself. Activities skipped because
+    of a conflict are left to the import which stored them, gear can be linked also to activities stored before
+    which are given only in gear_by_activity_strava_id. Returns the inserted activities with primary keys set.
+    """
+    gear_by_activity_strava_id = gear_by_activity_strava_id or {}
+    strava_ids = {activity.strava_id for activity in activities}
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            activity_pks = _insert_activities_returning_pks(activities)
+        else:
+            # SQLite has a single writer, an activity stored by a concurrent import after the query makes
+            # the INSERT of this transaction fail instead of being silently ignored
+            existing_strava_ids = set(
+                Activity.objects.filter(strava_id__in=strava_ids).values_list('strava_id', flat=True)
+            )
+            Activity.objects.bulk_create(
+                [activity for activity in activities if activity.strava_id not in existing_strava_ids],
+                ignore_conflicts=True
+            )
+            activity_pks = dict(
+                Activity.objects.filter(strava_id__in=strava_ids - existing_strava_ids).values_list('strava_id', 'pk')
+            )
+        stored_activities = [activity for activity in activities if activity.strava_id in activity_pks]
+        for activity in stored_activities:
+            activity.pk = activity_pks[activity.strava_id]
+        update_search_index(activity.pk for activity in stored_activities)
+        ActivityGeoCell.objects.bulk_create([
+            cell
+            for activity in stored_activities
+            for cell in build_route_cells(activity.pk, activity.route_polyline)
+        ], ignore_conflicts=True)
+        stored_strava_ids = gear_by_activity_strava_id.keys() - strava_ids
+        linked_activity_pks = dict(
+            Activity.objects.filter(strava_id__in=stored_strava_ids).values_list('strava_id', 'pk')
+        ) if stored_strava_ids else {}
+        linked_activity_pks.update(activity_pks)
+        gear_by_activity_strava_id = {
+            strava_id: gear_list for strava_id, gear_list in gear_by_activity_strava_id.items()
+            if strava_id in linked_activity_pks
+        }
+        if gear_by_activity_strava_id:
+            Activity.gear.through.objects.bulk_create([
+                Activity.gear.through(activity_id=linked_activity_pks[strava_id], gear_id=gear.pk)
+                for strava_id, gear_list in gear_by_activity_strava_id.items()
+                for gear in gear_list
+            ], ignore_conflicts=True)
+            update_gear_ledgers(gear.pk for gear_list in gear_by_activity_strava_id.values() for gear in gear_list)
+    return stored_activities
+
+
+def bulk_create_activities_from_strava(strava_activities, strava_client, gear_cache):
+    """
+    Creates activities missing in the database. Existing activities are found with one query using the unique
+    strava_id index.
+    """
+    strava_ids = {strava_activity.id for strava_activity in strava_activities}
+    existing_strava_ids = set(Activity.objects.filter(strava_id__in=strava_ids).values_list('strava_id', flat=True))
+    activities = []
+    valid_strava_activities = []
+    for strava_activity in strava_activities:
+        if strava_activity.id in existing_strava_ids:
+            continue
+        existing_strava_ids.add(strava_activity.id)
+        activity = build_activity_from_strava(strava_activity)
+        try:
+            activity.clean_fields()
+        except ValidationError as e:
+            print(f'Unable to import activity {strava_activity.start_date} {strava_activity.name}: {e}')
+            continue
+        activities.append(activity)
+        valid_strava_activities.append(strava_activity)
+
+    gear_by_strava_id, new_gear_count = gear_cache.get_many(
+        {
+            activity.gear_id: STRAVA_ACTIVITY_TYPE_TO_GEAR_TYPE.get(activity.type, Gear.TYPE.OTHER)
+            for activity in valid_strava_activities if activity.gear_id
+        },
+        strava_client
+    )
+    gear_by_activity_strava_id = {
+        strava_activity.id: [gear_by_strava_id[strava_activity.gear_id]]
+        for strava_activity in valid_strava_activities if strava_activity.gear_id
+    }
+    return bulk_create_activities(activities, gear_by_activity_strava_id), new_gear_count
+
+
+def _update_activities_from_values(activities, fields):
+    """
+    PostgreSQL update of many rows with one UPDATE ... FROM (VALUES ...) per batch, bulk_update generates
+    a CASE expression with a branch for every row and field instead.
+    """
+    model_fields = [Activity._meta.get_field(field) for field in fields]
+    quote_name = connection.ops.quote_name
+    assignments = ', '.join(
+        f'{quote_name(field.column)} = v.{quote_name(field.column)}::{field.db_type(connection)}'
+        for field in model_fields
+    )
+    value_columns = ', '.join(quote_name(column) for column in ['id', *(field.column for field in model_fields)])
+    placeholders = f'({", ".join(["%s"] * (len(model_fields) + 1))})'
+    with connection.cursor() as cursor:
+        for i in range(0, len(activities), BULK_UPDATE_BATCH_SIZE):
+            batch = activities[i:i + BULK_UPDATE_BATCH_SIZE]
+            cursor.execute(
+                f'UPDATE {Activity._meta.db_table} SET {assignments} '
+                f'FROM (VALUES {", ".join([placeholders] * len(batch))}) AS v({value_columns}) '
+                f'WHERE {Activity._meta.db_table}.id = v.id',
+                [
+                    value
+                    for activity in batch
+                    for value in [activity.pk, *(
+                        field.get_db_prep_save(getattr(activity, field.attname), connection)
+                        for field in model_fields
+                    )]
+                ]
+            )
+
+
+def replace_strava_gear(gear_by_activity_pk):
+    """
+    Links activities to given lists of gear instead of the gear with Strava ID they are linked to, gear without
+    Strava ID was added locally and stays linked. Only changed links are written and ledgers of their gear updated.
+    """
+    through = Activity.gear.through
+    stored_links = through.objects.filter(
+        activity_id__in=gear_by_activity_pk.keys(), gear__strava_id__isnull=False
+    ).values_list('pk', 'activity_id', 'gear_id')
+    stored_gear_pks = {}
+    stale_links = []
+    for link_pk, activity_pk, gear_pk in stored_links:
+        stored_gear_pks.setdefault(activity_pk, set()).add(gear_pk)
+        if gear_pk not in {gear.pk for gear in gear_by_activity_pk[activity_pk]}:
+            stale_links.append((link_pk, gear_pk))
+    new_links = [
+        through(activity_id=activity_pk, gear_id=gear.pk)
+        for activity_pk, gear_list in gear_by_activity_pk.items()
+        for gear in gear_list if gear.pk not in stored_gear_pks.get(activity_pk, ())
+    ]
+    through.objects.filter(pk__in=[link_pk for link_pk, _ in stale_links]).delete()
+    through.objects.bulk_create(new_links)
+    update_gear_ledgers({gear_pk for _, gear_pk in stale_links} | {link.gear_id for link in new_links})
+
+
+def bulk_update_activities_from_strava(strava_activities, strava_client, gear_cache):
+    """
+    Updates stored activities whose fields or gear mapped from Strava changed, only rows with a different
+    fingerprint are written. bulk_update sends no signals, so gear links, ledgers, route and search indexes and
+    best effort records are updated here. Returns the updated activities and (start, type) pairs before and
+    after the update to refresh the rollups with.
+    """
+    strava_activities_by_id = {strava_activity.id: strava_activity for strava_activity in strava_activities}
+    data_by_strava_id = {
+        strava_id: get_activity_data_from_strava(strava_activity)
+        for strava_id, strava_activity in strava_activities_by_id.items()
+    }
+    updated_activities = []
+    activity_keys = []
+    retyped_activities = []
+    now = timezone.now()
+    for activity in Activity.objects.filter(strava_id__in=data_by_strava_id.keys()):
+        data = data_by_strava_id[activity.strava_id]
+        if activity.strava_fingerprint == data['strava_fingerprint']:
+            continue
+        previous_key = (activity.start, activity.type)
+        for field, value in data.items():
+            setattr(activity, field, value)
+        # bulk_update does not set auto_now fields, changed_at is the watermark of the Parquet export
+        activity.changed_at = now
+        try:
+            activity.clean_fields()
+        except ValidationError as e:
+            print(f'Unable to update activity {activity.start} {activity.name}: {e}')
+            continue
+        updated_activities.append(activity)
+        activity_keys.extend((previous_key, (activity.start, activity.type)))
+        if previous_key[1] != activity.type and activity.best_efforts_computed:
+            retyped_activities.append((activity, previous_key[1]))
+
+    if updated_activities:
+        fields = [
+            field for field in data_by_strava_id[updated_activities[0].strava_id] if field != 'strava_id'
+        ] + ['changed_at']
+        updated_strava_activities = [strava_activities_by_id[activity.strava_id] for activity in updated_activities]
+        gear_by_strava_id, _ = gear_cache.get_many(
+            {
+                strava_activity.gear_id: STRAVA_ACTIVITY_TYPE_TO_GEAR_TYPE.get(strava_activity.type, Gear.TYPE.OTHER)
+                for strava_activity in updated_strava_activities if strava_activity.gear_id
+            },
+            strava_client
+        )
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                _update_activities_from_values(updated_activities, fields)
+            else:
+                Activity.objects.bulk_update(updated_activities, fields, batch_size=BULK_UPDATE_BATCH_SIZE)
+            update_ledgers_for_activities([activity.pk for activity in updated_activities])
+            replace_strava_gear({
+                activity.pk: [gear_by_strava_id[strava_activity.gear_id]] if strava_activity.gear_id else []
+                for activity, strava_activity in zip(updated_activities, updated_strava_activities)
+            })
+            update_route_index(updated_activities)
+            update_search_index(activity.pk for activity in updated_activities)
+            for activity, previous_type in retyped_activities:
+                move_best_effort_records(activity, previous_type)
+    return updated_activities, activity_keys
+
+
+def sync_strava_activity(strava_id, strava_client, deleted=False):
+    """
+    Applies change of one Strava activity, the activity is fetched with one API call (gear unknown locally
+    costs one more). Deleted activity is removed only when Strava confirms it does not exist any more.
+    """
+    try:
+        strava_activity = strava_client.get_activity(strava_id)
+    except ObjectNotFound:
+        if not deleted:
+            raise
+        Activity.objects.filter(strava_id=strava_id).delete()
+        return
+    if deleted:
+        print(f'Activity {strava_id} still exists on Strava, it is updated instead of deleted.')
+
+    activity = get_object_or_none(Activity, strava_id=strava_id)
+    if not activity:
+        create_activity_from_strava(strava_activity)
+        create_and_add_gear_to_activity_if_needed(strava_activity, strava_client, GearCache())
+        return
+
+    for field, value in get_activity_data_from_strava(strava_activity).items():
+        setattr(activity, field, value)
+    activity.save()
+    # Strava gear of the activity is replaced, gear without Strava ID was added locally and is kept
+    gear = list(activity.gear.filter(strava_id=None))
+    if strava_activity.gear_id:
+        gear.append(GearCache().get(
+            strava_activity.gear_id, STRAVA_ACTIVITY_TYPE_TO_GEAR_TYPE.get(strava_activity.type, Gear.TYPE.OTHER),
+            strava_client
+        )[0])
+    activity.gear.set(gear)
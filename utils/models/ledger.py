@@ -0,0 +1,95 @@
+from datetime import timedelta
+
+from activities.models import Accessory, Activity, Gear
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+
+
+LEDGER_FIELDS = ('total_distance', 'total_moving_time', 'activity_count', 'first_used', 'last_used')
+
+
+def _get_empty_ledger_values():
+    return {
+        'total_distance': 0,
+        'total_moving_time': timedelta(),
+        'activity_count': 0,
+        'first_used': None,
+        'last_used': None,
+    }
+
+
+def _get_ledger_values(through_model, equipment_field, equipment_ids=None):
+    links = through_model.objects.all()
+    if equipment_ids is not None:
+        links = links.filter(**{f'{equipment_field}__in': equipment_ids})
+    rows = links.values(equipment_field).annotate(
+        total_distance=Sum('activity__distance'),
+        total_moving_time=Sum('activity__moving_time'),
+        activity_count=Count('activity'),
+        first_used=Min('activity__start'),
+        last_used=Max('activity__start'),
+    ).order_by()
+    ledger_values = {}
+    for row in rows:
+        equipment_id = row.pop(equipment_field)
+        ledger_values[equipment_id] = {
+            **row,
+            'total_distance': row['total_distance'] or 0,
+            'total_moving_time': row['total_moving_time'] or timedelta(),
+        }
+    return ledger_values
+
+
+def _update_ledgers(model, through_model, equipment_field, equipment_ids):
+    equipment_ids = set(equipment_ids)
+    if not equipment_ids:
+        return
+    with transaction.atomic():
+        # Rows are locked to serialize concurrent ledger updates on backends supporting it
+        list(model.objects.filter(pk__in=equipment_ids).select_for_update().values_list('pk', flat=True))
+        ledger_values = _get_ledger_values(through_model, equipment_field, equipment_ids)
+        for equipment_id in equipment_ids:
+            model.objects.filter(pk=equipment_id).update(
+                **ledger_values.get(equipment_id, _get_empty_ledger_values())
+            )
+
+
+def update_gear_ledgers(gear_ids):
+    _update_ledgers(Gear, Activity.gear.through, 'gear', gear_ids)
+
+
+def update_accessory_ledgers(accessory_ids):
+    _update_ledgers(Accessory, Accessory.activities.through, 'accessory', accessory_ids)
+
+
+def update_ledgers_for_activities(activity_ids):
+    update_gear_ledgers(
+        Activity.gear.through.objects.filter(activity__in=activity_ids).values_list('gear', flat=True)
+    )
+    update_accessory_ledgers(
+        Accessory.activities.through.objects.filter(activity__in=activity_ids).values_list('accessory', flat=True)
+    )
+
+
+def _reconcile_ledgers(model, through_model, equipment_field, fix):
+    ledger_values = _get_ledger_values(through_model, equipment_field)
+    drifted = []
+    for equipment in model.objects.all():
+        expected_values = ledger_values.get(equipment.pk, _get_empty_ledger_values())
+        if any(getattr(equipment, field) != expected_values[field] for field in LEDGER_FIELDS):
+            drifted.append(equipment)
+            if fix:
+                model.objects.filter(pk=equipment.pk).update(**expected_values)
+    return drifted
+
+
+def reconcile_ledgers(fix=True):
+    """
+    Compares stored ledgers with totals computed from the activities and fixes the drifted ones.
+    Returns list of the drifted gear and accessories.
+    """
+    with transaction.atomic():
+        return (
+            _reconcile_ledgers(Gear, Activity.gear.through, 'gear', fix) +
+            _reconcile_ledgers(Accessory, Accessory.activities.through, 'accessory', fix)
+        )
@@ -0,0 +1,110 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from activities.models import Activity, ActivityRollup
+from django.db import transaction
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth, TruncWeek, TruncYear
+from django.utils.timezone import localtime, make_aware
+
+
+PERIOD_TRUNC_FUNCTIONS = {
+    ActivityRollup.PERIOD.WEEK: TruncWeek,
+    ActivityRollup.PERIOD.MONTH: TruncMonth,
+    ActivityRollup.PERIOD.YEAR: TruncYear,
+}
+
+
+ROLLUP_AGGREGATES = {
+    'distance': Sum('distance'),
+    'moving_time': Sum('moving_time'),
+    'elevation_gain': Sum('elevation_gain'),
+    'count': Count('pk'),
+    'kudos': Sum('kudos'),
+}
+
+
+def get_period_start(period, day):
+    if period == ActivityRollup.PERIOD.WEEK:
+        return day - timedelta(days=day.weekday())
+    elif period == ActivityRollup.PERIOD.MONTH:
+        return day.replace(day=1)
+    else:
+        return day.replace(month=1, day=1)
+
+
+def get_period_end(period, period_start):
+    if period == ActivityRollup.PERIOD.WEEK:
+        return period_start + timedelta(days=7)
+    elif period == ActivityRollup.PERIOD.MONTH:
+        return (period_start + timedelta(days=32)).replace(day=1)
+    else:
+        return period_start.replace(year=period_start.year + 1)
+
+
+def _get_day_start(day):
+    return make_aware(datetime.combine(day, time.min))
+
+
+def _aggregate_rollups(period, activities):
+    # Default ordering by start would be added to GROUP BY
+    activities = activities.order_by().annotate(
+        period_start=PERIOD_TRUNC_FUNCTIONS[period]('start', output_field=DateField())
+    )
+    rows = list(activities.values('period_start', 'type').annotate(**ROLLUP_AGGREGATES))
+    rows += list(
+        activities.filter(gear__isnull=False).values('period_start', 'type', 'gear').annotate(**ROLLUP_AGGREGATES)
+    )
+    return [
+        ActivityRollup(
+            period=period,
+            period_start=row['period_start'],
+            type=row['type'],
+            gear_id=row.get('gear'),
+            distance=row['distance'] or 0,
+            moving_time=row['moving_time'],
+            elevation_gain=row['elevation_gain'] or 0,
+            count=row['count'],
+            kudos=row['kudos'] or 0,
+        )
+        for row in rows
+    ]
+
+
+def refresh_rollups(activity_keys):
+    """
+    Recomputes rollups of periods and types touched by activities given as iterable of (start, type) pairs.
+    Only the touched buckets are aggregated, every period costs a constant number of queries.
+    """
+    period_starts = defaultdict(set)
+    types = set()
+    for start, activity_type in activity_keys:
+        day = localtime(start).date()
+        types.add(activity_type)
+        for period in PERIOD_TRUNC_FUNCTIONS:
+            period_starts[period].add(get_period_start(period, day))
+    if not types:
+        return
+
+    with transaction.atomic():
+        for period, starts in period_starts.items():
+            ActivityRollup.objects.filter(period=period, period_start__in=starts, type__in=types).delete()
+            activities = Activity.objects.filter(
+                start__gte=_get_day_start(min(starts)),
+                start__lt=_get_day_start(get_period_end(period, max(starts))),
+                type__in=types,
+            )
+            ActivityRollup.objects.bulk_create(
+                rollup for rollup in _aggregate_rollups(period, activities) if rollup.period_start in starts
+            )
+
+
+def refresh_rollups_for_activities(activities):
+    refresh_rollups((activity.start, activity.type) for activity in activities)
+
+
+def rebuild_rollups():
+    with transaction.atomic():
+        ActivityRollup.objects.all().delete()
+        for period in PERIOD_TRUNC_FUNCTIONS:
+            ActivityRollup.objects.bulk_create(_aggregate_rollups(period, Activity.objects.all()))
@@ -0,0 +1,143 @@
+import math
+
+import numpy as np
+from activities.models import Activity, ActivityGeoCell
+from django.db import transaction
+from django.db.models import Count
+from utils.geo.geohash import get_cells_in_bbox, get_polyline_cells
+from utils.geo.polyline import (
+    EARTH_RADIUS, decode_polyline, densify, encode_polyline, get_distances_to_polyline, project, simplify_polyline
+)
+
+
+# Maximal deviation (m) of the stored route from the Strava summary polyline
+ROUTE_SIMPLIFY_TOLERANCE = 15
+COORDINATE_DECIMALS = 5
+
+DEFAULT_NEAR_RADIUS = 100
+
+# Routes match when the given share of each one lies within the tolerance (m) of the other one
+ROUTE_MATCH_TOLERANCE = 100
+ROUTE_MATCH_MIN_SIMILARITY = 0.9
+# Share of route cells a candidate must cross to be compared at all
+ROUTE_MATCH_MIN_SHARED_CELLS = 0.5
+
+REBUILD_BATCH_SIZE = 500
+
+
+def _get_point(latlng):
+    return (round(latlng[0], COORDINATE_DECIMALS), round(latlng[1], COORDINATE_DECIMALS)) if latlng else None
+
+
+def get_route_data_from_strava(activity):
+    """
+    Returns location fields of activity from Strava summary. Start and end fall back to the ends of the summary
+    polyline, the bounding box is computed from the whole polyline before it is simplified.
+    """
+    strava_map = getattr(activity, 'map', None)
+    summary_polyline = getattr(strava_map, 'summary_polyline', None)
+    points = decode_polyline(summary_polyline) if summary_polyline else []
+    start = _get_point(getattr(activity, 'start_latlng', None)) or _get_point(points[0] if points else None)
+    end = _get_point(getattr(activity, 'end_latlng', None)) or _get_point(points[-1] if points else None)
+    latitudes = [latitude for latitude, _ in points]
+    longitudes = [longitude for _, longitude in points]
+    return {
+        'start_latitude': start[0] if start else None,
+        'start_longitude': start[1] if start else None,
+        'end_latitude': end[0] if end else None,
+        'end_longitude': end[1] if end else None,
+        'min_latitude': min(latitudes) if points else None,
+        'min_longitude': min(longitudes) if points else None,
+        'max_latitude': max(latitudes) if points else None,
+        'max_longitude': max(longitudes) if points else None,
+        'route_polyline': encode_polyline(simplify_polyline(points, ROUTE_SIMPLIFY_TOLERANCE)) if points else None,
+    }
+
+
+def get_route_points(activity):
+    return decode_polyline(activity.route_polyline) if activity.route_polyline else []
+
+
+def build_route_cells(activity_pk, route_polyline):
+    if not route_polyline:
+        return []
+    return [
+        ActivityGeoCell(activity_id=activity_pk, cell=cell)
+        for cell in get_polyline_cells(decode_polyline(route_polyline))
+    ]
+
+
+def update_route_index(activities):
+    """
+    Replaces indexed cells of saved activities by cells crossed by their current routes.
+    """
+    activities = list(activities)
+    with transaction.atomic():
+        ActivityGeoCell.objects.filter(activity__in=[activity.pk for activity in activities]).delete()
+        ActivityGeoCell.objects.bulk_create([
+            cell for activity in activities for cell in build_route_cells(activity.pk, activity.route_polyline)
+        ])
+
+
+def rebuild_route_index():
+    with transaction.atomic():
+        ActivityGeoCell.objects.all().delete()
+        cells = []
+        activities = Activity.objects.exclude(route_polyline=None).values_list('pk', 'route_polyline').order_by()
+        for activity_pk, route_polyline in activities.iterator():
+            cells.extend(build_route_cells(activity_pk, route_polyline))
+            if len(cells) >= REBUILD_BATCH_SIZE:
+                ActivityGeoCell.objects.bulk_create(cells)
+                cells = []
+        ActivityGeoCell.objects.bulk_create(cells)
+
+
+def get_activities_near(latitude, longitude, radius=DEFAULT_NEAR_RADIUS):
+    """
+    Returns activities whose route passes within radius (m) of the point. Candidates are found in the cell
+    index, only their routes are decoded and measured.
+    """
+    latitude_delta = math.degrees(radius / EARTH_RADIUS)
+    longitude_delta = latitude_delta / max(math.cos(math.radians(latitude)), 1e-6)
+    cells = get_cells_in_bbox(
+        latitude - latitude_delta, longitude - longitude_delta, latitude + latitude_delta, longitude + longitude_delta
+    )
+    point_xy = project([(latitude, longitude)], latitude)
+    return [
+        activity for activity in Activity.objects.filter(geo_cells__cell__in=cells).distinct()
+        if get_distances_to_polyline(point_xy, project(get_route_points(activity), latitude)).min() <= radius
+    ]
+
+
+def get_route_similarity(points, other_points, tolerance=ROUTE_MATCH_TOLERANCE):
+    """
+    Returns the smaller of shares of both routes lying within tolerance (m) of the other route. Routes are
+    densified first, so that long straight segments of simplified routes have the weight of their length.
+    """
+    origin_latitude = points[0][0]
+    xy = project(points, origin_latitude)
+    other_xy = project(other_points, origin_latitude)
+    return float(min(
+        np.mean(get_distances_to_polyline(densify(xy, tolerance / 2), other_xy) <= tolerance),
+        np.mean(get_distances_to_polyline(densify(other_xy, tolerance / 2), xy) <= tolerance),
+    ))
+
+
+def get_matching_activities(activity, min_similarity=ROUTE_MATCH_MIN_SIMILARITY, tolerance=ROUTE_MATCH_TOLERANCE):
+    """
+    Returns list of (activity, similarity) of activities with the same route ordered from the most similar one.
+    Candidates crossing enough of the route cells are found with one index query and compared point by point.
+    """
+    cells = list(activity.geo_cells.values_list('cell', flat=True))
+    if not cells:
+        return []
+    points = get_route_points(activity)
+    candidates = Activity.objects.filter(geo_cells__cell__in=cells).exclude(pk=activity.pk).annotate(
+        shared_cells=Count('geo_cells')
+    ).filter(shared_cells__gte=math.ceil(len(cells) * ROUTE_MATCH_MIN_SHARED_CELLS))
+    matches = []
+    for candidate in candidates:
+        similarity = get_route_similarity(points, get_route_points(candidate), tolerance)
+        if similarity >= min_similarity:
+            matches.append((candidate, similarity))
+    return sorted(matches, key=lambda match: match[1], reverse=True)
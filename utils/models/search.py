@@ -0,0 +1,173 @@
+import re
+from collections import defaultdict
+
+from activities.models import Activity
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import ExtractYear
+
+
+SEARCH_TABLE = 'activities_search'
+INDEX_BATCH_SIZE = 500
+
+
+def get_search_tokens(query):
+    tokens = re.findall(r'\w+', query.lower())
+    if not tokens:
+        raise ValueError(f'Invalid search query "{query}".')
+    return tokens
+
+
+class SQLiteSearchBackend:
+    """
+    FTS5 table with activity ID as rowid. Matches are ranked by BM25 with name weighted above tags
+    and athletes.
+    """
+
+    rank_sql = (
+        f'SELECT -bm25({SEARCH_TABLE}, 10.0, 5.0, 2.0) FROM {SEARCH_TABLE} '
+        f'WHERE {SEARCH_TABLE} MATCH %s AND rowid = "activities_activity"."id"'
+    )
+    match_sql = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+
+    def get_query(self, tokens):
+        # Every token is quoted to escape FTS5 syntax and matched as a prefix
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def delete(self, cursor, activity_ids):
+        cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(pk,) for pk in activity_ids])
+
+    def upsert(self, cursor, documents):
+        self.delete(cursor, [document[0] for document in documents])
+        cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, name, tags, athletes) VALUES (%s, %s, %s, %s)',
+                           documents)
+
+    def clear(self, cursor):
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+
+class PostgreSQLSearchBackend:
+    """
+    Table of weighted tsvector documents with GIN index, matches are ranked by ts_rank.
+    """
+
+    rank_sql = (
+        f'SELECT ts_rank(document, to_tsquery(\'simple\', %s)) FROM {SEARCH_TABLE} '
+        f'WHERE activity_id = "activities_activity"."id"'
+    )
+    match_sql = f'SELECT activity_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery(\'simple\', %s)'
+
+    def get_query(self, tokens):
+        return ' & '.join(f'{token}:*' for token in tokens)
+
+    def delete(self, cursor, activity_ids):
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE activity_id = ANY(%s)', [list(activity_ids)])
+
+    def upsert(self, cursor, documents):
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (activity_id, document) VALUES (%s, '
+            f'setweight(to_tsvector(\'simple\', %s), \'A\') || setweight(to_tsvector(\'simple\', %s), \'B\') || '
+            f'setweight(to_tsvector(\'simple\', %s), \'C\')) '
+            f'ON CONFLICT (activity_id) DO UPDATE SET document = EXCLUDED.document',
+            documents
+        )
+
+    def clear(self, cursor):
+        cursor.execute(f'TRUNCATE {SEARCH_TABLE}')
+
+
+class MatchSubquery(RawSQL):
+    """
+    Raw subquery used as the right side of an in lookup, which adds the parentheses itself. Twice parenthesized
+    subquery is a scalar expression and matches just the first row.
+    """
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+SEARCH_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgreSQLSearchBackend,
+}
+
+
+def get_search_backend():
+    if connection.vendor not in SEARCH_BACKENDS:
+        raise ImproperlyConfigured(f'Activity search is not supported on {connection.vendor}.')
+    return SEARCH_BACKENDS[connection.vendor]()
+
+
+def _get_documents(activity_ids):
+    tags = defaultdict(list)
+    for activity_id, name in Activity.tags.through.objects.filter(
+            activity__in=activity_ids).values_list('activity', 'tag__name'):
+        tags[activity_id].append(name)
+    athletes = defaultdict(list)
+    for activity_id, name in Activity.athletes.through.objects.filter(
+            activity__in=activity_ids).values_list('activity', 'athlete__name'):
+        athletes[activity_id].append(name)
+    return [
+        (pk, name, ' '.join(tags[pk]), ' '.join(athletes[pk]))
+        for pk, name in Activity.objects.filter(pk__in=activity_ids).values_list('pk', 'name').order_by()
+    ]
+
+
+def update_search_index(activity_ids):
+    """
+    Indexes current name, tag names and athlete names of activities, deleted activities are removed.
+    """
+    activity_ids = list(set(activity_ids))
+    backend = get_search_backend()
+    with transaction.atomic(), connection.cursor() as cursor:
+        for i in range(0, len(activity_ids), INDEX_BATCH_SIZE):
+            batch = activity_ids[i:i + INDEX_BATCH_SIZE]
+            documents = _get_documents(batch)
+            backend.delete(cursor, set(batch) - {document[0] for document in documents})
+            backend.upsert(cursor, documents)
+
+
+def delete_from_search_index(activity_ids):
+    with connection.cursor() as cursor:
+        get_search_backend().delete(cursor, list(activity_ids))
+
+
+def rebuild_search_index():
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            get_search_backend().clear(cursor)
+        update_search_index(Activity.objects.values_list('pk', flat=True).order_by())
+
+
+def search_activities(query, activities=None):
+    """
+    Returns activities (optionally narrowed by given queryset) matching all words of query as prefixes of words
+    in name, tags or athletes, annotated with search_rank and ordered from the best match.
+    """
+    backend = get_search_backend()
+    search_query = backend.get_query(get_search_tokens(query))
+    activities = Activity.objects.all() if activities is None else activities
+    return activities.filter(
+        pk__in=MatchSubquery(backend.match_sql, [search_query])
+    ).annotate(
+        search_rank=RawSQL(backend.rank_sql, [search_query])
+    ).order_by('-search_rank', '-start')
+
+
+def get_search_facets(activities):
+    """
+    Returns counts of activities by type, year and gear.
+    """
+    activities = activities.order_by()
+    return {
+        'type': dict(activities.values_list('type').annotate(count=Count('pk'))),
+        'year': dict(activities.annotate(year=ExtractYear('start')).values_list('year').annotate(count=Count('pk'))),
+        'gear': {
+            (gear_pk, gear_name): count
+            for gear_pk, gear_name, count in activities.filter(gear__isnull=False).values_list(
+                'gear', 'gear__name'
+            ).annotate(count=Count('pk'))
+        },
+    }
@@ -0,0 +1,135 @@
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from activities.models import Activity, ActivityStream, TrainingLoad
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+from django.utils.timezone import localtime, make_aware
+from utils.streams.store import get_present_samples, load_streams
+
+
+FITNESS_DAYS = 42
+FATIGUE_DAYS = 7
+# Load of one minute of moderate activity, it is used when heart rate is not available
+DEFAULT_LOAD_PER_MINUTE = 1.2
+LOAD_PER_ELEVATION_METER = 0.05
+# Closed form of EWMA multiplies by powers of the decay, blocks keep them within float range
+EWMA_BLOCK_SIZE = 365
+
+
+def ewma(values, days, initial=0.0):
+    """
+    Vectorized y[t] = y[t - 1] + (x[t] - y[t - 1]) / days with y[-1] = initial. The recurrence is expanded to
+    y[t] = a^(t + 1) * (initial + (1 - a) * sum(x[j] / a^(j + 1))) with a = 1 - 1 / days.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    decay = 1 - 1 / days
+    result = np.empty_like(values)
+    for start in range(0, len(values), EWMA_BLOCK_SIZE):
+        block = values[start:start + EWMA_BLOCK_SIZE]
+        powers = decay ** np.arange(1, len(block) + 1)
+        result[start:start + len(block)] = powers * (initial + (1 - decay) * np.cumsum(block / powers))
+        initial = result[start + len(block) - 1]
+    return result
+
+
+def get_heart_rate_load(time_stream, heart_rate):
+    """
+    Banister TRIMP, minutes weighted by exponential function of the heart rate reserve. Minutes of samples
+    with missing (NaN) heart rate are not counted.
+    """
+    resting, maximal = settings.TRAINING_LOAD_RESTING_HEART_RATE, settings.TRAINING_LOAD_MAX_HEART_RATE
+    minutes = np.diff(np.asarray(time_stream, dtype=np.float64), prepend=time_stream[0]) / 60
+    reserve = np.clip((np.asarray(heart_rate, dtype=np.float64) - resting) / (maximal - resting), 0, 1)
+    return float(np.nansum(minutes * reserve * 0.64 * np.exp(1.92 * reserve)))
+
+
+def get_activity_load(activity, streams):
+    time_stream = streams.get(ActivityStream.TYPE.TIME)
+    heart_rate = streams.get(ActivityStream.TYPE.HEARTRATE)
+    if time_stream is not None and heart_rate is not None and len(time_stream) and \
+            len(time_stream) == len(heart_rate):
+        present = get_present_samples(heart_rate)
+        if present.any():
+            return get_heart_rate_load(time_stream, np.where(present, heart_rate, np.nan))
+
+    duration = activity.moving_time or activity.elapsed_time
+    return (
+        duration.total_seconds() / 60 * DEFAULT_LOAD_PER_MINUTE +
+        (activity.elevation_gain or 0) * LOAD_PER_ELEVATION_METER
+    )
+
+
+def _get_daily_loads(activities, since, days):
+    loads = {None: np.zeros(days)}
+    for activity in activities:
+        day = (localtime(activity.start).date() - since).days
+        streams = load_streams(
+            activity, (ActivityStream.TYPE.TIME, ActivityStream.TYPE.HEARTRATE)
+        ) if activity.has_streams else {}
+        load = get_activity_load(activity, streams)
+        loads.setdefault(activity.type, np.zeros(days))[day] += load
+        loads[None][day] += load
+    return loads
+
+
+def _get_initial_values(since):
+    return {
+        row.activity_type: (row.fitness, row.fatigue)
+        for row in TrainingLoad.objects.filter(date=since - timedelta(days=1))
+    }
+
+
+def recompute_training_load(since=None):
+    """
+    Recomputes daily training load from the since date to today, values before it are kept and used as the
+    initial state. Days between the last stored row and the since date are recomputed as well, so the state
+    decays over days without stored rows. Without since the whole history is recomputed.
+    """
+    activities = Activity.objects.order_by('start')
+    first_activity = activities.first()
+    if not first_activity:
+        TrainingLoad.objects.all().delete()
+        return
+    first_day = localtime(first_activity.start).date()
+    if since is None:
+        since = first_day
+    elif since > first_day:
+        last_stored_day = TrainingLoad.objects.filter(date__lt=since).aggregate(Max('date'))['date__max']
+        since = min(since, last_stored_day + timedelta(days=1)) if last_stored_day else first_day
+
+    activities = list(activities.filter(start__gte=make_aware(datetime.combine(since, time.min))).annotate(
+        has_streams=Exists(ActivityStream.objects.filter(activity=OuterRef('pk')))
+    ))
+    last_day = localtime(timezone.now()).date()
+    if activities:
+        last_day = max(last_day, localtime(activities[-1].start).date())
+    days = (last_day - since).days + 1
+    loads = _get_daily_loads(activities, since, days)
+    initial_values = _get_initial_values(since)
+    # Types with earlier load keep decaying even without new activities
+    for activity_type in initial_values:
+        loads.setdefault(activity_type, np.zeros(days))
+
+    dates = [since + timedelta(days=day) for day in range(days)]
+    rows = []
+    for activity_type, daily_loads in loads.items():
+        initial_fitness, initial_fatigue = initial_values.get(activity_type, (0.0, 0.0))
+        fitness = ewma(daily_loads, FITNESS_DAYS, initial_fitness)
+        fatigue = ewma(daily_loads, FATIGUE_DAYS, initial_fatigue)
+        rows.extend(
+            TrainingLoad(date=date, activity_type=activity_type, load=load, fitness=ctl, fatigue=atl, form=ctl - atl)
+            for date, load, ctl, atl in zip(dates, daily_loads.tolist(), fitness.tolist(), fatigue.tolist())
+        )
+
+    with transaction.atomic():
+        TrainingLoad.objects.filter(date__gte=since).delete()
+        TrainingLoad.objects.bulk_create(rows)
+
+
+def recompute_training_load_for_starts(starts):
+    starts = list(starts)
+    if starts:
+        recompute_training_load(localtime(min(starts)).date())
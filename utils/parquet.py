@@ -0,0 +1,187 @@
+import json
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from activities.models import Activity, Gear, SyncState, Tag
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+
+
+SYNC_STATE_NAME = 'export-parquet'
+MANIFEST_NAME = 'manifest.json'
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def _to_float(value):
+    return float(value) if value is not None else None
+
+
+def _to_seconds(value):
+    return value.total_seconds() if value is not None else None
+
+
+# Exported activity columns as (field, Arrow type, conversion), year and type are the partition keys
+ACTIVITY_COLUMNS = (
+    ('id', pa.int64(), None),
+    ('strava_id', pa.int64(), None),
+    ('name', pa.string(), None),
+    ('start', pa.timestamp('us', tz='UTC'), None),
+    ('distance', pa.float64(), _to_float),
+    ('average_speed', pa.float64(), _to_float),
+    ('moving_time', pa.float64(), _to_seconds),
+    ('elapsed_time', pa.float64(), _to_seconds),
+    ('elevation_gain', pa.int32(), None),
+    ('kudos', pa.int32(), None),
+    ('achievements', pa.int32(), None),
+    ('comments', pa.int32(), None),
+    ('race', pa.bool_(), None),
+    ('commute', pa.bool_(), None),
+    ('athlete_count', pa.int32(), None),
+    ('start_latitude', pa.float64(), None),
+    ('start_longitude', pa.float64(), None),
+    ('end_latitude', pa.float64(), None),
+    ('end_longitude', pa.float64(), None),
+)
+
+# Tables written whole on every export as (name, queryset factory, columns)
+TABLES = (
+    ('gear', lambda: Gear.objects.order_by('pk'), (
+        ('id', pa.int64(), None),
+        ('strava_id', pa.string(), None),
+        ('name', pa.string(), None),
+        ('type', pa.int16(), None),
+    )),
+    ('tags', lambda: Tag.objects.order_by('pk'), (
+        ('id', pa.int64(), None),
+        ('name', pa.string(), None),
+    )),
+    ('activity_gear', lambda: Activity.gear.through.objects.order_by('pk'), (
+        ('activity_id', pa.int64(), None),
+        ('gear_id', pa.int64(), None),
+    )),
+    ('activity_tags', lambda: Activity.tags.through.objects.order_by('pk'), (
+        ('activity_id', pa.int64(), None),
+        ('tag_id', pa.int64(), None),
+    )),
+)
+
+
+def get_partition_path(year, activity_type):
+    # Hive style directories are discovered as year and type columns by Arrow and pandas
+    return os.path.join('activities', f'year={year}', f'type={activity_type}')
+
+
+def write_parquet(path, queryset, columns, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Streams values of columns from queryset to Parquet file in chunks, every chunk is one row group. Values
+    are read with values_list so no model instances are built. The file is replaced atomically. Returns number
+    of written rows.
+    """
+    schema = pa.schema([pa.field(name, arrow_type) for name, arrow_type, _ in columns])
+    converters = [converter for _, _, converter in columns]
+    tmp_path = f'{path}.tmp'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rows_count = 0
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        rows = queryset.values_list(*(name for name, _, _ in columns)).iterator(chunk_size=chunk_size)
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                writer.write_table(_build_table(chunk, schema, converters))
+                rows_count += len(chunk)
+                chunk = []
+        if chunk or not rows_count:
+            writer.write_table(_build_table(chunk, schema, converters))
+            rows_count += len(chunk)
+    os.replace(tmp_path, path)
+    return rows_count
+
+
+def _build_table(rows, schema, converters):
+    columns = zip(*rows) if rows else ([] for _ in converters)
+    return pa.Table.from_arrays([
+        pa.array([converter(value) for value in column] if converter else list(column), type=field.type)
+        for column, converter, field in zip(columns, converters, schema)
+    ], schema=schema)
+
+
+def _read_manifest(directory):
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'partitions': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(f'{path}.tmp', path)
+
+
+def export_parquet(directory, full=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Exports activities to Parquet dataset partitioned by year and type together with gear, tags and their join
+    tables. Only partitions with activities changed since the watermark of the last export or with changed
+    number of activities (deleted activities) are rewritten, writes bypassing Model.save (bulk_update, update)
+    must therefore set changed_at themselves. Manifest with the watermark and row counts is written last.
+    Returns list of rewritten partitions.
+    """
+    sync_state, _ = SyncState.objects.get_or_create(name=SYNC_STATE_NAME)
+    manifest = {'partitions': {}} if full else _read_manifest(directory)
+    watermark = None if full else sync_state.cursor
+    # Activities changed during the export get newer changed_at and are exported again next time
+    exported_at = timezone.now()
+
+    activities = Activity.objects.annotate(year=ExtractYear('start')).order_by()
+    partition_counts = {
+        get_partition_path(year, activity_type): count
+        for year, activity_type, count in activities.values_list('year', 'type').annotate(count=Count('pk'))
+    }
+    changed_partitions = set()
+    if watermark:
+        changed_partitions.update(
+            get_partition_path(year, activity_type)
+            for year, activity_type in activities.filter(changed_at__gte=watermark).values_list(
+                'year', 'type'
+            ).distinct()
+        )
+    changed_partitions.update(
+        partition for partition in partition_counts.keys() | manifest['partitions'].keys()
+        if partition_counts.get(partition) != manifest['partitions'].get(partition)
+    )
+
+    if full and os.path.exists(os.path.join(directory, 'activities')):
+        shutil.rmtree(os.path.join(directory, 'activities'))
+    with transaction.atomic():
+        for partition in sorted(changed_partitions):
+            partition_directory = os.path.join(directory, partition)
+            if partition not in partition_counts:
+                # All activities of the partition were deleted
+                shutil.rmtree(partition_directory, ignore_errors=True)
+                continue
+            year, activity_type = (int(part.split('=')[1]) for part in partition.split(os.sep)[1:])
+            write_parquet(
+                os.path.join(partition_directory, 'part-0.parquet'),
+                activities.filter(year=year, type=activity_type).order_by('start', 'pk'),
+                ACTIVITY_COLUMNS,
+                chunk_size,
+            )
+        tables = {
+            name: write_parquet(os.path.join(directory, f'{name}.parquet'), get_queryset(), columns, chunk_size)
+            for name, get_queryset, columns in TABLES
+        }
+
+    _write_manifest(directory, {
+        'watermark': exported_at.isoformat(),
+        'partitions': partition_counts,
+        'tables': tables,
+    })
+    sync_state.complete(cursor=exported_at)
+    return sorted(changed_partitions)
@@ -1,9 +1,11 @@
-from strats.settings import STRAVA_ACCESS_TOKEN, STRAVA_REFRESH_TOKEN
-from stravalib.client import Client
+from django.conf import settings
 
 
-def create_strava_client():
-    client = Client()
-    client.access_token = STRAVA_ACCESS_TOKEN
-    client.refresh_token = STRAVA_REFRESH_TOKEN
+def create_strava_client(rate_limiter=None):
+    # stravalib and its dependencies are imported only by commands really calling Strava
+    from stravalib.client import Client
+
+    client = Client(rate_limiter=rate_limiter)
+    client.access_token = settings.STRAVA_ACCESS_TOKEN
+    client.refresh_token = settings.STRAVA_REFRESH_TOKEN
     return client
@@ -0,0 +1,132 @@
+import calendar
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from . import create_strava_client
+from .limiter import StravaRateLimiter
+
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 3
+# Maximal page size of Strava list endpoints
+DEFAULT_PAGE_SIZE = 200
+
+
+def is_rate_limit_error(error):
+    from stravalib.exc import RateLimitExceeded
+
+    if isinstance(error, RateLimitExceeded):
+        return True
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) == 429 or str(error).startswith('429')
+
+
+def get_activities_page(client, page, per_page, before=None, after=None):
+    """
+    Fetches one page of activity summaries with one request. Client.get_activities of stravalib fetches next
+    pages lazily when it is iterated, outside of any wrapper of the call.
+    """
+    from stravalib.model import Activity
+
+    params = {'page': page, 'per_page': per_page}
+    if before:
+        params['before'] = calendar.timegm(before.utctimetuple())
+    if after:
+        params['after'] = calendar.timegm(after.utctimetuple())
+    raw_activities = client.protocol.get('/athlete/activities', **params)
+    return [Activity.deserialize(raw, bind_client=client) for raw in raw_activities]
+
+
+class ConcurrentStravaClient:
+    """
+    Wrapper of stravalib client running requests on a bounded thread pool. All threads share one rate limiter
+    so the whole import stays within Strava rate limits. Attribute access is delegated to the stravalib client,
+    methods are called through the limiter and retried when Strava responds with 429. Responses of all threads
+    are recorded to optional utils.metrics.ImportMetrics.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, rate_limiter=None, max_retries=DEFAULT_MAX_RETRIES,
+                 client_factory=create_strava_client, metrics=None):
+        self.rate_limiter = rate_limiter or StravaRateLimiter()
+        self.metrics = metrics
+        if metrics:
+            metrics.rate_limiter = self.rate_limiter
+        self.max_retries = max_retries
+        self.client_factory = client_factory
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        return partial(self.call, name) if callable(attr) else attr
+
+    @property
+    def client(self):
+        # stravalib clients hold a requests session which is not safe to share between threads
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.client_factory(rate_limiter=self.rate_limiter)
+            if self.metrics:
+                client.protocol.rsession.hooks['response'].append(self.metrics.record_response)
+        return client
+
+    def call(self, method_name, *args, **kwargs):
+        return self._call(lambda client: getattr(client, method_name)(*args, **kwargs))
+
+    def _call(self, func):
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                return func(self.client)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                self.rate_limiter.exhaust()
+                attempt += 1
+
+    def get_activities(self, before=None, after=None, per_page=DEFAULT_PAGE_SIZE):
+        """
+        Iterates activities like Client.get_activities of stravalib, but every page is a separate call which
+        waits for the rate limiter and is retried when Strava responds with 429.
+        """
+        page = 1
+        while True:
+            strava_activities = self._call(partial(get_activities_page, page=page, per_page=per_page,
+                                                   before=before, after=after))
+            yield from strava_activities
+            if len(strava_activities) < per_page:
+                return
+            page += 1
+
+    def submit(self, method_name, *args, **kwargs):
+        return self._executor.submit(self.call, method_name, *args, **kwargs)
+
+    def map(self, method_name, *iterables):
+        futures = [self.submit(method_name, *args) for args in zip(*iterables)]
+        return [future.result() for future in futures]
+
+    def prefetch(self, iterable):
+        """
+        Iterates iterable in a worker thread one item ahead of the consumer, so that fetching of the next page
+        runs in parallel with processing of the current one.
+        """
+        iterator = iter(iterable)
+        sentinel = object()
+        future = self._executor.submit(next, iterator, sentinel)
+        while True:
+            item = future.result()
+            if item is sentinel:
+                return
+            future = self._executor.submit(next, iterator, sentinel)
+            yield item
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
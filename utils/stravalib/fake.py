@@ -0,0 +1,98 @@
+import random
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from django.utils.timezone import utc
+
+
+FAKE_ACTIVITY_TYPES = ('Run', 'Ride', 'Hike', 'NordicSki', 'Swim', 'Walk', 'Workout')
+FAKE_GEAR_ACTIVITY_TYPES = ('Run', 'Ride', 'Hike')
+
+# Average speed (m/s) of the generated activities by type
+FAKE_ACTIVITY_SPEEDS = {
+    'Run': 3.2,
+    'Ride': 7.5,
+    'Hike': 1.3,
+    'NordicSki': 4.0,
+    'Swim': 0.8,
+    'Walk': 1.4,
+    'Workout': 0.0,
+}
+
+
+class FakeQuantity:
+    """
+    Stand-in for units quantities of stravalib objects, the importer reads just the _num attribute.
+    """
+
+    def __init__(self, num):
+        self._num = num
+
+
+def generate_strava_activities(count, gear_count=10, seed=0, start=datetime(2010, 1, 1, tzinfo=utc)):
+    """
+    Returns count synthetic Strava activity summaries in the shape the importer expects, one activity every
+    eight hours from start. Runs, rides and hikes use one of gear_count gear. Output is stable for one seed.
+    """
+    rng = random.Random(seed)
+    activities = []
+    for i in range(count):
+        activity_type = rng.choice(FAKE_ACTIVITY_TYPES)
+        moving_time = timedelta(seconds=rng.randint(600, 4 * 60 * 60))
+        speed = FAKE_ACTIVITY_SPEEDS[activity_type] * rng.uniform(0.8, 1.2)
+        activities.append(SimpleNamespace(
+            id=i + 1,
+            name=f'{activity_type} {i + 1}',
+            distance=FakeQuantity(speed * moving_time.total_seconds()),
+            average_speed=FakeQuantity(speed),
+            start_date=start + timedelta(hours=8 * i),
+            moving_time=moving_time,
+            elapsed_time=moving_time + timedelta(seconds=rng.randint(0, 1800)),
+            total_elevation_gain=FakeQuantity(rng.randint(0, 1500)),
+            type=activity_type,
+            kudos_count=rng.randint(0, 30),
+            achievement_count=rng.randint(0, 10),
+            comment_count=rng.randint(0, 5),
+            commute=rng.random() < 0.1,
+            athlete_count=rng.randint(1, 5),
+            gear_id=f'g{rng.randint(1, gear_count)}' if activity_type in FAKE_GEAR_ACTIVITY_TYPES else None,
+            start_latlng=None,
+            end_latlng=None,
+            map=None,
+        ))
+    return activities
+
+
+class FakeStravaClient:
+    """
+    In-process replacement of ConcurrentStravaClient serving generated activities and gear without any requests.
+    Number of calls of every method is counted in calls.
+    """
+
+    def __init__(self, strava_activities=()):
+        self.strava_activities = {strava_activity.id: strava_activity for strava_activity in strava_activities}
+        self.calls = {}
+
+    def _count(self, method_name):
+        self.calls[method_name] = self.calls.get(method_name, 0) + 1
+
+    def get_activities(self, before=None, after=None):
+        self._count('get_activities')
+        strava_activities = sorted(self.strava_activities.values(), key=lambda activity: activity.start_date)
+        if after:
+            return [activity for activity in strava_activities if activity.start_date > after]
+        return [activity for activity in reversed(strava_activities) if not before or activity.start_date < before]
+
+    def get_activity(self, activity_id):
+        self._count('get_activity')
+        return self.strava_activities[activity_id]
+
+    def get_gear(self, gear_id):
+        self._count('get_gear')
+        return SimpleNamespace(id=gear_id, name=f'Gear {gear_id}')
+
+    def map(self, method_name, *iterables):
+        return [getattr(self, method_name)(*args) for args in zip(*iterables)]
+
+    def prefetch(self, iterable):
+        return iter(iterable)
@@ -0,0 +1,105 @@
+import threading
+import time
+
+
+SHORT_PERIOD = 15 * 60
+LONG_PERIOD = 24 * 60 * 60
+
+
+class RateLimitExhausted(Exception):
+
+    def __init__(self, retry_after):
+        super().__init__(f'Strava rate limit exhausted, next request possible in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+class RateLimitBudget:
+    """
+    Request budget of one Strava rate limit window. Strava resets the 15-minute limit at natural quarter hours
+    and the daily limit at midnight UTC.
+    """
+
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self.usage = 0
+        self.window = None
+
+    def get_reset_time(self, now):
+        return (now // self.period + 1) * self.period
+
+    def refresh(self, now):
+        window = now // self.period
+        if window != self.window:
+            self.window = window
+            self.usage = 0
+
+    def get_wait_time(self, now, headroom):
+        self.refresh(now)
+        if self.usage >= self.limit - headroom:
+            return self.get_reset_time(now) - now
+        return 0
+
+
+class StravaRateLimiter:
+    """
+    Thread safe rate limiter tracking 15-minute and daily usage reported by Strava in X-RateLimit-Limit and
+    X-RateLimit-Usage response headers. Callers are blocked before the budget is exhausted so that requests
+    do not fail with 429 responses. If the wait would be longer than max_wait (typically when the daily limit
+    is reached) RateLimitExhausted is raised instead.
+    """
+
+    def __init__(self, short_limit=600, long_limit=30000, headroom=5, max_wait=SHORT_PERIOD,
+                 clock=time.time, sleep=time.sleep):
+        self.short = RateLimitBudget(short_limit, SHORT_PERIOD)
+        self.long = RateLimitBudget(long_limit, LONG_PERIOD)
+        self.headroom = headroom
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+    def __call__(self, response_headers):
+        # Called by stravalib after every response
+        self.update(response_headers)
+
+    def update(self, response_headers):
+        limit = response_headers.get('X-RateLimit-Limit')
+        usage = response_headers.get('X-RateLimit-Usage')
+        with self.lock:
+            now = self.clock()
+            self.short.refresh(now)
+            self.long.refresh(now)
+            if limit:
+                self.short.limit, self.long.limit = (int(value) for value in limit.split(','))
+            if usage:
+                self.short.usage, self.long.usage = (int(value) for value in usage.split(','))
+
+    def exhaust(self):
+        with self.lock:
+            self.short.refresh(self.clock())
+            self.short.usage = self.short.limit
+
+    def get_wait_time(self):
+        now = self.clock()
+        return max(self.short.get_wait_time(now, self.headroom), self.long.get_wait_time(now, self.headroom))
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                wait_time = self.get_wait_time()
+                if not wait_time:
+                    self.short.usage += 1
+                    self.long.usage += 1
+                    return
+            if wait_time > self.max_wait:
+                raise RateLimitExhausted(wait_time)
+            self.sleep(wait_time)
+
+    @property
+    def headroom_remaining(self):
+        with self.lock:
+            now = self.clock()
+            self.short.refresh(now)
+            self.long.refresh(now)
+            return self.short.limit - self.short.usage, self.long.limit - self.long.usage
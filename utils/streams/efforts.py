@@ -0,0 +1,140 @@
+import numpy as np
+from activities.models import Activity, ActivityStream, BestEffort, BestEffortRecord
+from django.db import transaction
+
+from .store import get_present_samples, load_streams
+
+
+DISTANCE_WINDOWS = (400, 1000, 1609, 5000, 10000, 21097, 42195)
+POWER_WINDOWS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+WINDOWS = {
+    BestEffort.KIND.DISTANCE: DISTANCE_WINDOWS,
+    BestEffort.KIND.POWER: POWER_WINDOWS,
+}
+
+
+def compute_distance_efforts(time, distance, windows=DISTANCE_WINDOWS):
+    """
+    Returns dict window -> (fastest time, start time) for every distance window covered by the activity.
+    End of the shortest segment covering the window is found for all start samples at once with a binary search
+    over cumulative distance, which is a vectorized form of the two-pointer walk.
+    """
+    time = np.asarray(time, dtype=np.float64)
+    # GPS noise can make the cumulative distance decrease slightly, search needs it sorted
+    distance = np.maximum.accumulate(np.asarray(distance, dtype=np.float64))
+    efforts = {}
+    for window in windows:
+        ends = np.searchsorted(distance, distance + window, side='left')
+        # Ends are non-decreasing, so the valid starts form a prefix of the samples
+        valid_count = np.count_nonzero(ends < len(distance))
+        if not valid_count:
+            break
+        durations = time[ends[:valid_count]] - time[:valid_count]
+        best = int(np.argmin(durations))
+        efforts[window] = (float(durations[best]), int(time[best]))
+    return efforts
+
+
+def compute_power_efforts(time, watts, windows=POWER_WINDOWS):
+    """
+    Returns dict window -> (best average power, start time) for every duration window. Samples are resampled
+    to 1 s with pauses counted as zero power, averages of all windows are differences of one cumulative sum.
+    """
+    time = np.asarray(time, dtype=np.int64)
+    power = np.zeros(time[-1] - time[0] + 1)
+    power[time - time[0]] = watts
+    cumulative_power = np.concatenate(([0], np.cumsum(power)))
+    efforts = {}
+    for window in windows:
+        if window > len(power):
+            break
+        sums = cumulative_power[window:] - cumulative_power[:-window]
+        best = int(np.argmax(sums))
+        efforts[window] = (float(sums[best] / window), best + int(time[0]))
+    return efforts
+
+
+def _build_efforts(activity):
+    streams = load_streams(
+        activity, (ActivityStream.TYPE.TIME, ActivityStream.TYPE.DISTANCE, ActivityStream.TYPE.WATTS)
+    )
+    time = streams.get(ActivityStream.TYPE.TIME)
+    if time is None or not len(time):
+        return []
+
+    efforts_by_kind = {}
+    # Missing samples are left out, a power dropout therefore counts as zero power like a pause
+    for kind, stream_type, compute_efforts in (
+        (BestEffort.KIND.DISTANCE, ActivityStream.TYPE.DISTANCE, compute_distance_efforts),
+        (BestEffort.KIND.POWER, ActivityStream.TYPE.WATTS, compute_power_efforts),
+    ):
+        stream = streams.get(stream_type)
+        if stream is None or len(stream) != len(time):
+            continue
+        present = get_present_samples(stream)
+        if present.any():
+            efforts_by_kind[kind] = compute_efforts(time[present], stream[present])
+    return [
+        BestEffort(activity=activity, kind=kind, window=window, value=value, start_time=start_time)
+        for kind, efforts in efforts_by_kind.items()
+        for window, (value, start_time) in efforts.items()
+    ]
+
+
+def merge_best_effort_records(activity_type, efforts):
+    """
+    Merges efforts of new activities into all-time records, the work depends on the number of new efforts only.
+    """
+    records = {
+        (record.kind, record.window): record
+        for record in BestEffortRecord.objects.filter(activity_type=activity_type).select_related('effort')
+    }
+    for effort in efforts:
+        record = records.get((effort.kind, effort.window))
+        if record is None:
+            records[(effort.kind, effort.window)] = BestEffortRecord.objects.create(
+                activity_type=activity_type, kind=effort.kind, window=effort.window, effort=effort
+            )
+        elif effort.is_better_than(record.effort):
+            record.effort = effort
+            record.save()
+
+
+def refill_best_effort_records(activity_type):
+    """
+    Finds records missing after their efforts were deleted, each costs one indexed query.
+    """
+    existing_keys = set(BestEffortRecord.objects.filter(activity_type=activity_type).values_list('kind', 'window'))
+    for kind, windows in WINDOWS.items():
+        for window in windows:
+            if (kind, window) in existing_keys:
+                continue
+            effort = BestEffort.objects.filter(activity__type=activity_type, kind=kind, window=window).order_by(
+                'value' if kind == BestEffort.KIND.DISTANCE else '-value'
+            ).first()
+            if effort:
+                BestEffortRecord.objects.create(activity_type=activity_type, kind=kind, window=window, effort=effort)
+
+
+def compute_best_efforts(activity):
+    efforts = _build_efforts(activity)
+    with transaction.atomic():
+        had_records = BestEffortRecord.objects.filter(effort__activity=activity).exists()
+        activity.best_efforts.all().delete()
+        BestEffort.objects.bulk_create(efforts)
+        Activity.objects.filter(pk=activity.pk).update(best_efforts_computed=True)
+        if had_records:
+            refill_best_effort_records(activity.type)
+        merge_best_effort_records(activity.type, activity.best_efforts.all())
+    return efforts
+
+
+def move_best_effort_records(activity, previous_type):
+    """
+    Moves efforts of activity with changed type to records of the new type.
+    """
+    with transaction.atomic():
+        BestEffortRecord.objects.filter(effort__activity=activity).delete()
+        refill_best_effort_records(previous_type)
+        merge_best_effort_records(activity.type, activity.best_efforts.all())
@@ -0,0 +1,134 @@
+import os
+import shutil
+
+import numpy as np
+from activities.models import ActivityStream
+from django.conf import settings
+from django.db import transaction
+
+
+# Narrow types keep streams compact while they can still be memory mapped. Compressed formats (e.g. npz)
+# would have to be decompressed to memory on every read.
+STREAM_DTYPES = {
+    ActivityStream.TYPE.TIME: np.uint32,
+    ActivityStream.TYPE.DISTANCE: np.float32,
+    ActivityStream.TYPE.LATLNG: np.float32,
+    ActivityStream.TYPE.ALTITUDE: np.float32,
+    ActivityStream.TYPE.VELOCITY: np.float32,
+    ActivityStream.TYPE.HEARTRATE: np.uint8,
+    ActivityStream.TYPE.CADENCE: np.uint8,
+    ActivityStream.TYPE.WATTS: np.uint16,
+}
+
+
+STREAM_TYPE_TO_STRAVA_STREAM_TYPE = dict(ActivityStream.TYPE.choices)
+
+
+STRAVA_STREAM_TYPE_TO_STREAM_TYPE = {
+    strava_type: stream_type for stream_type, strava_type in STREAM_TYPE_TO_STRAVA_STREAM_TYPE.items()
+}
+
+
+def get_streams_directory(strava_id):
+    # Activities are spread to subdirectories to keep directories small
+    return os.path.join(settings.STREAMS_ROOT, str(strava_id % 1000), str(strava_id))
+
+
+def get_stream_path(strava_id, stream_type):
+    return os.path.join(get_streams_directory(strava_id), f'{STREAM_TYPE_TO_STRAVA_STREAM_TYPE[stream_type]}.npy')
+
+
+def _write_array(path, array):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array, allow_pickle=False)
+    os.replace(tmp_path, path)
+
+
+def get_missing_value(dtype):
+    # Zero is a valid sample (e.g. power while coasting), missing samples are stored as NaN in float streams and
+    # as the largest value of the type in integer streams, which no heart rate, cadence or power reaches
+    dtype = np.dtype(dtype)
+    return np.nan if dtype.kind == 'f' else np.iinfo(dtype).max
+
+
+def get_present_samples(stream):
+    """
+    Returns boolean mask of samples which are not missing.
+    """
+    if stream.dtype.kind == 'f':
+        present = ~np.isnan(stream)
+        return present.all(axis=1) if stream.ndim > 1 else present
+    return stream != get_missing_value(stream.dtype)
+
+
+def to_stream_array(stream_type, data):
+    # Missing samples (e.g. heart rate during a sensor dropout) are sent as None by Strava
+    missing_value = get_missing_value(STREAM_DTYPES[stream_type])
+    if stream_type == ActivityStream.TYPE.LATLNG:
+        missing_value = [missing_value, missing_value]
+    data = [missing_value if value is None else value for value in data]
+    array = np.asarray(data, dtype=STREAM_DTYPES[stream_type])
+    if stream_type == ActivityStream.TYPE.LATLNG:
+        array = array.reshape(-1, 2)
+    return array
+
+
+def save_streams(activity, streams):
+    """
+    Stores streams given as dict of stream type -> sequence of samples. Time stream is always stored, so an
+    activity without streams (e.g. manual one) is not requested from Strava again.
+    """
+    arrays = {
+        stream_type: to_stream_array(stream_type, data) for stream_type, data in streams.items()
+    }
+    arrays.setdefault(ActivityStream.TYPE.TIME, np.empty(0, dtype=STREAM_DTYPES[ActivityStream.TYPE.TIME]))
+    for stream_type, array in arrays.items():
+        _write_array(get_stream_path(activity.strava_id, stream_type), array)
+    with transaction.atomic():
+        ActivityStream.objects.filter(activity=activity).delete()
+        ActivityStream.objects.bulk_create(
+            ActivityStream(activity=activity, type=stream_type, dtype=array.dtype.str, length=len(array))
+            for stream_type, array in arrays.items()
+        )
+
+
+def save_strava_streams(activity, strava_streams):
+    save_streams(activity, {
+        STRAVA_STREAM_TYPE_TO_STREAM_TYPE[strava_type]: stream.data
+        for strava_type, stream in strava_streams.items() if strava_type in STRAVA_STREAM_TYPE_TO_STREAM_TYPE
+    })
+
+
+def load_stream(strava_id, stream_type):
+    """
+    Returns read-only memory mapped array, slicing it does not read or copy unused samples.
+    """
+    try:
+        return np.load(get_stream_path(strava_id, stream_type), mmap_mode='r', allow_pickle=False)
+    except FileNotFoundError:
+        return None
+
+
+def load_streams(activity, stream_types=None):
+    if stream_types is None:
+        stream_types = activity.streams.values_list('type', flat=True)
+    return {
+        stream_type: stream
+        for stream_type, stream in ((t, load_stream(activity.strava_id, t)) for t in stream_types)
+        if stream is not None
+    }
+
+
+def slice_streams_by_time(streams, start, end):
+    """
+    Returns views of streams limited to samples recorded between start and end seconds.
+    """
+    time = streams[ActivityStream.TYPE.TIME]
+    start_index, end_index = np.searchsorted(time, (start, end))
+    return {stream_type: stream[start_index:end_index] for stream_type, stream in streams.items()}
+
+
+def delete_stream_files(strava_id):
+    shutil.rmtree(get_streams_directory(strava_id), ignore_errors=True)